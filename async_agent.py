@@ -0,0 +1,1079 @@
+import asyncio
+import codecs
+import concurrent.futures
+import re
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+import config
+from snapshot_manager import SnapshotManager
+from docker_engine import SandboxBootstrap, DockerError
+from sandbox_kernel import KernelPool, KernelError, KernelTimeout, KernelCancelled
+from output_capture import OutputCapture
+from fence_parser import FenceParser
+from exec_scheduler import ExecutionScheduler
+from context_manager import ContextManager, FEEDBACK_PREFIX, estimate_tokens
+from system_message import Segment, SystemMessageBuilder, file_key
+from memory_index import MemoryRetriever
+from memory_store import MemoryStore
+from memory_distiller import MemoryDistiller
+from telemetry import Telemetry, StreamTimer
+from history import HistoryPolicy, OutputCoalescer, TextBuffer
+from tool_cache import ToolResultCache, CACHE_HIT_PREFIX
+from llm_cache import LLMCache, CachedAsyncOpenAI, CachedOpenAI
+from llm_transport import RetryPolicy, create_clients, describe_error, is_retryable, resume_messages
+from session_log import SessionLog
+from builtin_commands import BuiltinRegistry
+from tool_calls import TOOLS, BUILTIN_TOOLS, ToolCallAssembler, invalid_call_message
+
+# 容器内禁止的 rm 指令 (匹配小写化后的代码)：位于开头或空白、命令分隔符之后，多行代码块的任意一行同样拦截
+RM_COMMAND = re.compile(r'(?:^|[\s;&|(])rm\s')
+
+def sandbox_mounts(project_root):
+    """沙盒容器的挂载列表：仅同步技能库和输出目录"""
+    return [
+        (os.path.join(project_root, "skills"), "/app/skills"),
+        (config.ALICE_OUTPUT_DIR, "/app/alice_output"),
+    ]
+
+
+def session_todo_path(session_id):
+    """会话专属的任务清单 (服务与批量模式)，避免一个会话的 todo 覆盖其它会话的任务清单"""
+    return os.path.join(config.SESSION_TODO_DIR, f"{session_id}.md")
+
+
+class AgentResources:
+    """
+    宿主机侧可在多个会话间共享的资源：LLM 客户端、记忆存储与检索索引、技能快照、记忆提炼器
+    CLI 模式下由单个智能体独占；服务模式下由所有会话共用，避免重复加载记忆和重复启动提炼。
+    """
+    def __init__(self, model_name=None):
+        self.model_name = model_name or config.MODEL_NAME
+        self.timings = {}
+        # 带长连接池与超时设置的 LLM 客户端 (对话用异步客户端，记忆提炼用同步客户端)
+        self.client, sync_client = create_clients()
+        self.retry_policy = RetryPolicy.from_config()
+
+        # LLM 录制/回放缓存 (对话与记忆提炼共用)
+        self.llm_cache = None
+        if config.LLM_CACHE_MODE != "passthrough":
+            self.llm_cache = LLMCache(config.LLM_CACHE_DIR, config.LLM_CACHE_MODE,
+                                      config.LLM_CACHE_MAX_BYTES, config.LLM_CACHE_TIMING)
+            self.client = CachedAsyncOpenAI(self.client, self.llm_cache)
+            sync_client = CachedOpenAI(sync_client, self.llm_cache)
+
+        # 内存快照管理器
+        phase_start = time.perf_counter()
+        self.snapshot_mgr = SnapshotManager()
+        self.timings["snapshot"] = (time.perf_counter() - phase_start) * 1000
+
+        # 结构化记忆存储 (首次启动时自动从 Markdown 记忆文件迁移)
+        phase_start = time.perf_counter()
+        self.memory_store = MemoryStore(config.MEMORY_LOG_PATH, config.MEMORY_FILE_PATH, config.SHORT_TERM_MEMORY_FILE_PATH)
+        self.timings["memory"] = (time.perf_counter() - phase_start) * 1000
+
+        # 相关性记忆检索：按当前用户输入挑选要注入的记忆条目
+        self.memory_retriever = MemoryRetriever(
+            self.memory_store,
+            top_k=config.MEMORY_TOP_K,
+            byte_budget=config.MEMORY_BYTE_BUDGET,
+            recent_count=config.MEMORY_RECENT_ENTRIES
+        )
+
+        # 记忆滚动与提炼在后台线程中进行，使用同步客户端
+        self.distiller = MemoryDistiller(
+            self.memory_store,
+            sync_client,
+            self.model_name,
+            chunk_tokens=config.DISTILL_CHUNK_TOKENS,
+            concurrency=config.DISTILL_CONCURRENCY,
+            checkpoint_path=config.DISTILL_CHECKPOINT_PATH
+        )
+
+        # 工具轮之后系统消息的投机刷新 (SYSTEM_REFRESH_MODE=speculative) 在此线程池中进行
+        self.refresh_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="alice-refresh")
+
+        # 逐轮性能追踪 (所有会话写入同一个滚动文件，按会话 ID 区分)
+        self.telemetry = None
+        if config.TELEMETRY_ENABLED:
+            self.telemetry = Telemetry(config.TELEMETRY_TRACE_PATH, config.TELEMETRY_MAX_BYTES, config.TELEMETRY_BACKUPS)
+
+    async def close(self):
+        """等待进行中的系统消息刷新结束，渲染记忆视图并关闭记忆日志、追踪文件与 LLM 客户端"""
+        self.refresh_executor.shutdown(wait=True)
+        try:
+            self.memory_store.export()
+        except OSError as e:
+            print(f"导出记忆文件失败: {e}")
+        self.memory_store.close()
+        if self.telemetry is not None:
+            self.telemetry.close()
+        await self.client.close()
+
+
+class AsyncAliceAgent:
+    """
+    Alice 智能体的异步核心
+    LLM 流式请求基于 AsyncOpenAI，容器内执行基于 asyncio 子进程，代码块作为 Task 调度，
+    同一事件循环中可同时运行多个会话。内置指令 (toolkit / memory / todo / update_prompt 等)
+    在宿主机本地完成，语义与同步接口一致。
+    构造与所有协程方法都需在同一个事件循环中调用。
+
+    服务模式下由 server.py 传入共享的 resources、从容器池租用的 sandbox 以及会话专属的
+    容器工作目录 workdir；输出事件经由 on_event(event, payload) 回调交给调用方，未设置时打印到终端。
+    resume=True 时从 session_id 对应的会话日志恢复历史消息、轮次与累计用量。
+    todo_path 指定会话专属的任务清单；prompt_editable=False 时拒绝 update_prompt (人设文件为多个会话共用)。
+    """
+    def __init__(self, model_name=None, prompt_path=None, resources=None, sandbox=None, workdir="/app", session_id=None,
+                 resume=False, todo_path=None, prompt_editable=True):
+        self.model_name = model_name or config.MODEL_NAME
+        self.prompt_path = prompt_path or config.DEFAULT_PROMPT_PATH
+        self.prompt_editable = prompt_editable
+        self.memory_path = config.MEMORY_FILE_PATH
+        self.todo_path = todo_path or config.TODO_FILE_PATH
+        self.stm_path = config.SHORT_TERM_MEMORY_FILE_PATH
+        self.startup_timings = {}
+        init_start = time.perf_counter()
+        self.on_event = None
+        # 带随机后缀：同一秒内启动的两个 CLI 进程不会写入同一个会话日志
+        self.session_id = session_id or f"cli-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        self.turn_index = 0
+        self.messages = []
+        # 上下文预算管理：每次请求前估算 token 并按需分级压缩历史
+        self.context_mgr = ContextManager(
+            budget=config.CONTEXT_TOKEN_BUDGET,
+            keep_turns=config.CONTEXT_KEEP_TURNS,
+            feedback_chars=config.CONTEXT_FEEDBACK_CHARS
+        )
+
+        # 权限与路径安全
+        self.project_root = os.getcwd()
+
+        # 容器执行引擎配置 (常驻容器模式)
+        self.docker_image = config.SANDBOX_IMAGE
+        # Docker 环境在后台线程中引导，与记忆、快照的加载并行；仅在首次执行代码块时等待
+        self.sandbox = sandbox or SandboxBootstrap(
+            self.docker_image,
+            "alice-sandbox-instance",
+            # 仅同步技能库和输出目录，隔离记忆、人设及源代码
+            mounts=sandbox_mounts(self.project_root)
+        )
+        self.sandbox.start()
+        self.container_name = self.sandbox.container_name
+        self.workdir = workdir
+        self.sandbox_used = False # 是否执行过代码块 (容器池据此决定归还时是否需要重启容器)
+
+        # 记忆、快照与 LLM 客户端 (服务模式下为所有会话共享)
+        self._owns_resources = resources is None
+        self.resources = resources or AgentResources(self.model_name)
+        self.startup_timings.update(self.resources.timings)
+        self.client = self.resources.client
+        self.retry_policy = self.resources.retry_policy
+        self.snapshot_mgr = self.resources.snapshot_mgr
+        self.memory_store = self.resources.memory_store
+        self.memory_retriever = self.resources.memory_retriever
+        self.distiller = self.resources.distiller
+        self.telemetry = self.resources.telemetry
+
+        # 容器内常驻执行内核池 (槽位 0 为主会话，其余供并行代码块使用，均惰性启动)
+        self.kernels = None
+        if config.SANDBOX_KERNEL_ENABLED:
+            self.kernels = KernelPool(self.container_name, size=config.EXEC_PARALLEL_WORKERS + 1, workdir=self.workdir)
+        self.kernel_session = "main"
+        # 工具调用方式：fence 从回答的代码块中提取；native 注册为结构化 tools，代码块解析作为兜底
+        if config.TOOL_CALL_MODE not in ("fence", "native"):
+            raise ValueError(f"未知的工具调用方式: {config.TOOL_CALL_MODE}，可选值: fence, native")
+        self.tool_mode = config.TOOL_CALL_MODE
+        self.tools = TOOLS if prompt_editable else [tool for tool in TOOLS if tool["function"]["name"] != "update_prompt"]
+        # 工具轮之后的系统消息刷新：speculative 在代码块执行完毕时即于线程池中投机刷新；inline 同步刷新
+        if config.SYSTEM_REFRESH_MODE not in ("speculative", "inline"):
+            raise ValueError(f"未知的系统消息刷新方式: {config.SYSTEM_REFRESH_MODE}，可选值: speculative, inline")
+        self.refresh_mode = config.SYSTEM_REFRESH_MODE
+        # 代码块调度器：流式输出期间即开始执行，默认按文档顺序串行
+        self.scheduler = ExecutionScheduler(
+            self._run_block,
+            workers=config.EXEC_PARALLEL_WORKERS,
+            mode=config.EXEC_PARALLEL_MODE
+        )
+
+        # 协作式中断：interrupt() 置位后取消 LLM 流的接收并中断正在执行的代码块
+        self.cancel_event = threading.Event()
+        self.last_cancel_latency = None # 最近一次中断从发出到 chat 返回的耗时 (毫秒)
+        self._cancel_started = None
+        self._stream_task = None
+        self._active_processes = set() # 一次性 docker exec 模式下正在运行的进程
+        self._background = set()
+
+        # 沙盒只读命令的结果缓存 (按会话独立，键包含挂载目录的指纹)
+        self.tool_cache = None
+        if config.TOOL_CACHE_ENABLED:
+            self.tool_cache = ToolResultCache(["skills", config.ALICE_OUTPUT_DIR], config.TOOL_CACHE_MAX_ENTRIES)
+
+        # 历史保留策略：推理内容丢弃或归档，较早的工具反馈替换为摘要；终端输出按短间隔合并刷新
+        self.history = HistoryPolicy(
+            self.session_id,
+            reasoning_mode=config.REASONING_RETENTION,
+            reasoning_dir=config.REASONING_ARCHIVE_DIR,
+            keep_turns=config.HISTORY_FEEDBACK_KEEP_TURNS,
+            digest_chars=config.HISTORY_DIGEST_CHARS,
+            archive_dir=config.HISTORY_ARCHIVE_DIR,
+            container_root=(config.ALICE_OUTPUT_DIR, "/app/alice_output")
+        )
+        self._terminal = OutputCoalescer(config.TERMINAL_FLUSH_INTERVAL_MS / 1000)
+
+        # 累计用量：LLM 请求数、token 数 (服务端未返回 usage 时为估算值)、代码块数与执行耗时
+        self.usage = {"llm_requests": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                      "code_blocks": 0, "tool_time_ms": 0.0, "llm_retries": 0, "llm_resumes": 0}
+
+        # 按当前用户输入挑选要注入的记忆条目
+        self.current_query = ""
+        self.system_builder = self._create_system_builder()
+        # 宿主机内置指令的注册表 (预编译的分发正则)
+        self.builtins = self._create_builtins()
+
+        # 确保输出目录存在
+        os.makedirs(config.ALICE_OUTPUT_DIR, exist_ok=True)
+
+        # 启动时管理记忆（滚动与提炼在后台线程中进行，不阻塞首次输入；共享资源时由其创建者负责）
+        if self._owns_resources:
+            self.manage_memory()
+
+        # 会话日志：消息追加写入磁盘，resume 时从日志重建历史 (不重新请求、不重新执行)
+        self.session_log = None
+        if config.SESSION_LOG_ENABLED or resume:
+            self.session_log = SessionLog(config.SESSION_LOG_DIR, self.session_id, config.SESSION_FSYNC_INTERVAL)
+        if resume:
+            self._resume_session()
+
+        phase_start = time.perf_counter()
+        self._refresh_system_message()
+        self.startup_timings["system"] = (time.perf_counter() - phase_start) * 1000
+        self.startup_timings["total"] = (time.perf_counter() - init_start) * 1000
+
+    def _resume_session(self):
+        if not self.session_log.exists:
+            raise FileNotFoundError(f"未找到会话 {self.session_id} 的日志: {self.session_log.path}")
+        start = time.perf_counter()
+        messages, self.turn_index, usage = self.session_log.restore()
+        # 系统消息占位，随后由 _refresh_system_message 按当前文件重新生成
+        self.messages = [{"role": "system", "content": ""}] + messages
+        self.usage.update(usage)
+        if self.session_log.discarded:
+            # 写入快照，之后的恢复不再把未完成轮次的残留记录计入历史
+            self.session_log.checkpoint(self.messages)
+            print(f"[系统]: 已丢弃崩溃时未完成轮次的 {self.session_log.discarded} 条记录。")
+        self.startup_timings["resume"] = (time.perf_counter() - start) * 1000
+
+    def _append_message(self, message):
+        """追加一条消息并写入会话日志"""
+        self.messages.append(message)
+        if self.session_log is not None:
+            self.session_log.append(message)
+
+    def _replace_messages(self, messages):
+        """压缩或归档替换了历史消息时，在会话日志中写入完整快照"""
+        if messages is not self.messages and self.session_log is not None:
+            self.session_log.checkpoint(messages)
+        self.messages = messages
+
+    def startup_report(self):
+        """启动各阶段耗时 (毫秒)；Docker 引导仍在后台进行时标注为进行中"""
+        parts = [f"{name} {self.startup_timings[name]:.0f}ms" for name in ("memory", "snapshot", "resume", "system", "total")
+                 if name in self.startup_timings]
+        if self.sandbox.ready:
+            docker = ", ".join(f"{name} {ms:.0f}ms" for name, ms in self.sandbox.timings.items())
+            parts.append(f"docker[{self.sandbox.engine_mode}]: {docker}")
+        elif self.sandbox.error is not None:
+            parts.append(f"docker: 不可用 ({self.sandbox.error})")
+        else:
+            parts.append("docker: 后台引导中")
+        return "启动耗时 " + " | ".join(parts)
+
+    def _create_system_builder(self):
+        """系统消息片段：稳定片段在前，易变片段在后，均按文件 mtime/size 变化惰性重载"""
+        retrieval = config.MEMORY_INJECTION_MODE == "retrieval"
+        loaded_files = [self.prompt_path, self.todo_path] if retrieval else [
+            self.prompt_path,
+            self.memory_path,
+            self.stm_path,
+            self.todo_path
+        ]
+        files_list_str = "\n".join([f"- {f}" for f in loaded_files])
+        header = f"【核心提示】：以下文件已全量加载到你的上下文中，你可以直接引用其内容：\n{files_list_str}"
+        if retrieval:
+            header += (
+                f"\n\n长期记忆 ({self.memory_path}) 与短期记忆 ({self.stm_path}) 仅注入了与当前对话最相关的条目。"
+                f"如需查找其它记忆，请使用内置指令 `memory search \"关键词\"`。"
+            )
+
+        # 环境上下文提示
+        env_context = (
+            f"### 当前运行环境信息\n"
+            f"- **宿主机工作目录**: `{self.project_root}`\n"
+            f"- **容器工作目录**: `{self.workdir}` (所有 bash/python 代码均在此执行)\n"
+            f"- **挂载映射**: `skills/` -> `/app/skills`, `alice_output/` -> `/app/alice_output`\n"
+        )
+        if self.tool_mode == "native":
+            tool_names = " / ".join(tool["function"]["name"] for tool in self.tools)
+            env_context += (
+                f"- **工具调用**: 已启用结构化工具 ({tool_names})，"
+                "请直接调用工具执行操作，无需在回答中书写代码块；同一步中互不依赖的调用可以一次发出多个。\n"
+            )
+        if self.workdir == "/app":
+            env_context += "- **重要规则**: 请始终使用相对路径 (如 `skills/xxx`)，这在宿主机和容器中均通用。\n"
+        else:
+            env_context += (
+                "- **重要规则**: 当前工作目录为本会话专属，产出文件请直接保存在其中；"
+                "引用技能脚本时请使用绝对路径 (如 `/app/skills/xxx`)。\n"
+            )
+
+        segments = [
+            Segment("header", lambda: header),
+            Segment("env", lambda: env_context),
+            Segment("prompt", self._load_prompt, file_key(self.prompt_path)),
+            Segment("snapshot", lambda: f"### 核心资产索引快照\n{self.snapshot_mgr.get_index_text()}",
+                    self._snapshot_key, volatile=True),
+            Segment("todo", lambda: f"### 你的当前任务清单 (来自 {self.todo_path})\n"
+                    f"{self._load_file_content(self.todo_path, '暂无活跃任务。')}",
+                    file_key(self.todo_path), volatile=True),
+        ]
+        if retrieval:
+            segments.append(Segment(
+                "memory", lambda: f"### 与当前对话相关的记忆\n{self.memory_retriever.render(self.current_query)}",
+                lambda: (self.memory_retriever.sync(), self.current_query), volatile=True
+            ))
+        else:
+            segments += [
+                Segment("ltm", lambda: f"### 你的长期记忆 (来自 {self.memory_path})\n{self._render_memory('ltm')}",
+                        lambda: self.memory_store.versions["ltm"]),
+                Segment("stm", lambda: f"### 你的短期记忆 (最近 7 天，来自 {self.stm_path})\n{self._render_memory('stm')}",
+                        lambda: self.memory_store.versions["stm"], volatile=True),
+            ]
+        return SystemMessageBuilder(segments)
+
+    def _create_builtins(self):
+        """在宿主机本体执行的内置指令；bash 代码块先按注册表匹配，未命中才进入容器"""
+        registry = BuiltinRegistry()
+        registry.register("toolkit", self.handle_toolkit)
+        registry.register("stats", self.handle_stats)
+        registry.register("sandbox reset", self.reset_sandbox, mode="none")
+        registry.register("update_prompt", self.handle_update_prompt, mode="text",
+                          usage="错误: update_prompt 需要提供新的提示词内容。")
+        registry.register("todo", self.handle_todo, mode="text", usage="错误: todo 指令需要提供任务清单内容。")
+        registry.register("memory search", self.handle_memory_search, mode="text",
+                          usage="错误: memory search 需要提供检索关键词。")
+        registry.register("memory", lambda content, flags: self.handle_memory(content, "ltm" if "--ltm" in flags else "stm"),
+                          mode="text", flags=("--ltm",), usage="错误: memory 指令需要提供记忆内容。")
+        return registry
+
+    def _render_memory(self, kind):
+        """渲染记忆的 Markdown 视图，并顺带把变化同步到 memory/*.md"""
+        try:
+            self.memory_store.export(kind)
+        except OSError as e:
+            print(f"导出记忆文件失败: {e}")
+        return self.memory_store.render_markdown(kind)
+
+    def _snapshot_key(self):
+        self.snapshot_mgr.refresh() # 监视路径未变化时内部直接跳过
+        return self.snapshot_mgr.version
+
+    def _refresh_system_message(self, round_index=0):
+        """
+        刷新系统消息，注入最新的提示词、长期记忆、短期记忆、任务清单和文件索引快照（仅重载有变化的片段）
+        round_index 为刚结束的工具轮序号，0 表示每轮对话开始时的刷新
+        """
+        start = time.perf_counter()
+        full_system_content, rebuilt = self.system_builder.build()
+        ms = round((time.perf_counter() - start) * 1000, 2)
+        # 同步刷新的耗时全部位于关键路径上
+        self._trace("refresh", round=round_index, ms=ms, rebuilt=rebuilt, speculative=False, critical_ms=ms)
+        self._set_system_message(full_system_content)
+
+    def _prefetch_system_message(self, turn):
+        """
+        投机刷新：每当本轮已提交的代码块全部执行完毕 (文件改动均已落地)，立即在线程池中刷新系统消息，
+        与模型继续生成回答、组装执行反馈并行；之后又有代码块执行完毕时重新提交，以最后一次为准。
+        监视路径均未变化时各片段只比对 stat 指纹即跳过重载。
+        """
+        pending = turn["pending"]
+        if any(not task.done() for _, task in pending):
+            return
+        turn["prefetch"] = (self.resources.refresh_executor.submit(self._build_system_message), len(pending))
+
+    def _build_system_message(self):
+        """在线程池中执行：返回 (系统消息, 是否重新拼装, 耗时 ms)"""
+        start = time.perf_counter()
+        content, rebuilt = self.system_builder.build()
+        return content, rebuilt, (time.perf_counter() - start) * 1000
+
+    def _install_prefetched(self, turn, round_index):
+        """取回投机刷新的结果并替换系统消息；关键路径上只计入组装完反馈后仍需等待的时间"""
+        prefetch = turn["prefetch"]
+        if prefetch is None or prefetch[1] != len(turn["pending"]):
+            # 没有覆盖全部代码块的投机刷新 (不应发生)，退回同步刷新
+            self._refresh_system_message(round_index)
+            return
+        start = time.perf_counter()
+        # 通常在模型生成期间就已完成；否则在此等待其余部分，阻塞时间不超过同步刷新
+        content, rebuilt, ms = prefetch[0].result()
+        self._trace("refresh", round=round_index, ms=round(ms, 2), rebuilt=rebuilt, speculative=True,
+                    critical_ms=round((time.perf_counter() - start) * 1000, 2))
+        self._set_system_message(content)
+
+    def _set_system_message(self, full_system_content):
+        if self.messages:
+            self.messages[0] = {"role": "system", "content": full_system_content}
+        else:
+            self.messages = [{"role": "system", "content": full_system_content}]
+
+    def _load_prompt(self):
+        try:
+            if os.path.exists(self.prompt_path):
+                with open(self.prompt_path, 'r', encoding='utf-8') as f:
+                    return f.read()
+            return "你是一个 AI 助手。"
+        except Exception as e:
+            print(f"加载提示词失败: {e}")
+            return "你是一个 AI 助手。"
+
+    def manage_memory(self, wait=False):
+        """管理短期记忆滚动和长期记忆提炼（默认在后台线程中进行）"""
+        if wait:
+            self.distiller.run()
+            if self.distiller.label:
+                print(f"[系统]: {self.distiller.label}")
+        elif self.distiller.start():
+            print(f"[系统]: 发现过期短期记忆 ({self.distiller.detail})，已在后台启动提炼流程...")
+
+    def _load_file_content(self, path, default_msg):
+        try:
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    content = f.read()
+                    return content if content.strip() else default_msg
+            return default_msg
+        except Exception as e:
+            print(f"加载文件 {path} 失败: {e}")
+            return default_msg
+
+    def handle_update_prompt(self, content):
+        """处理内置 update_prompt 指令，在宿主机更新人设文件"""
+        if not self.prompt_editable:
+            return "错误: 当前为服务模式，人设文件由所有会话共用，不允许通过 update_prompt 修改。"
+        try:
+            with open(self.prompt_path, "w", encoding="utf-8") as f:
+                f.write(content.strip())
+            return "已成功更新宿主机人设文件 (prompts/alice.md)。新指令将在下一轮对话生效。"
+        except Exception as e:
+            return f"更新人设文件失败: {str(e)}"
+
+    def handle_toolkit(self, args):
+        """处理内置 toolkit 指令（基于注册机制）"""
+        if not args or args[0] == "list":
+            skills = self.snapshot_mgr.skills
+            if not skills:
+                return "当前未注册任何技能。请确保 `skills/` 目录下有正确的 `SKILL.md` 文件。"
+
+            skill_list = []
+            for name, data in sorted(skills.items()):
+                skill_list.append(f"- **{name}**: {data['description']}")
+            return "### 可用技能列表 (内存注册表)\n" + "\n".join(skill_list)
+
+        elif args[0] == "info" and len(args) > 1:
+            skill_name = args[1]
+            skill = self.snapshot_mgr.skills.get(skill_name)
+            if not skill:
+                return f"技能 '{skill_name}' 未在注册表中。请尝试执行 `toolkit refresh`。"
+
+            yaml_content = skill.get("yaml", "").strip()
+            if yaml_content:
+                return f"### 技能 '{skill_name}' 配置信息 (内存注册表)\n```yaml\n---\n{yaml_content}\n---\n```\n*(提示: 如需完整用法，请直接查看 {skill['path']})*"
+            return f"技能 '{skill_name}' 注册信息不完整，缺少元数据。"
+
+        elif args[0] == "refresh":
+            self.snapshot_mgr.refresh(force=True)
+            count = len(self.snapshot_mgr.skills)
+            return f"技能注册表已刷新，共发现并注册 {count} 个技能。"
+
+        return "未知 toolkit 指令。用法: `toolkit list`, `toolkit info <skill_name>`, `toolkit refresh`"
+
+    def handle_todo(self, content):
+        """处理内置 todo 指令，在宿主机更新任务清单文件"""
+        try:
+            os.makedirs(os.path.dirname(self.todo_path) or ".", exist_ok=True)
+            with open(self.todo_path, "w", encoding="utf-8") as f:
+                f.write(content.strip())
+            return f"已成功更新宿主机任务清单 ({self.todo_path})。"
+        except Exception as e:
+            return f"更新任务清单失败: {str(e)}"
+
+    def handle_memory(self, content, target="stm"):
+        """处理内置 memory 指令，写入宿主机记忆日志 (memory/*.md 视图按需渲染)"""
+        now = datetime.now()
+        date_str = now.strftime("%Y-%m-%d")
+        time_str = now.strftime("%H:%M")
+
+        # 清洗内容，避免重复的日期前缀
+        clean_content = content.strip()
+        # 匹配 [2025-12-29] 或 2025-12-29 这种格式
+        if re.match(r'^\[?\d{4}-\d{2}-\d{2}\]?', clean_content):
+            entry_prefix = ""
+        else:
+            entry_prefix = f"[{date_str}] "
+
+        try:
+            if target == "stm":
+                entry = f"[{time_str}] {clean_content}"
+                self.memory_store.add_stm(entry, date_str)
+                self.memory_retriever.append("stm", date_str, entry)
+                return f"已成功更新短期记忆。"
+            else:
+                # LTM 经验教训追加逻辑
+                entry = f"{entry_prefix}{clean_content}"
+                self.memory_store.add_ltm(entry, date_str)
+                self.memory_retriever.append("ltm", date_str, entry)
+                return f"已成功更新长期记忆经验教训。"
+        except Exception as e:
+            return f"更新记忆失败: {str(e)}"
+
+    def handle_memory_search(self, query):
+        """处理内置 memory search 指令：在本地检索索引中查找相关记忆"""
+        if not query:
+            return "错误: memory search 需要提供检索关键词。"
+        self.memory_retriever.sync()
+        hits = self.memory_retriever.index.search(query, k=20)
+        if not hits:
+            return f"未找到与 '{query}' 相关的记忆。"
+        lines = []
+        for _, entry in hits:
+            source = "LTM" if entry.source == "ltm" else "STM"
+            lines.append(f"- [{source}] {entry.date + ' ' if entry.date and entry.source == 'stm' else ''}{entry.text}")
+        return f"### 与 '{query}' 相关的记忆 (共 {len(hits)} 条)\n" + "\n".join(lines)
+
+    async def close(self):
+        """退出前收尾：释放执行内核；独占共享资源时一并渲染记忆视图并关闭客户端"""
+        self.scheduler.shutdown()
+        self._terminal.flush()
+        self.history.close()
+        if self.session_log is not None:
+            self.session_log.close()
+        if self.kernels is not None:
+            await self.kernels.close()
+        if self._owns_resources:
+            await self.resources.close()
+
+    def _trace(self, span, **fields):
+        """写入一条性能追踪 span (未启用追踪时忽略)"""
+        if self.telemetry is not None:
+            self.telemetry.record(span, session=self.session_id, turn=self.turn_index, **fields)
+
+    def handle_stats(self, args):
+        """处理内置 stats 指令：汇总性能追踪记录的 p50/p95"""
+        if self.telemetry is None:
+            return "性能追踪未启用 (TELEMETRY_ENABLED=false)。"
+        if args and args[0] == "session":
+            summary = self.telemetry.summarize(session=self.session_id)
+        else:
+            summary = self.telemetry.summarize()
+        cache = self.resources.llm_cache
+        if cache is not None:
+            stats = cache.snapshot()
+            summary += (f"\n\nLLM 缓存 ({stats['mode']}): 命中 {stats['hits']} 次，未命中 {stats['misses']} 次，"
+                        f"共 {stats['entries']} 条记录 ({stats['bytes'] / 1048576:.1f} MB)")
+        if self.tool_cache is not None:
+            stats = self.tool_cache.stats
+            summary += f"\n\n只读命令结果缓存 (本会话): 命中 {stats['hits']} 次，未命中 {stats['misses']} 次，失效 {stats['invalidations']} 次"
+        return summary
+
+    def _emit(self, event, text="", **extra):
+        """输出事件：设置了 on_event 时交给回调 (服务模式)，否则打印到终端"""
+        if self.on_event is not None:
+            self.on_event(event, dict(extra, text=text))
+        else:
+            self._print_event(event, text)
+
+    def _print_event(self, event, text):
+        if event in ("thinking", "content", "output", "tool_args"):
+            self._terminal.write(text)
+            return
+        self._terminal.flush()
+        if event == "turn":
+            print(f"\n{'='*20} Alice 正在思考 ({text}) {'='*20}")
+        elif event == "answer":
+            print('\n\n' + "="*20 + " Alice 的回答 " + "="*20 + '\n')
+        elif event == "tool_call":
+            print(f"\n[Alice 调用工具 {text}]: ", end="", flush=True)
+        elif event == "exec":
+            print(f"\n[Alice 正在执行 (Docker 常驻容器)]: {text[:100]}{'...' if len(text) > 100 else ''}")
+        elif event == "continue":
+            print(f"\n{'-'*40}\n{text}")
+        elif event == "system":
+            print(f"\n[系统]: {text}")
+
+    @property
+    def interrupted(self):
+        return self.cancel_event.is_set()
+
+    def _spawn(self, coro):
+        """在后台运行协程，并保持引用直到完成"""
+        task = asyncio.ensure_future(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    def interrupt(self):
+        """
+        中断当前轮次 (需在事件循环线程中调用)：取消 LLM 流的接收，向容器内正在执行的
+        代码块发送中断，尚未开始的代码块不再执行；chat 随后记录已生成的部分回答并返回。
+        """
+        if self.cancel_event.is_set():
+            return
+        self._cancel_started = time.perf_counter()
+        self.cancel_event.set()
+        if self._stream_task is not None:
+            self._stream_task.cancel()
+        if self.kernels is not None:
+            self._spawn(self.kernels.interrupt())
+        for process in list(self._active_processes):
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+
+    def is_safe_command(self, command):
+        """安全审查：仅拦截危险的 rm 指令"""
+        lowered = command.lower()
+        if "rm" in lowered and RM_COMMAND.search(lowered):
+            return False, "为了系统安全，禁止在容器内使用 rm 指令。如需删除文件，请通过其他方式操作。"
+        return True, ""
+
+    async def _run_block(self, block, slot=0):
+        """调度器回调：在指定内核槽位上执行一个代码块"""
+        if self.cancel_event.is_set():
+            return "[已被用户中断，未执行]"
+        start = time.perf_counter()
+        result = ""
+        try:
+            if block.call_id is not None and (block.arguments is None or block.lang in BUILTIN_TOOLS):
+                result = self._run_tool_call(block)
+            else:
+                result = await self.execute_command(block.code, is_python_code=(block.lang == "python"), slot=slot)
+            return result
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.usage["code_blocks"] += 1
+            self.usage["tool_time_ms"] += elapsed
+            self._trace("exec", lang=block.lang, slot=slot, ms=round(elapsed, 1),
+                        output_bytes=len(result.encode("utf-8")), cached=result.startswith(CACHE_HIT_PREFIX))
+
+    def _run_tool_call(self, block):
+        """结构化调用的内置工具：参数已是 JSON 对象，直接交给对应的处理函数"""
+        if block.arguments is None:
+            return invalid_call_message(block)
+        args = block.arguments
+        if block.lang == "toolkit":
+            return self.handle_toolkit([args["action"]] + ([args["skill"]] if args.get("skill") else []))
+        if block.lang == "memory":
+            if args["action"] == "search":
+                return self.handle_memory_search(args["content"].strip())
+            if args["action"] == "add":
+                return self.handle_memory(args["content"], target="ltm" if args.get("ltm") else "stm")
+            return invalid_call_message(block)
+        if block.lang == "todo":
+            return self.handle_todo(args["content"])
+        return self.handle_update_prompt(args["content"])
+
+    async def execute_command(self, command, is_python_code=False, slot=0):
+        # 0. 安全审查 (容器指令审查)
+        is_safe, warning = self.is_safe_command(command)
+        if not is_safe:
+            return warning
+
+        # 1. 拦截内置指令 (在宿主机本体执行)
+        if not is_python_code:
+            result = await self.builtins.dispatch(command)
+            if result is not None:
+                return result
+
+        self._emit("exec", command)
+
+        # 2. 只读命令的结果缓存：命中则不再进入容器；可能修改容器状态的代码块使缓存失效
+        cache_key = None
+        if self.tool_cache is not None:
+            cache_key = None if is_python_code else self.tool_cache.key(command, self.workdir)
+            if cache_key is None:
+                self.tool_cache.clear()
+            else:
+                cached = self.tool_cache.get(cache_key)
+                if cached is not None:
+                    if config.EXEC_LIVE_OUTPUT:
+                        self._emit("output", cached, stream="stdout")
+                    return cached
+
+        # 首个需要沙盒的代码块才等待后台的 Docker 引导完成
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self.sandbox.wait)
+        except DockerError as e:
+            return f"错误: 沙盒环境不可用，无法执行代码。{e}"
+        self.sandbox_used = True
+
+        # 3. 输出流式经过有界缓冲：终端实时显示，超长部分另存文件，只有首尾进入消息历史
+        capture = self._create_capture()
+        result = await self._execute_in_sandbox(command, is_python_code, slot, capture)
+        if self.tool_cache is not None:
+            if cache_key is None:
+                self.tool_cache.clear() # 执行期间并行的只读命令可能缓存了修改前的结果
+            elif capture.returncode == 0:
+                self.tool_cache.put(cache_key, result)
+        return result
+
+    async def _execute_in_sandbox(self, command, is_python_code, slot, capture):
+        """优先交给常驻内核执行，内核不可用时回退为一次性 docker exec"""
+        kernel = await self._ensure_kernel(slot)
+        if kernel is not None:
+            try:
+                result = await kernel.execute(
+                    command,
+                    lang="python" if is_python_code else "bash",
+                    session=self.kernel_session,
+                    timeout=config.EXECUTION_TIMEOUT,
+                    on_output=capture.write
+                )
+                return self._format_exec_result(capture, result["returncode"])
+            except KernelCancelled:
+                return self._format_exec_result(capture, 130)
+            except KernelTimeout:
+                return self._format_exec_result(capture, None)
+            except KernelError as e:
+                return f"执行过程中出错: {str(e)}"
+
+        return await self._execute_via_docker_exec(command, is_python_code, capture)
+
+    def _create_capture(self):
+        live = None
+        if config.EXEC_LIVE_OUTPUT:
+            live = lambda stream, text: self._emit("output", text, stream=stream)
+        return OutputCapture(
+            config.EXEC_OUTPUT_MAX_BYTES,
+            spill_dir=config.EXEC_SPILL_DIR,
+            container_root=(config.ALICE_OUTPUT_DIR, "/app/alice_output"),
+            live=live
+        )
+
+    async def _ensure_kernel(self, slot=0):
+        """确保指定槽位的常驻内核已启动；启动失败时回退为一次性执行模式"""
+        if self.kernels is None:
+            return None
+        kernel = self.kernels.get(slot)
+        try:
+            await kernel.start()
+            return kernel
+        except (KernelError, OSError) as e:
+            self._emit("system", f"常驻执行内核不可用 ({e})，回退为一次性执行模式。")
+            self.kernels = None
+            return None
+
+    async def _execute_via_docker_exec(self, command, is_python_code, capture):
+        """一次性 docker exec 执行 (采用 List 模式避免 Shell 转义陷阱)，输出实时送入 capture"""
+        full_command = [
+            "docker", "exec",
+            "-w", self.workdir,
+            self.container_name
+        ]
+
+        if is_python_code:
+            full_command += ["python3", "-c", command]
+        else:
+            full_command += ["bash", "-c", command]
+
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *full_command, # 核心修复：不经过宿主机 Shell 解析
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                env=os.environ
+            )
+        except Exception as e:
+            return f"执行过程中出错: {str(e)}"
+        # 注意：一次性模式下中断只能结束宿主机侧的 docker exec 客户端
+        self._active_processes.add(process)
+
+        async def pump(reader, stream):
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            while True:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    break
+                capture.write(stream, decoder.decode(chunk))
+            capture.write(stream, decoder.decode(b"", final=True))
+
+        readers = asyncio.gather(pump(process.stdout, "stdout"), pump(process.stderr, "stderr"))
+        try:
+            returncode = await asyncio.wait_for(process.wait(), config.EXECUTION_TIMEOUT)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            try:
+                await asyncio.wait_for(readers, 1) # 容器内残留的子进程可能仍持有管道
+            except asyncio.TimeoutError:
+                pass
+            return self._format_exec_result(capture, None)
+        finally:
+            self._active_processes.discard(process)
+        await readers
+        if self.cancel_event.is_set():
+            returncode = 130
+        return self._format_exec_result(capture, returncode)
+
+    def _format_exec_result(self, capture, returncode):
+        """returncode 为 None 表示执行超时，已产生的部分输出仍会保留"""
+        capture.returncode = returncode
+        stdout, stderr = capture.result()
+        output = stdout
+        if stderr:
+            output += f"\n[标准错误输出]:\n{stderr}"
+        if returncode is None:
+            output = f"{output}\n错误: 执行超时。" if output else "错误: 执行超时。"
+        elif returncode != 0:
+            output += f"\n[执行失败，退出状态码: {returncode}]"
+        return output if output else "[命令执行成功，无回显内容]"
+
+    async def reset_sandbox(self):
+        """清空常驻内核中当前会话的 Python 变量与导入状态"""
+        if self.kernels is None:
+            return "常驻执行内核未启用，每个代码块本就在全新的解释器中执行。"
+        try:
+            await self.kernels.reset(self.kernel_session)
+            return "已重置沙盒 Python 会话，之前定义的变量与导入均已清空。"
+        except KernelError as e:
+            return f"重置沙盒会话失败: {e}"
+
+    def _compact_context(self):
+        """请求前按 token 预算压缩历史消息"""
+        start = time.perf_counter()
+        self._replace_messages(self.context_mgr.compact(self.messages))
+        stats = self.context_mgr.last_stats
+        self._trace("compact", ms=round((time.perf_counter() - start) * 1000, 2),
+                    tokens_before=stats["tokens_before"], tokens_after=stats["tokens_after"], tiers=stats["tiers"])
+        if stats["tiers"]:
+            self._emit("system", f"上下文已压缩 {stats['tokens_before']} → {stats['tokens_after']} tokens (预算 {stats['budget']})。")
+
+    async def _receive(self, response, turn):
+        """接收一次流式回答；代码块一闭合就提交执行，与后续 token 的生成重叠"""
+        async for chunk in response:
+            if getattr(chunk, "usage", None):
+                turn["usage"] = chunk.usage
+            if chunk.choices:
+                delta = chunk.choices[0].delta
+                t_chunk = getattr(delta, 'reasoning_content', '')
+                c_chunk = getattr(delta, 'content', '')
+
+                if t_chunk:
+                    turn["timer"].mark("reasoning")
+                    self._emit("thinking", t_chunk)
+                    turn["thinking"].append(t_chunk)
+                elif c_chunk:
+                    turn["timer"].mark("content")
+                    if not turn["answering"]:
+                        self._emit("answer")
+                        turn["answering"] = True
+                    self._emit("content", c_chunk)
+                    turn["content"].append(c_chunk)
+                    self._submit(turn, turn["parser"].feed(c_chunk))
+
+                tool_deltas = getattr(delta, "tool_calls", None)
+                if tool_deltas and turn["tools"] is not None:
+                    # 参数增量流式显示；某个调用之后的调用开始时，它的参数即已完整，立即提交执行
+                    turn["timer"].mark("content")
+                    started, fragments, blocks = turn["tools"].feed(tool_deltas)
+                    for index, call_id, name in started:
+                        self._emit("tool_call", name, index=index, id=call_id)
+                    for index, text in fragments:
+                        self._emit("tool_args", text, index=index)
+                    self._submit(turn, blocks)
+        if turn["tools"] is not None:
+            self._submit(turn, turn["tools"].finish())
+
+    def _submit(self, turn, blocks):
+        for block in blocks:
+            task = self.scheduler.submit(block)
+            turn["pending"].append((block, task))
+            if self.refresh_mode == "speculative":
+                # 完成回调先于 chat 中 await 的唤醒执行，收集结果时投机刷新已提交
+                task.add_done_callback(lambda _, turn=turn: self._prefetch_system_message(turn))
+
+    async def _stream_round(self, turn):
+        """
+        一次完整的 LLM 回答：发起流式请求并接收。瞬时错误若发生在本次请求收到任何 token 之前，
+        按退避策略重试；若回答已生成了一部分，则携带已生成的内容续传 (不计入重试次数)。
+        """
+        policy = self.retry_policy
+        while True:
+            received = (len(turn["thinking"]), len(turn["content"]))
+            # 续传时只发送已生成的正文，推理内容不回传
+            messages = resume_messages(self.messages, turn["content"].text()) if turn["content"] else self.messages
+            response = None
+            tool_options = {"tools": self.tools, "parallel_tool_calls": True} if turn["tools"] is not None else {}
+            try:
+                request_start = time.perf_counter()
+                response = await self.client.chat.completions.create(
+                    model=self.model_name,
+                    messages=messages,
+                    stream=True,
+                    extra_body={"enable_thinking": True},
+                    **tool_options
+                )
+                turn["request_ms"] += (time.perf_counter() - request_start) * 1000
+                turn["requests"] += 1
+                turn["cached"] = getattr(response, "from_cache", False)
+                await self._receive(response, turn)
+                return
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                tools = turn["tools"]
+                if tools is not None and tools.started:
+                    # 工具调用的参数无法续传：已完整的调用照常执行，未完整的丢弃
+                    if tools.ready:
+                        self._emit("system", f"回答传输中断 ({describe_error(e)})，已完整的 {tools.ready} 个工具调用照常执行，"
+                                             "未完成的调用已丢弃。")
+                        return
+                    turn["tools"] = ToolCallAssembler()
+                if (len(turn["thinking"]), len(turn["content"])) != received:
+                    if turn["resumes"] >= policy.resume_attempts:
+                        raise
+                    turn["resumes"] += 1
+                    action = f"携带已生成的 {len(turn['content'])} 个字符续传" if turn["content"] else "重新请求"
+                    self._emit("system", f"回答传输中断 ({describe_error(e)})，{action} "
+                                         f"({turn['resumes']}/{policy.resume_attempts})...")
+                    continue
+                if turn["retries"] >= policy.max_retries:
+                    raise
+                delay = policy.delay(turn["retries"], e)
+                turn["retries"] += 1
+                self._emit("system", f"LLM 请求失败 ({describe_error(e)})，{delay:.1f}s 后重试 "
+                                     f"({turn['retries']}/{policy.max_retries})...")
+                await asyncio.sleep(delay)
+            finally:
+                if response is not None:
+                    try:
+                        await response.close()
+                    except Exception:
+                        pass # 连接已断开时关闭失败无需处理
+
+    def _record_usage(self, turn):
+        usage = turn["usage"]
+        self.usage["llm_requests"] += turn["requests"]
+        self.usage["llm_retries"] += turn["retries"]
+        self.usage["llm_resumes"] += turn["resumes"]
+        if usage is not None:
+            self.usage["prompt_tokens"] += usage.prompt_tokens or 0
+            self.usage["completion_tokens"] += usage.completion_tokens or 0
+        else:
+            self.usage["prompt_tokens"] += self.context_mgr.last_stats.get("tokens_after", 0)
+            self.usage["completion_tokens"] += estimate_tokens(turn["thinking"].text()) + estimate_tokens(turn["content"].text())
+            if turn["tools"] is not None:
+                self.usage["completion_tokens"] += estimate_tokens(turn["tools"].arguments_text())
+
+    async def chat(self, user_input):
+        turn_start = time.perf_counter()
+        self.turn_index += 1
+        usage_before = dict(self.usage)
+        # 按本轮输入重新挑选相关记忆
+        self.current_query = user_input
+        self.cancel_event.clear()
+        self._refresh_system_message()
+        self._append_message({"role": "user", "content": user_input})
+        # 较早轮次的长工具反馈替换为摘要，原文归档到输出目录
+        messages, slimmed = self.history.slim(self.messages)
+        self._replace_messages(messages)
+
+        rounds = 0
+        try:
+            while not self.cancel_event.is_set():
+                rounds += 1
+                self._compact_context()
+                self.scheduler.begin_turn()
+                # pending: (代码块, 执行 Task)，按文档顺序排列；parser 在续传之间保持状态
+                turn = {"content": TextBuffer(), "thinking": TextBuffer(), "pending": [], "usage": None, "timer": StreamTimer(),
+                        "parser": FenceParser(), "answering": False, "cached": False, "prefetch": None,
+                        "tools": ToolCallAssembler() if self.tool_mode == "native" else None,
+                        "requests": 0, "retries": 0, "resumes": 0, "request_ms": 0.0}
+
+                self._emit("turn", self.model_name)
+
+                # 请求与流的接收 (含重试与续传) 放在独立 Task 中，interrupt() 取消它即可立即停止等待
+                self._stream_task = asyncio.ensure_future(self._stream_round(turn))
+                try:
+                    await self._stream_task
+                except asyncio.CancelledError:
+                    if not self.cancel_event.is_set():
+                        raise
+                finally:
+                    # 重试耗尽而失败的回答同样计入用量与追踪
+                    self._stream_task = None
+                    self._record_usage(turn)
+                    tools = turn["tools"]
+                    self._trace("llm", round=rounds, model=self.model_name,
+                                interrupted=self.cancel_event.is_set(), cached=turn["cached"],
+                                request_ms=round(turn["request_ms"], 1), retries=turn["retries"], resumes=turn["resumes"],
+                                tool_calls=tools.ready if tools is not None else 0,
+                                tool_call_tokens=estimate_tokens(tools.arguments_text()) if tools is not None else 0,
+                                **turn["timer"].fields(turn["thinking"].text(), turn["content"].text()))
+                    self.history.archive_reasoning(self.turn_index, rounds, turn["thinking"].text())
+                full_content = turn["content"].text()
+                pending = turn["pending"]
+                if self.cancel_event.is_set():
+                    # 保留已生成的部分回答，会话历史在中断后依然完整可续
+                    full_content += "\n\n[回答已被用户中断]"
+                message = {"role": "assistant", "content": full_content}
+                if turn["tools"] is not None and turn["tools"].ready:
+                    message["tool_calls"] = turn["tools"].message_calls()
+                self._append_message(message)
+                if not pending:
+                    break
+
+                # 按文档顺序收集执行结果 (中断时正在执行的代码块会尽快返回，未开始的不再执行)
+                # 结构化调用的结果以 tool 消息回传，回答中代码块的结果合并为一条执行反馈
+                results = []
+                for block, task in pending:
+                    res = await task
+                    self._emit("result", res, lang=block.lang)
+                    if block.call_id is not None:
+                        self._append_message({"role": "tool", "tool_call_id": block.call_id, "content": res})
+                    elif block.lang == "python":
+                        results.append(f"Python 代码执行结果:\n{res}")
+                    else:
+                        results.append(f"Shell 命令 `{block.code}` 的结果:\n{res}")
+
+                if results:
+                    feedback = "\n\n".join(results)
+                    self._append_message({"role": "user", "content": f"{FEEDBACK_PREFIX}\n{feedback}"})
+
+                # 刷新系统消息 (投机刷新通常已在模型生成期间完成)
+                if self.refresh_mode == "speculative":
+                    self._install_prefetched(turn, rounds)
+                else:
+                    self._refresh_system_message(rounds)
+                if self.cancel_event.is_set():
+                    break
+
+                self._emit("continue", "系统快照已更新，结果已反馈给 Alice，继续生成中...")
+        finally:
+            self._trace("turn", ms=round((time.perf_counter() - turn_start) * 1000, 1),
+                        llm_requests=self.usage["llm_requests"] - usage_before["llm_requests"],
+                        llm_retries=self.usage["llm_retries"] - usage_before["llm_retries"],
+                        llm_resumes=self.usage["llm_resumes"] - usage_before["llm_resumes"],
+                        code_blocks=self.usage["code_blocks"] - usage_before["code_blocks"],
+                        messages=len(self.messages), history_tokens=self.context_mgr.total(self.messages),
+                        feedback_archived=slimmed, interrupted=self.cancel_event.is_set())
+            if self.session_log is not None:
+                self.session_log.end_turn(self.turn_index, self.usage)
+            self._terminal.flush()
+            if self.cancel_event.is_set() and self._cancel_started is not None:
+                self.last_cancel_latency = (time.perf_counter() - self._cancel_started) * 1000
+                self._cancel_started = None
+                self._emit("system", f"已中断当前回答 (耗时 {self.last_cancel_latency:.1f} ms)，会话已保留。")
@@ -0,0 +1,215 @@
+"""
+Alice 批量运行入口
+
+从 JSONL 文件读取提示词，在相互隔离的会话中并行运行完整的对话循环，并把结果逐条追加到输出 JSONL：
+    输入每行: {"id": "q1", "prompt": "..."}，prompt 也可以是字符串列表 (同一会话中依次发送的多轮输入)；
+              缺少 id 时使用 "line-<行号>"。
+    输出每行: {"id", "session_id", "status": "ok"|"timeout"|"error", "answer", "error",
+              "user_turns", "llm_requests", "prompt_tokens", "completion_tokens",
+              "code_blocks", "tool_time_ms", "wall_ms"}
+
+每个条目独占一个会话：独立的消息历史、任务清单、执行内核与容器工作目录 (从沙盒容器池租用)，
+记忆与技能快照共享；与服务模式一样，人设文件由所有条目共用，不允许通过 update_prompt 修改。
+输出文件中已有 status 为 ok 的 id 在重新运行时会被跳过，失败或超时的条目会重跑。
+
+用法: python batch.py prompts.jsonl [-o results.jsonl] [--parallel 4] [--timeout 600]
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+import uuid
+import config
+from async_agent import AgentResources, AsyncAliceAgent, sandbox_mounts, session_todo_path
+from sandbox_pool import SandboxPool
+
+
+def load_items(path):
+    items, seen = [], set()
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"{path} 第 {number} 行不是合法的 JSON: {e}")
+            prompts = record.get("prompt")
+            if isinstance(prompts, str):
+                prompts = [prompts]
+            if not prompts or not all(isinstance(p, str) and p.strip() for p in prompts):
+                raise ValueError(f"{path} 第 {number} 行缺少 prompt 字段。")
+            item_id = str(record.get("id", f"line-{number}"))
+            if item_id in seen:
+                raise ValueError(f"{path} 第 {number} 行的 id '{item_id}' 重复。")
+            seen.add(item_id)
+            items.append({"id": item_id, "prompts": prompts})
+    return items
+
+
+def load_completed(path):
+    """输出文件中已成功完成的 id (忽略崩溃遗留的不完整尾行)"""
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("status") == "ok":
+                completed.add(str(record.get("id")))
+    return completed
+
+
+class BatchRunner:
+    def __init__(self, output_path, parallel=4, timeout=None, pool_prefix="alice-sandbox-batch", verbose=False):
+        self.output_path = output_path
+        self.parallel = max(1, parallel)
+        self.timeout = timeout
+        self.verbose = verbose
+        self.resources = AgentResources()
+        self.pool = SandboxPool(
+            self.parallel,
+            config.SANDBOX_IMAGE,
+            sandbox_mounts(os.getcwd()),
+            name_prefix=pool_prefix,
+            session_root=config.SESSION_ROOT_DIR
+        )
+        self.done = 0
+        self.total = 0
+        self._output = None
+
+    async def run(self, items):
+        self.total = len(items)
+        queue = asyncio.Queue()
+        for item in items:
+            queue.put_nowait(item)
+        await self.pool.start()
+        self._output = open(self.output_path, "a+", encoding="utf-8")
+        # 上次运行中断时可能遗留不完整的尾行，先换行避免与新记录拼接
+        if self._output.tell() > 0:
+            self._output.seek(self._output.tell() - 1)
+            if self._output.read(1) != "\n":
+                self._output.write("\n")
+        try:
+            await asyncio.gather(*(self._worker(queue) for _ in range(min(self.parallel, len(items)))))
+        finally:
+            self._output.close()
+            await self.pool.close()
+            await self.resources.close()
+
+    async def _worker(self, queue):
+        while not queue.empty():
+            item = queue.get_nowait()
+            result = await self.run_item(item)
+            # 每完成一条立即落盘，中途退出后重跑可从断点继续
+            self._output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            self._output.flush()
+            self.done += 1
+            print(f"[系统]: [{self.done}/{self.total}] {result['id']} {result['status']} "
+                  f"({result['llm_requests']} 次请求, {result['code_blocks']} 个代码块, {result['wall_ms'] / 1000:.1f}s)")
+
+    def _on_event(self, item_id):
+        if not self.verbose:
+            return lambda event, payload: None
+
+        def show(event, payload):
+            if event in ("exec", "system"):
+                print(f"  [{item_id}] {event}: {payload['text'][:100]}")
+        return show
+
+    async def run_item(self, item):
+        start = time.perf_counter()
+        # 每次运行使用新的会话 ID：重跑失败或超时的条目时不会续写上次运行遗留的会话日志与工作目录
+        session_id = "batch-" + re.sub(r"[^\w.-]", "_", item["id"]) + "-" + uuid.uuid4().hex[:8]
+        lease = await self.pool.acquire(session_id)
+        agent = None
+        status, error = "ok", None
+        try:
+            agent = AsyncAliceAgent(resources=self.resources, sandbox=lease.sandbox, workdir=lease.workdir,
+                                    session_id=lease.session_id, todo_path=session_todo_path(lease.session_id),
+                                    prompt_editable=False)
+            agent.on_event = self._on_event(item["id"])
+            deadline = time.monotonic() + self.timeout if self.timeout else None
+            for prompt in item["prompts"]:
+                remaining = max(0, deadline - time.monotonic()) if deadline is not None else None
+                turn = asyncio.ensure_future(agent.chat(prompt))
+                done, _ = await asyncio.wait({turn}, timeout=remaining)
+                if not done:
+                    # 超时：按用户中断处理，保留已生成的部分回答
+                    agent.interrupt()
+                    await turn
+                    status = "timeout"
+                    break
+                turn.result()
+        except Exception as e:
+            status, error = "error", f"{type(e).__name__}: {e}"
+        finally:
+            if agent is not None:
+                await agent.close()
+            self.pool.release(lease, dirty=agent.sandbox_used if agent is not None else False)
+            try:
+                os.remove(session_todo_path(lease.session_id))
+            except OSError:
+                pass
+
+        answer = ""
+        usage = {}
+        if agent is not None:
+            answer = next((m["content"] for m in reversed(agent.messages) if m["role"] == "assistant"), "")
+            usage = agent.usage
+        return {
+            "id": item["id"],
+            "session_id": lease.session_id,
+            "status": status,
+            "answer": answer,
+            "error": error,
+            "user_turns": len(item["prompts"]),
+            "llm_requests": usage.get("llm_requests", 0),
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "code_blocks": usage.get("code_blocks", 0),
+            "tool_time_ms": round(usage.get("tool_time_ms", 0.0), 1),
+            "wall_ms": round((time.perf_counter() - start) * 1000, 1),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Alice 批量运行 (JSONL 提示词文件)")
+    parser.add_argument("input", help="输入 JSONL 文件，每行 {\"id\": ..., \"prompt\": ...}")
+    parser.add_argument("-o", "--output", help="结果 JSONL 文件 (默认为 <输入文件名>.results.jsonl)")
+    parser.add_argument("--parallel", type=int, default=4, help="并行会话数 (即租用的沙盒容器数)")
+    parser.add_argument("--timeout", type=float, help="单个条目的超时 (秒)")
+    parser.add_argument("--pool-prefix", default="alice-sandbox-batch", help="批量运行所用容器的名称前缀")
+    parser.add_argument("--verbose", action="store_true", help="显示代码执行与系统事件")
+    args = parser.parse_args()
+
+    output = args.output or f"{os.path.splitext(args.input)[0]}.results.jsonl"
+    try:
+        items = load_items(args.input)
+    except (OSError, ValueError) as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+    completed = load_completed(output)
+    pending = [item for item in items if item["id"] not in completed]
+    print(f"[系统]: 共 {len(items)} 条，已完成 {len(items) - len(pending)} 条，本次运行 {len(pending)} 条 → {output}")
+    if not pending:
+        return
+
+    runner = BatchRunner(output, args.parallel, args.timeout, args.pool_prefix, args.verbose)
+    start = time.perf_counter()
+    try:
+        asyncio.run(runner.run(pending))
+    except KeyboardInterrupt:
+        print("\n[系统]: 已中止，重新运行可从断点继续。")
+        return
+    print(f"[系统]: 完成 {runner.done} 条，用时 {time.perf_counter() - start:.1f}s。")
+
+
+if __name__ == "__main__":
+    main()
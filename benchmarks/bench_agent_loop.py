@@ -0,0 +1,265 @@
+"""
+对话循环基准：在本地 mock LLM 上连续运行上百轮对话，测量端到端轮次延迟、系统消息刷新开销与内存增长
+
+用法: python benchmarks/bench_agent_loop.py [--turns 120] [--script builtin] [--tps 0] [-o result.json] [--compare base.json]
+全程离线，在临时目录中运行 (记忆、追踪与输出均与仓库隔离)。默认剧本 builtin 的代码块只使用宿主机内置指令，
+无需 Docker；bash/python/mixed 剧本需要 Docker 沙盒。
+结果 JSON 记录了当前提交号与运行参数，用 --compare 指定另一次运行的结果即可逐项对比。
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+from mock_llm import MockLLM, SCRIPTS
+from load_test import prepare_workdir, percentile
+
+PROMPTS = ["帮我看看有哪些技能可用", "上次的天气查询做到哪了", "总结一下今天的工作", "提醒我明天开会"]
+COMPARE_FIELDS = [
+    ("turn_ms", "p50", "整轮耗时 p50 (ms)"),
+    ("turn_ms", "p95", "整轮耗时 p95 (ms)"),
+    ("non_llm_ms", "p50", "非 LLM 耗时 p50 (ms)"),
+    ("non_llm_ms", "p95", "非 LLM 耗时 p95 (ms)"),
+    ("ttft_ms", "p50", "首 token 延迟 p50 (ms)"),
+    ("output_tokens", "p50", "每次回答输出 p50 (tokens)"),
+    ("refresh_ms", "p50", "系统消息刷新 p50 (ms)"),
+    ("refresh_ms", "p95", "系统消息刷新 p95 (ms)"),
+    ("refresh_critical_ms", "p50", "工具轮刷新关键路径 p50 (ms)"),
+    ("refresh_critical_ms", "p95", "工具轮刷新关键路径 p95 (ms)"),
+    ("compact_ms", "p95", "上下文压缩 p95 (ms)"),
+    ("memory", "rss_growth_mb", "RSS 增长 (MB)"),
+    ("memory", "traced_growth_kb_per_100_turns", "Python 堆增长 (KB/100 轮)"),
+]
+
+
+def describe(values):
+    if not values:
+        return {"count": 0, "p50": None, "p95": None, "max": None, "mean": None}
+    return {
+        "count": len(values),
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "max": round(max(values), 3),
+        "mean": round(sum(values) / len(values), 3),
+    }
+
+
+def rss_mb():
+    """当前进程的常驻内存 (MB)"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # 非 Linux 时退化为峰值
+
+
+def git_revision():
+    def git(*args):
+        result = subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True)
+        return result.stdout.strip() if result.returncode == 0 else ""
+    return git("rev-parse", "--short", "HEAD") or "unknown", bool(git("status", "--porcelain", "--untracked-files=no"))
+
+
+async def run_turns(args):
+    from async_agent import AsyncAliceAgent # 需在设置好环境变量与工作目录之后导入
+
+    agent = AsyncAliceAgent(session_id="bench")
+    agent.on_event = lambda event, payload: None
+    latencies, samples = [], []
+    try:
+        for i in range(args.warmup):
+            await agent.chat(PROMPTS[i % len(PROMPTS)])
+        if args.tracemalloc:
+            tracemalloc.start()
+        first_turn = agent.turn_index + 1
+
+        def sample(turn):
+            samples.append({
+                "turn": turn,
+                "rss_mb": round(rss_mb(), 2),
+                "traced_mb": round(tracemalloc.get_traced_memory()[0] / 1048576, 3) if args.tracemalloc else None,
+                "messages": len(agent.messages),
+                "history_tokens": agent.context_mgr.total(agent.messages),
+            })
+
+        sample(0)
+        for i in range(args.turns):
+            start = time.perf_counter()
+            await agent.chat(f"{PROMPTS[i % len(PROMPTS)]} (#{i})")
+            latencies.append((time.perf_counter() - start) * 1000)
+            if (i + 1) % args.sample_every == 0 or i + 1 == args.turns:
+                sample(i + 1)
+        records = [r for r in agent.telemetry.writer.read() if r.get("turn", 0) >= first_turn] \
+            if agent.telemetry is not None else []
+    finally:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        await agent.close()
+    return latencies, samples, records
+
+
+def summarize(args, latencies, samples, records):
+    def field(span, name):
+        return [r[name] for r in records if r.get("span") == span and r.get(name) is not None]
+
+    # 每轮的 LLM 流式耗时之和，整轮耗时减去它即为对话循环自身与代码执行的耗时
+    llm_by_turn = {}
+    for r in records:
+        if r.get("span") == "llm":
+            llm_by_turn[r["turn"]] = llm_by_turn.get(r["turn"], 0) + r["total_ms"]
+    turn_records = [r for r in records if r.get("span") == "turn"]
+    non_llm = [r["ms"] - llm_by_turn.get(r["turn"], 0) for r in turn_records]
+
+    first, last = samples[0], samples[-1]
+    memory = {
+        "rss_start_mb": first["rss_mb"],
+        "rss_end_mb": last["rss_mb"],
+        "rss_growth_mb": round(last["rss_mb"] - first["rss_mb"], 2),
+        "samples": samples,
+    }
+    if args.tracemalloc:
+        growth_kb = (last["traced_mb"] - first["traced_mb"]) * 1024
+        memory["traced_growth_kb_per_100_turns"] = round(growth_kb / max(1, args.turns) * 100, 1)
+    return {
+        "turn_ms": describe(latencies),
+        "non_llm_ms": describe(non_llm),
+        "ttft_ms": describe(field("llm", "ttft_ms")),
+        # 每次回答的输出 token 数 (正文 + 结构化工具调用的参数，不含推理内容)
+        "output_tokens": describe([r["content_tokens"] + r.get("tool_call_tokens", 0)
+                                   for r in records if r.get("span") == "llm"]),
+        "llm_ms": describe(field("llm", "total_ms")),
+        "exec_ms": describe(field("exec", "ms")),
+        "refresh_ms": describe(field("refresh", "ms")),
+        # 工具轮之后的刷新阻塞下一次 LLM 请求的时间 (投机刷新时只计入取回结果时仍需等待的部分)
+        "refresh_critical_ms": describe([r["critical_ms"] for r in records
+                                         if r.get("span") == "refresh" and r.get("round") and "critical_ms" in r]),
+        "compact_ms": describe(field("compact", "ms")),
+        "llm_requests": len(field("llm", "total_ms")),
+        "llm_retries": sum(field("llm", "retries")),
+        "llm_resumes": sum(field("llm", "resumes")),
+        "code_blocks": len(field("exec", "ms")),
+        "memory": memory,
+        "history": {"messages": last["messages"], "tokens": last["history_tokens"]},
+    }
+
+
+def report(result):
+    metrics = result["metrics"]
+    print(f"提交 {result['commit']}{' (有未提交修改)' if result['dirty'] else ''} | 剧本 {result['params']['script']} | "
+          f"{result['params']['turns']} 轮, {metrics['llm_requests']} 次 LLM 请求, {metrics['code_blocks']} 个代码块")
+    if metrics["llm_retries"] or metrics["llm_resumes"]:
+        print(f"LLM 重试 {metrics['llm_retries']} 次, 中途断开续传 {metrics['llm_resumes']} 次")
+    for key, label in (("turn_ms", "整轮耗时"), ("non_llm_ms", "非 LLM 耗时"), ("ttft_ms", "首 token 延迟"),
+                       ("exec_ms", "代码块执行"), ("refresh_ms", "系统消息刷新"), ("refresh_critical_ms", "刷新关键路径"),
+                       ("compact_ms", "上下文压缩")):
+        stats = metrics[key]
+        if stats["count"]:
+            print(f"{label:<10} (ms): p50 {stats['p50']:.2f} | p95 {stats['p95']:.2f} | max {stats['max']:.2f} "
+                  f"(n={stats['count']})")
+    stats = metrics.get("output_tokens")
+    if stats and stats["count"]:
+        print(f"每次回答输出 (tokens): p50 {stats['p50']:.0f} | p95 {stats['p95']:.0f} | max {stats['max']:.0f}")
+    memory = metrics["memory"]
+    line = f"内存: RSS {memory['rss_start_mb']:.1f} → {memory['rss_end_mb']:.1f} MB"
+    if "traced_growth_kb_per_100_turns" in memory:
+        line += f" | Python 堆增长 {memory['traced_growth_kb_per_100_turns']:.1f} KB/100 轮"
+    print(line + f" | 历史 {metrics['history']['messages']} 条消息, {metrics['history']['tokens']} tokens")
+
+
+def compare(result, baseline):
+    print(f"\n对比基线: 提交 {baseline['commit']} ({baseline['timestamp']})")
+    if baseline.get("params") != result["params"]:
+        print("注意: 两次运行的参数不同，对比结果仅供参考。")
+    print(f"{'指标':<24}{'基线':>12}{'当前':>12}{'变化':>10}")
+    for group, key, label in COMPARE_FIELDS:
+        old = baseline["metrics"].get(group, {}).get(key)
+        new = result["metrics"].get(group, {}).get(key)
+        if old is None or new is None:
+            continue
+        change = f"{(new - old) / old * 100:+.1f}%" if old else "-"
+        print(f"{label:<24}{old:>12.2f}{new:>12.2f}{change:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Alice 对话循环基准 (本地 mock LLM)")
+    parser.add_argument("--turns", type=int, default=120)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--script", default="builtin", choices=sorted(SCRIPTS), help="mock LLM 回复剧本")
+    parser.add_argument("--tool-mode", default="fence", choices=["fence", "native"],
+                        help="工具调用方式 (TOOL_CALL_MODE)：回答中的代码块或结构化工具调用")
+    parser.add_argument("--refresh-mode", default="speculative", choices=["speculative", "inline"],
+                        help="工具轮之后的系统消息刷新方式 (SYSTEM_REFRESH_MODE)")
+    parser.add_argument("--ttft", type=float, default=0.0, help="mock LLM 首 token 延迟 (秒)")
+    parser.add_argument("--tps", type=float, default=0, help="mock LLM 生成速率 (token/秒)，0 表示不限速")
+    parser.add_argument("--reasoning-tokens", type=int, default=32)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="mock LLM 直接返回 503 的请求比例")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="mock LLM 流式输出中途断开的请求比例")
+    parser.add_argument("--context-budget", type=int, help="覆盖 CONTEXT_TOKEN_BUDGET，用于触发上下文压缩")
+    parser.add_argument("--sample-every", type=int, default=10, help="内存采样间隔 (轮)")
+    parser.add_argument("--tracemalloc", action="store_true", help="额外用 tracemalloc 统计 Python 堆增长 (会拖慢运行)")
+    parser.add_argument("-o", "--output", help="结果 JSON 输出路径")
+    parser.add_argument("--compare", help="与之对比的基线结果 JSON")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    output = os.path.abspath(args.output) if args.output else None
+
+    mock = MockLLM(ttft=args.ttft, tps=args.tps, reasoning_tokens=args.reasoning_tokens, script=args.script,
+                   error_rate=args.error_rate, drop_rate=args.drop_rate, seed=0)
+    port = mock.start_in_thread()
+    os.environ.update(API_KEY="mock", MODEL_NAME="mock-model", API_BASE_URL=f"http://127.0.0.1:{port}/v1",
+                      TELEMETRY_ENABLED="true", TOOL_CALL_MODE=args.tool_mode,
+                      SYSTEM_REFRESH_MODE=args.refresh_mode, EXEC_LIVE_OUTPUT="false", SANDBOX_KERNEL_ENABLED="true")
+    if args.context_budget:
+        os.environ["CONTEXT_TOKEN_BUDGET"] = str(args.context_budget)
+
+    workdir = prepare_workdir()
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        latencies, samples, records = asyncio.run(run_turns(args))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    commit, dirty = git_revision()
+    params = {key: getattr(args, key) for key in ("turns", "warmup", "script", "tool_mode", "ttft", "tps", "reasoning_tokens",
+                                                 "refresh_mode", "error_rate", "drop_rate", "context_budget", "tracemalloc")}
+    result = {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "params": params,
+        "metrics": summarize(args, latencies, samples, records),
+    }
+    report(result)
+    if baseline is not None:
+        compare(result, baseline)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {output}")
+
+
+if __name__ == "__main__":
+    main()
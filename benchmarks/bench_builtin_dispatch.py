@@ -0,0 +1,193 @@
+"""
+内置指令分发的微基准：对比原先逐条 startswith / re.search 的判断链与预编译的注册表分发
+
+用法: python benchmarks/bench_builtin_dispatch.py [--size 50000] [--repeat 5] [--sessions logs/sessions]
+语料由会话日志中录制的 bash 代码块与工具调用 (如有) 和按模板合成的命令组成，全程离线运行，
+只测量 "安全审查 + 判断是否为内置指令并解析参数" 这一段，不执行任何处理函数。
+同时列出两种实现解析结果不同的命令 (主要是多行内容与嵌套引号)。
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from builtin_commands import BuiltinRegistry
+from fence_parser import FenceParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 与 async_agent.RM_COMMAND 相同 (避免为了一个正则导入整个智能体及其依赖)
+RM_COMMAND = re.compile(r'(?:^|[\s;&|(])rm\s')
+TEMPLATES = [
+    "ls -la skills/{n}",
+    "cat skills/file_explorer/SKILL.md | head -{n}",
+    "python3 skills/file_explorer/explorer.py --tree --depth {n}",
+    "grep -rn \"def main\" skills | head -{n}",
+    "find alice_output -name '*.png' | wc -l",
+    "cd alice_output && python3 plot_{n}.py && ls",
+    "cat > alice_output/note_{n}.md << 'EOF'\n# 标题\n正文第 {n} 行\nEOF",
+    "pip list 2>/dev/null | grep -i akshare",
+    "toolkit list",
+    "toolkit info akshare",
+    "toolkit refresh",
+    "stats session",
+    "memory \"完成了第 {n} 个图表，保存在 alice_output/\"",
+    "memory \"用户偏好简洁的 \\\"要点式\\\" 回答\" --ltm",
+    "memory '用户说: \"下次直接给结论\"' --ltm",
+    "memory search \"天气 {n}\"",
+    "todo \"- [x] 获取数据\n- [ ] 绘制第 {n} 张图\n- [ ] 撰写 \\\"总结\\\"\"",
+    "update_prompt \"你是 Alice。\n## 原则\n1. 先计划，后执行\"",
+    "sandbox reset",
+]
+
+
+def legacy_match(command):
+    """原 execute_command 中的判断链 (仅解析，不调用处理函数)"""
+    cmd_strip = command.strip().lower()
+    if cmd_strip.startswith("rm ") or " rm " in cmd_strip:
+        return ("rm",)
+    cmd_strip = command.strip()
+    if cmd_strip.startswith("toolkit"):
+        return ("toolkit", cmd_strip.split()[1:])
+    if cmd_strip == "stats" or cmd_strip.startswith("stats "):
+        return ("stats", cmd_strip.split()[1:])
+    if cmd_strip == "sandbox reset":
+        return ("sandbox reset",)
+    if cmd_strip.startswith("update_prompt"):
+        parts = cmd_strip.split(None, 1)
+        return ("update_prompt", parts[1].strip().strip('"\'') if len(parts) > 1 else "")
+    if cmd_strip.startswith("todo"):
+        content_match = re.search(r'["\'](.*?)["\']', cmd_strip, re.DOTALL)
+        if content_match:
+            return ("todo", content_match.group(1))
+        parts = cmd_strip.split(None, 1)
+        return ("todo", parts[1].strip().strip('"\'') if len(parts) > 1 else "")
+    if cmd_strip.startswith("memory search"):
+        return ("memory search", cmd_strip[len("memory search"):].strip().strip('"\''))
+    if cmd_strip.startswith("memory"):
+        ltm_mode = "--ltm" in cmd_strip
+        content_match = re.search(r'["\'](.*?)["\']', cmd_strip, re.DOTALL)
+        if content_match:
+            return ("memory", content_match.group(1), ltm_mode)
+        parts = cmd_strip.split(None, 1)
+        if len(parts) > 1:
+            return ("memory", parts[1].replace("--ltm", "").strip().strip('"\''), ltm_mode)
+    return None
+
+
+def create_registry():
+    """与 AsyncAliceAgent._create_builtins 相同的登记，处理函数只返回解析结果"""
+    registry = BuiltinRegistry()
+    registry.register("toolkit", lambda argv: ("toolkit", argv))
+    registry.register("stats", lambda argv: ("stats", argv))
+    registry.register("sandbox reset", lambda: ("sandbox reset",), mode="none")
+    registry.register("update_prompt", lambda text: ("update_prompt", text), mode="text")
+    registry.register("todo", lambda text: ("todo", text), mode="text")
+    registry.register("memory search", lambda text: ("memory search", text), mode="text")
+    registry.register("memory", lambda text, flags: ("memory", text, "--ltm" in flags), mode="text", flags=("--ltm",))
+    return registry
+
+
+def registry_match(registry, command):
+    lowered = command.lower()
+    if "rm" in lowered and RM_COMMAND.search(lowered):
+        return ("rm",)
+    found = registry.match(command)
+    if found is None:
+        return None
+    spec, args, _ = found
+    return spec.handler(*args)
+
+
+def recorded_commands(directory):
+    """会话日志中录制的 bash 代码块与 bash 工具调用"""
+    commands = []
+    for path in glob.glob(os.path.join(directory, "*.jsonl")):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                messages = record.get("messages") or ([record["m"]] if "m" in record else [])
+                for message in messages:
+                    if message.get("role") != "assistant":
+                        continue
+                    commands += [m.group(3).strip() for m in FenceParser.PATTERN.finditer(message.get("content") or "")
+                                 if m.group(1) == "bash"]
+                    for call in message.get("tool_calls") or []:
+                        try:
+                            arguments = json.loads(call["function"]["arguments"])
+                        except ValueError:
+                            continue
+                        if call["function"]["name"] == "bash" and isinstance(arguments.get("command"), str):
+                            commands.append(arguments["command"])
+    return commands
+
+
+def build_corpus(size, recorded, seed=0):
+    rng = random.Random(seed)
+    corpus = list(recorded[:size])
+    while len(corpus) < size:
+        corpus.append(rng.choice(TEMPLATES).format(n=rng.randint(1, 999)))
+    rng.shuffle(corpus)
+    return corpus
+
+
+def measure(func, corpus, repeat):
+    """多次运行取最快一次，返回每条命令的纳秒数"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for command in corpus:
+            func(command)
+        elapsed = time.perf_counter_ns() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(corpus)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="内置指令分发的微基准")
+    parser.add_argument("--size", type=int, default=50000, help="语料条数")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--sessions", default=os.path.join(ROOT, "logs", "sessions"), help="会话日志目录")
+    args = parser.parse_args()
+
+    recorded = recorded_commands(args.sessions)
+    corpus = build_corpus(args.size, recorded)
+    registry = create_registry()
+    new = lambda command: registry_match(registry, command)
+
+    builtins = [command for command in corpus if new(command) not in (None, ("rm",))]
+    shell = [command for command in corpus if new(command) in (None, ("rm",))]
+    print(f"语料 {len(corpus)} 条 (录制 {min(len(recorded), args.size)} 条)，"
+          f"其中 Shell 命令 {len(shell)} 条，内置指令 {len(builtins)} 条")
+    # 合成语料中内置指令的占比远高于实际会话，分开报告，避免总体比值被占比左右
+    print(f"{'':10}{'原判断链':>12}{'注册表分发':>12}")
+    for label, commands in (("Shell 命令", shell), ("内置指令", builtins), ("全部", corpus)):
+        if not commands:
+            continue
+        legacy_ns = measure(legacy_match, commands, args.repeat)
+        new_ns = measure(new, commands, args.repeat)
+        print(f"{label:10}{legacy_ns:10.0f}ns{new_ns:10.0f}ns  ({legacy_ns / new_ns:.2f}x)")
+
+    differences = {}
+    for command in corpus:
+        old, current = legacy_match(command), new(command)
+        if old != current:
+            differences.setdefault(command, (old, current))
+    print(f"\n解析结果不同的命令: {len(differences)} 种 (每类指令列出一例)")
+    examples = {}
+    for command, (old, current) in differences.items():
+        examples.setdefault((old or current or ("",))[0], (command, old, current))
+    for command, old, current in examples.values():
+        print(f"- {command!r}\n    原判断链:   {old!r}\n    注册表分发: {current!r}")
+
+
+if __name__ == "__main__":
+    main()
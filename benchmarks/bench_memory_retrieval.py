@@ -0,0 +1,122 @@
+"""
+记忆注入基准：对比全量注入与相关性检索注入的提示词体积与耗时
+
+用法: python benchmarks/bench_memory_retrieval.py [--sizes 100,1000,5000] [--queries 50]
+以仓库内的 memory/*.md 为语料种子，合成不同规模的 LTM/STM 文件，全程离线运行。
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from memory_index import MemoryRetriever
+from memory_store import DATE_HEADER, MemoryStore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUERIES = [
+    "昆明今天天气怎么样", "帮我看看A股开盘情况", "用 akshare 画一下上证指数K线",
+    "今天有什么新闻", "微博热搜", "创建一个新的技能", "上次的火车票可视化做到哪了",
+    "playwright 下载图片", "我是谁", "提醒我喝水",
+]
+DATE_PREFIX = re.compile(r'^\[?(\d{4}-\d{2}-\d{2})\]?')
+
+
+def parse_memory_entries(text, source):
+    """把 Markdown 记忆文件解析为条目：每个列表项 (`- ` 开头) 为一条，STM 条目继承所在日期小节"""
+    entries = []
+    current_date = None
+    for line in text.splitlines():
+        header = DATE_HEADER.match(line)
+        if header:
+            current_date = header.group(1)
+            continue
+        stripped = line.strip()
+        if not stripped.startswith("- "):
+            continue
+        body = stripped[2:].strip()
+        prefix = DATE_PREFIX.match(body)
+        date = prefix.group(1) if prefix else current_date
+        entries.append((source, date, body))
+    return entries
+
+
+def load_seed_entries():
+    entries = []
+    for name, source in (("alice_memory.md", "ltm"), ("short_term_memory.md", "stm")):
+        with open(os.path.join(ROOT, "memory", name), "r", encoding="utf-8") as f:
+            entries += [(source, text) for source, _, text in parse_memory_entries(f.read(), source)]
+    return entries
+
+
+def synthesize(directory, seed, size):
+    """按种子条目合成 size 条记忆，约 1/5 为 LTM，其余按日期分组写入 STM"""
+    rng = random.Random(size)
+    ltm_lines = ["# Alice 的长期记忆", "", "## 经验教训"]
+    stm_lines = ["# Alice 的短期记忆 (最近 7 天)", ""]
+    ltm_seed = [t for s, t in seed if s == "ltm"] or [t for _, t in seed]
+    stm_seed = [t for s, t in seed if s == "stm"] or [t for _, t in seed]
+    for i in range(size):
+        if i % 5 == 0:
+            ltm_lines.append(f"- {rng.choice(ltm_seed)} #{i}")
+        else:
+            if i % 40 == 1:
+                stm_lines += ["", f"## 2025-12-{1 + (i // 40) % 28:02d}"]
+            stm_lines.append(f"- {rng.choice(stm_seed)} #{i}")
+    paths = {"ltm": os.path.join(directory, "ltm.md"), "stm": os.path.join(directory, "stm.md")}
+    for source, lines in (("ltm", ltm_lines), ("stm", stm_lines)):
+        with open(paths[source], "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+    return paths
+
+
+def full_injection(paths):
+    parts = []
+    for path in paths.values():
+        with open(path, "r", encoding="utf-8") as f:
+            parts.append(f.read())
+    return "\n\n".join(parts)
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="记忆注入基准：全量注入 vs 相关性检索")
+    parser.add_argument("--sizes", default="100,1000,5000", help="逗号分隔的记忆条目规模")
+    parser.add_argument("--queries", type=int, default=50, help="每个规模下的查询次数")
+    args = parser.parse_args()
+
+    seed = load_seed_entries()
+    header = f"{'条目数':>8} | {'全量字节':>10} | {'全量耗时ms':>10} | {'检索字节':>10} | {'检索耗时ms':>10} | {'建索引ms':>9} | {'体积比':>7}"
+    print(header)
+    print("-" * len(header))
+    for size in [int(s) for s in args.sizes.split(",")]:
+        with tempfile.TemporaryDirectory() as directory:
+            paths = synthesize(directory, seed, size)
+            full_ms, full_text = timed(lambda: full_injection(paths), args.queries)
+            full_bytes = len(full_text.encode("utf-8"))
+
+            store = MemoryStore(os.path.join(directory, "memory_log.jsonl"), paths["ltm"], paths["stm"])
+            retriever = MemoryRetriever(store)
+            build_ms, _ = timed(retriever.sync, 1)
+            queries = [QUERIES[i % len(QUERIES)] for i in range(args.queries)]
+            start = time.perf_counter()
+            sizes = [len(retriever.render(q).encode("utf-8")) for q in queries]
+            retrieval_ms = (time.perf_counter() - start) / len(queries) * 1000
+            retrieval_bytes = sum(sizes) / len(sizes)
+
+            print(f"{size:>8} | {full_bytes:>10} | {full_ms:>10.3f} | {retrieval_bytes:>10.0f} | "
+                  f"{retrieval_ms:>10.3f} | {build_ms:>9.1f} | {retrieval_bytes / full_bytes:>7.1%}")
+
+
+if __name__ == "__main__":
+    main()
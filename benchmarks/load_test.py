@@ -0,0 +1,228 @@
+"""
+服务模式压测：并发创建会话并进行多轮对话，统计会话吞吐与轮次延迟
+
+用法: python benchmarks/load_test.py [--sessions 40] [--concurrency 8] [--turns 3] [--pool-size 4]
+默认在本机启动 mock LLM (benchmarks/mock_llm.py) 与 server.py 子进程，全程离线：
+服务端运行在临时目录中 (记忆与输出均与仓库隔离)，容器池使用 alice-loadtest 前缀。
+默认的 mock 剧本 (chat) 不含代码块，因此无需 Docker；--script bash/python/mixed 会让每轮执行代码块 (需要 Docker)。
+--url 指向已运行的服务时只发起压测，不再启动 mock LLM 与服务端。
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_llm import MockLLM, SCRIPTS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Client:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+
+    async def _send(self, method, path, payload=None):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8") if payload is not None else b""
+        writer.write(f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body)
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return status, headers, reader, writer
+
+    async def call(self, method, path, payload=None):
+        status, headers, reader, writer = await self._send(method, path, payload)
+        body = await reader.read()
+        writer.close()
+        return status, headers, (json.loads(body) if body.strip() else {})
+
+    async def chat(self, session_id, message):
+        """发送一轮对话并读取 SSE 直到连接关闭，返回 (状态码, 首个输出事件耗时, done 事件)"""
+        start = time.perf_counter()
+        status, _, reader, writer = await self._send("POST", f"/sessions/{session_id}/chat", {"message": message})
+        first, done, event = None, None, None
+        if status == 200:
+            async for line in reader:
+                line = line.decode("utf-8").rstrip("\n")
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                    if first is None and event in ("thinking", "content"):
+                        first = time.perf_counter() - start
+                elif line.startswith("data: ") and event == "done":
+                    done = json.loads(line[len("data: "):])
+        writer.close()
+        return status, first, done
+
+
+async def run_session(client, turns, metrics):
+    # 容器池已满时服务端返回 503，按 Retry-After 退避后重试
+    while True:
+        status, headers, body = await client.call("POST", "/sessions")
+        if status == 503:
+            metrics["rejected"] += 1
+            await asyncio.sleep(float(headers.get("retry-after", 1)))
+            continue
+        if status != 201:
+            metrics["errors"] += 1
+            return
+        break
+    session_id = body["session_id"]
+    for i in range(turns):
+        start = time.perf_counter()
+        status, ttft, done = await client.chat(session_id, f"第 {i + 1} 个问题：请简单介绍一下你自己。")
+        if status != 200 or done is None:
+            metrics["errors"] += 1
+            continue
+        metrics["latency"].append((time.perf_counter() - start) * 1000)
+        if ttft is not None:
+            metrics["ttft"].append(ttft * 1000)
+    await client.call("DELETE", f"/sessions/{session_id}")
+    metrics["sessions"] += 1
+
+
+async def load(client, sessions, concurrency, turns):
+    metrics = {"sessions": 0, "rejected": 0, "errors": 0, "latency": [], "ttft": []}
+    queue = asyncio.Queue()
+    for _ in range(sessions):
+        queue.put_nowait(None)
+
+    async def worker():
+        while not queue.empty():
+            queue.get_nowait()
+            await run_session(client, turns, metrics)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    metrics["wall"] = time.perf_counter() - start
+    _, _, metrics["server"] = await client.call("GET", "/stats")
+    return metrics
+
+
+async def wait_ready(client, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"服务端进程已退出 (退出码 {process.returncode})")
+        try:
+            status, _, _ = await client.call("GET", "/stats")
+            if status == 200:
+                return
+        except OSError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("等待服务端启动超时")
+
+
+def prepare_workdir():
+    """服务端的临时运行目录：复制人设与镜像文件，技能库以符号链接共享，记忆从空开始"""
+    workdir = tempfile.mkdtemp(prefix="alice_load_")
+    shutil.copytree(os.path.join(ROOT, "prompts"), os.path.join(workdir, "prompts"))
+    for name in ("Dockerfile.sandbox", "requirements.txt"):
+        shutil.copy(os.path.join(ROOT, name), workdir)
+    os.symlink(os.path.join(ROOT, "skills"), os.path.join(workdir, "skills"))
+    os.makedirs(os.path.join(workdir, "memory"))
+    return workdir
+
+
+def start_server(args, workdir):
+    mock = MockLLM(ttft=args.ttft, tps=args.tps, script=args.script)
+    mock_port = mock.start_in_thread()
+    port = free_port()
+    env = dict(os.environ,
+               API_KEY="mock", MODEL_NAME="mock-model",
+               API_BASE_URL=f"http://127.0.0.1:{mock_port}/v1",
+               SANDBOX_POOL_PREFIX="alice-loadtest",
+               SANDBOX_POOL_WAIT=str(args.pool_wait),
+               EXEC_LIVE_OUTPUT="true")
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "server.py"), "--port", str(port), "--pool-size", str(args.pool_size)],
+        cwd=workdir, env=env,
+        stdout=None if args.verbose else subprocess.DEVNULL,
+        stderr=None if args.verbose else subprocess.DEVNULL,
+    )
+    return process, "127.0.0.1", port
+
+
+def report(args, metrics):
+    latency, ttft = metrics["latency"], metrics["ttft"]
+    print(f"会话: {metrics['sessions']} / {args.sessions} (并发 {args.concurrency}, 每会话 {args.turns} 轮, "
+          f"503 退避 {metrics['rejected']} 次, 错误 {metrics['errors']})")
+    print(f"总耗时: {metrics['wall']:.2f}s | 吞吐: {metrics['sessions'] / metrics['wall']:.2f} 会话/秒, "
+          f"{len(latency) / metrics['wall']:.2f} 轮/秒")
+    print(f"轮次延迟 (ms): p50 {percentile(latency, 50):.1f} | p95 {percentile(latency, 95):.1f} | "
+          f"max {max(latency, default=0):.1f}")
+    print(f"首个输出事件 (ms): p50 {percentile(ttft, 50):.1f} | p95 {percentile(ttft, 95):.1f}")
+    pool = metrics["server"].get("pool", {})
+    print(f"容器池: {pool.get('size')} 个, 租用 {pool.get('leases')} 次, 拒绝 {pool.get('rejected')} 次, "
+          f"重启回收 {pool.get('recycled')} 次")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Alice 服务模式压测")
+    parser.add_argument("--url", help="已运行的服务地址，如 http://127.0.0.1:8765")
+    parser.add_argument("--sessions", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--pool-wait", type=float, default=2, help="服务端容器池排队超时 (秒)")
+    parser.add_argument("--ttft", type=float, default=0.05, help="mock LLM 首 token 延迟 (秒)")
+    parser.add_argument("--tps", type=float, default=500, help="mock LLM 生成速率 (token/秒)")
+    parser.add_argument("--script", default="chat", choices=sorted(SCRIPTS), help="mock LLM 回复剧本")
+    parser.add_argument("--verbose", action="store_true", help="显示服务端输出")
+    args = parser.parse_args()
+
+    process, workdir = None, None
+    if args.url:
+        url = urlsplit(args.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        workdir = prepare_workdir()
+        process, host, port = start_server(args, workdir)
+    client = Client(host, port)
+    try:
+        asyncio.run(wait_ready(client, process))
+        metrics = asyncio.run(load(client, args.sessions, args.concurrency, args.turns))
+        report(args, metrics)
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
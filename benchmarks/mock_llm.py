@@ -0,0 +1,266 @@
+"""
+本地 mock LLM：兼容 OpenAI chat.completions 流式协议的最小服务端 (仅依赖标准库)
+
+- 流式请求按 token 逐个返回 reasoning_content 与 content 增量，首 token 延迟、生成速率 (token/s)
+  与推理 token 数均可配置；
+- 回复按剧本 (script) 给出：剧本是一组回复，用户的新问题对应第 1 条，此后每收到一次容器执行反馈
+  前进一条，用完后重复最后一条。内置剧本见 SCRIPTS，也可用 --script-file 指定 JSON 字符串列表；
+- 非流式请求 (如记忆提炼) 直接返回一段固定摘要；
+- 请求中带有 tools 时 (TOOL_CALL_MODE=native)，剧本回复中的代码块改为流式的结构化工具调用：
+  toolkit / memory search 指令映射为对应的内置工具，其余映射为 bash / python，同一回复中的多个调用并行发出；
+- 故障注入：--error-rate 按概率直接返回 503，--drop-rate 按概率在正文输出到一半时断开连接。
+  收到续传请求 (末尾为已生成的部分回答与续写要求) 时只返回剩余部分，用于验证重试与续传。
+
+用法: python benchmarks/mock_llm.py [--port 8900] [--ttft 0.05] [--tps 500] [--script bash]
+之后把 API_BASE_URL 设为 http://127.0.0.1:8900/v1 即可让 Alice 离线运行。
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import re
+import threading
+import time
+
+FEEDBACK_PREFIX = "容器执行反馈："
+RESUME_PREFIX = "[传输中断]"
+THINKING = "用户提出了一个问题，我先回顾上下文，再决定是否需要在沙盒中执行命令。"
+ANSWER = "好的，这是来自本地 mock 模型的回答，用于离线压测 Alice 的对话循环与服务端开销。"
+FINAL_ANSWER = "执行结果已收到，当前工作目录一切正常。"
+SCRIPTS = {
+    # 纯对话，不含代码块
+    "chat": [ANSWER],
+    # 一个 bash 代码块 (需要沙盒)
+    "bash": ["我先在沙盒里确认一下当前目录：\n```bash\npwd && ls | head -5\n```\n", FINAL_ANSWER],
+    # 一个 python 代码块 (需要沙盒)
+    "python": ["我用 Python 统计一下：\n```python\nimport os\nprint(len(os.listdir('.')))\n```\n", FINAL_ANSWER],
+    # bash 与 python 代码块各一个，且执行反馈后再追加一个代码块 (需要沙盒)
+    "mixed": [
+        "先看目录，再用 Python 汇总：\n```bash\nls | head -5\n```\n"
+        "```python\ntotal = sum(range(1000))\nprint(total)\n```\n",
+        "再确认一下变量仍然存在：\n```python\nprint(total + 1)\n```\n",
+        FINAL_ANSWER,
+    ],
+    # 只使用宿主机内置指令的代码块 (无需 Docker)
+    "builtin": [
+        "我先查一下技能与记忆：\n```bash\ntoolkit list\n```\n```bash\nmemory search \"天气\"\n```\n",
+        FINAL_ANSWER,
+    ],
+}
+
+
+FENCE = re.compile(r'```(python|bash)\s*\n(.*?)\s*```', re.DOTALL)
+TOOLKIT = re.compile(r'^toolkit\s+(list|refresh|info\s+(\S+))$')
+MEMORY_SEARCH = re.compile(r'^memory\s+search\s+"(.*)"$')
+
+
+def tokenize(text, size=2):
+    """按固定字符数切分为伪 token"""
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class MockLLM:
+    def __init__(self, ttft=0.05, tps=500, reasoning_tokens=32, script="chat", error_rate=0.0, drop_rate=0.0, seed=None):
+        self.ttft = ttft
+        self.token_delay = 1 / tps if tps else 0
+        reasoning = tokenize(THINKING)
+        self.reasoning = [reasoning[i % len(reasoning)] for i in range(reasoning_tokens)]
+        self.script = SCRIPTS[script] if isinstance(script, str) else list(script)
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.faults = {"errors": 0, "drops": 0}
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._ids = itertools.count(1)
+
+    def reply_for(self, messages):
+        """按剧本选择回复：用户的新问题对应第 1 条，之后每收到一轮执行反馈 (即每条已有的回答) 前进一条"""
+        step = 0
+        for message in reversed(messages):
+            content = message.get("content") if isinstance(message.get("content"), str) else ""
+            if message.get("role") == "assistant":
+                step += 1
+            elif message.get("role") == "user" and not content.startswith(FEEDBACK_PREFIX):
+                break
+        return self.script[min(step, len(self.script) - 1)]
+
+    @staticmethod
+    def tool_calls_for(reply):
+        """把回复中的代码块改写为结构化工具调用，返回 (去掉代码块的正文, [(工具名, 参数)])"""
+        calls = []
+        for lang, code in FENCE.findall(reply):
+            toolkit, search = TOOLKIT.match(code), MEMORY_SEARCH.match(code)
+            if lang == "python":
+                calls.append(("python", {"code": code}))
+            elif toolkit:
+                calls.append(("toolkit", {"action": toolkit.group(1).split()[0], "skill": toolkit.group(2)}
+                              if toolkit.group(2) else {"action": toolkit.group(1)}))
+            elif search:
+                calls.append(("memory", {"action": "search", "content": search.group(1)}))
+            else:
+                calls.append(("bash", {"command": code}))
+        return FENCE.sub("", reply).strip(), calls
+
+    def resume_for(self, messages):
+        """续传请求：返回完整回答中尚未输出的部分；不是续传请求时返回 None"""
+        if len(messages) < 3 or not str(messages[-1].get("content", "")).startswith(RESUME_PREFIX):
+            return None
+        partial = messages[-2].get("content") or ""
+        reply = self.reply_for(messages[:-2])
+        return reply[len(partial):] if reply.startswith(partial) else reply
+
+    def _chunk(self, completion_id, model, delta, finish_reason=None):
+        return {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+
+    async def handle(self, reader, writer):
+        try:
+            line = await reader.readline()
+            if not line:
+                return
+            method, path, _ = line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length") or 0))
+            if method != "POST" or not path.rstrip("/").endswith("/chat/completions"):
+                writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                return
+            request = json.loads(body or b"{}")
+            self.requests += 1
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.faults["errors"] += 1
+                payload = b'{"error": {"message": "mock overloaded", "type": "server_error"}}'
+                writer.write(b"HTTP/1.1 503 Service Unavailable\r\nContent-Type: application/json\r\n"
+                             + f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode("latin-1") + payload)
+                return
+            if request.get("stream"):
+                await self._stream(request, writer)
+            else:
+                await self._complete(request, writer)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            try:
+                await writer.drain()
+                writer.close()
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+    async def _complete(self, request, writer):
+        payload = json.dumps({
+            "id": f"mock-{next(self._ids)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": "- 本地 mock 提炼结果"}}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }, ensure_ascii=False).encode("utf-8")
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                     + f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode("latin-1") + payload)
+
+    async def _stream(self, request, writer):
+        completion_id = f"mock-{next(self._ids)}"
+        model = request.get("model", "mock")
+        # 与真实服务一样使用分块传输编码，连接中途断开时客户端才能识别出不完整的响应
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+                     b"Cache-Control: no-cache\r\nTransfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+
+        def write(data):
+            writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+
+        def send(delta, finish_reason=None):
+            data = json.dumps(self._chunk(completion_id, model, delta, finish_reason), ensure_ascii=False)
+            write(f"data: {data}\n\n".encode("utf-8"))
+
+        await asyncio.sleep(self.ttft)
+        send({"role": "assistant", "content": ""})
+        messages = request.get("messages", [])
+        resumed = self.resume_for(messages)
+        reply = resumed if resumed is not None else self.reply_for(messages)
+        calls = []
+        if request.get("tools"):
+            reply, calls = self.tool_calls_for(reply)
+        tokens = [("reasoning_content", t) for t in self.reasoning]
+        content = [("content", t) for t in tokenize(reply)]
+        tokens += content
+        for index, (name, arguments) in enumerate(calls):
+            tokens.append(("tool_calls", [{"index": index, "id": f"call_{next(self._ids)}", "type": "function",
+                                           "function": {"name": name, "arguments": ""}}]))
+            tokens += [("tool_calls", [{"index": index, "function": {"arguments": t}}])
+                       for t in tokenize(json.dumps(arguments, ensure_ascii=False), 4)]
+        drop_at = None
+        if self.drop_rate and len(content) > 1 and self._random.random() < self.drop_rate:
+            drop_at = len(tokens) - len(content) // 2
+        # 按时间表发送，避免逐个 sleep 的误差累积使实际速率偏低
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for index, (field, token) in enumerate(tokens, 1):
+            if index == drop_at:
+                self.faults["drops"] += 1
+                writer.transport.abort() # 模拟连接中途断开
+                return
+            send({field: token})
+            await writer.drain()
+            if self.token_delay:
+                await asyncio.sleep(max(0, start + index * self.token_delay - loop.time()))
+        send({}, "tool_calls" if calls else "stop")
+        write(b"data: [DONE]\n\n")
+        writer.write(b"0\r\n\r\n")
+
+    async def serve(self, host="127.0.0.1", port=0, ready=None):
+        server = await asyncio.start_server(self.handle, host, port)
+        self.port = server.sockets[0].getsockname()[1]
+        if ready is not None:
+            ready.set()
+        async with server:
+            await server.serve_forever()
+
+    def start_in_thread(self, host="127.0.0.1", port=0):
+        """在后台线程中运行，返回实际监听的端口"""
+        ready = threading.Event()
+        thread = threading.Thread(target=lambda: asyncio.run(self.serve(host, port, ready)),
+                                  name="mock-llm", daemon=True)
+        thread.start()
+        ready.wait()
+        return self.port
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 mock LLM (OpenAI 兼容流式接口)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--ttft", type=float, default=0.05, help="首 token 延迟 (秒)")
+    parser.add_argument("--tps", type=float, default=500, help="生成速率 (token/秒)，0 表示不限速")
+    parser.add_argument("--reasoning-tokens", type=int, default=32, help="每次回复的推理 token 数 (0 表示不返回推理)")
+    parser.add_argument("--script", default="chat", choices=sorted(SCRIPTS), help="内置回复剧本")
+    parser.add_argument("--script-file", help="自定义剧本：JSON 字符串列表")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="直接返回 503 的请求比例")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="流式输出中途断开的请求比例")
+    args = parser.parse_args()
+    script = args.script
+    if args.script_file:
+        with open(args.script_file, "r", encoding="utf-8") as f:
+            script = json.load(f)
+    mock = MockLLM(args.ttft, args.tps, args.reasoning_tokens, script, args.error_rate, args.drop_rate)
+    print(f"mock LLM 监听于 http://{args.host}:{args.port}/v1")
+    try:
+        asyncio.run(mock.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
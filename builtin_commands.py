@@ -0,0 +1,180 @@
+"""
+宿主机内置指令的分发
+
+execute_command 收到的每个 bash 代码块都先经过这里：所有已登记的指令名编译为一个锚定的正则，
+一次匹配即可判断是否为内置指令并取出指令名与参数部分，普通 Shell 命令只付出这一次匹配。
+参数按登记时指定的方式解析：
+    argv  按 Shell 规则切分为参数列表 (引号不配对时退化为按空白切分)
+    text  其余部分整体作为一段文本：以引号开头时取到配对的引号为止 (引号内的换行原样保留)；
+          可登记出现在文本前后的开关 (如 memory 的 --ltm)，以集合形式一并传给处理函数
+代码块中有多行命令时逐条分发：后续各行仍是内置指令则依次执行，是普通 Shell 命令则返回错误说明。
+    none  不接受参数
+新增只在宿主机执行的快速指令只需 register，无需改动 execute_command。
+"""
+import inspect
+import re
+import shlex
+from collections import namedtuple
+from operator import itemgetter
+
+BuiltinCommand = namedtuple("BuiltinCommand", ["name", "handler", "mode", "flags", "usage"])
+MODES = ("argv", "text", "none")
+# 以引号开头的文本参数：双引号内支持 \" \\ \$ \` 转义 (与 Shell 一致)，单引号内原样保留
+# 展开循环写法：普通字符段之间只能由转义分隔，引号没有闭合时也只需线性回溯
+DOUBLE_QUOTED = re.compile(r'"([^"\\]*(?:\\.[^"\\]*)*)"', re.DOTALL)
+SINGLE_QUOTED = re.compile(r"'([^']*)'")
+ESCAPED = re.compile(r'\\(["\\$`])')
+# 以函数作为替换 (取第 1 组) 比模板字符串 r"\1" 快数倍
+UNESCAPE = itemgetter(1)
+
+
+def parse_argv(text):
+    if "'" not in text and '"' not in text and "\\" not in text:
+        return text.split()
+    try:
+        return shlex.split(text)
+    except ValueError:
+        return text.split()
+
+
+def split_text(text, flags=()):
+    """
+    以引号开头的文本参数 (前面可以有开关) 到配对引号所在行的行尾为止，
+    返回 (本条指令的参数部分, 之后各行的命令)；其余情形整段都属于本条指令。
+    """
+    if "\n" not in text:
+        return text, ""
+    pos = 0
+    skipped = True
+    while skipped:
+        skipped = False
+        for flag in flags:
+            end = pos + len(flag)
+            if text.startswith(flag, pos) and (end == len(text) or text[end].isspace()):
+                pos = len(text) - len(text[end:].lstrip())
+                skipped = True
+    quote = text[pos:pos + 1]
+    if quote not in ("'", '"'):
+        return text, ""
+    inner = text[pos + 1:-1]
+    if text[-1] == quote and quote not in inner and "\\" not in inner:
+        return text, "" # 常见情形：整段多行内容包在一对引号中
+    match = (DOUBLE_QUOTED if quote == '"' else SINGLE_QUOTED).match(text, pos)
+    line_end = text.find("\n", match.end()) if match else -1
+    if line_end < 0:
+        return text, ""
+    return text[:line_end].rstrip(), text[line_end + 1:].strip()
+
+
+def parse_text(text):
+    """
+    整段文本参数：以引号开头时去掉配对的引号 (支持转义)，否则原样返回；
+    配对的引号之后同一行还有文字 (内容中有未转义的同种引号) 或引号没有闭合时，只去掉首尾的引号。
+    """
+    quote = text[:1]
+    if quote not in ("'", '"'):
+        return text
+    inner = text[1:-1]
+    if len(text) > 1 and text[-1] == quote and quote not in inner and "\\" not in inner:
+        return inner.strip() # 常见情形：单层引号且内容中没有引号与转义
+    match = (DOUBLE_QUOTED if quote == '"' else SINGLE_QUOTED).match(text)
+    if match is None or match.end() != len(text):
+        return text.strip("\"'").strip()
+    inner = match.group(1)
+    if quote == '"' and "\\" in inner:
+        inner = ESCAPED.sub(UNESCAPE, inner)
+    return inner.strip()
+
+
+class BuiltinRegistry:
+    def __init__(self):
+        self._commands = {}
+        self._pattern = None
+
+    def register(self, name, handler, mode="argv", flags=(), usage=None):
+        """
+        登记一条内置指令；name 可以包含空格 (如 "memory search")，较长的名字优先匹配。
+        handler 可以是普通函数或协程函数；usage 为 text 指令缺少参数时返回的提示。
+        """
+        if mode not in MODES:
+            raise ValueError(f"未知的参数解析方式: {mode}，可选值: {', '.join(MODES)}")
+        self._commands[name] = BuiltinCommand(name, handler, mode, tuple(flags), usage)
+        self._pattern = None
+
+    @property
+    def names(self):
+        return list(self._commands)
+
+    def _compile(self):
+        names = sorted(self._commands, key=len, reverse=True)
+        alternatives = "|".join(r"\s+".join(map(re.escape, name.split())) for name in names)
+        return re.compile(rf"\s*({alternatives})(?=\s|\Z)")
+
+    @staticmethod
+    def _strip_flags(flags, text):
+        """去掉出现在文本开头或结尾、以空白分隔的开关 (引号内的同名文字不受影响)"""
+        found = set()
+        stripped = True
+        while stripped:
+            stripped = False
+            for flag in flags:
+                size = len(flag)
+                if text.startswith(flag) and (len(text) == size or text[size].isspace()):
+                    text = text[size:].lstrip()
+                elif text.endswith(flag) and (len(text) == size or text[-size - 1].isspace()):
+                    text = text[:-size].rstrip()
+                else:
+                    continue
+                found.add(flag)
+                stripped = True
+        return text, found
+
+    def match(self, command):
+        """
+        返回 (指令, 参数元组, 之后的命令)；不是内置指令时返回 None。
+        一个代码块中写了多行命令时，本条指令只取到它自己的行尾 (text 指令取到配对引号所在行)，
+        其余各行作为"之后的命令"返回，由 dispatch 逐条处理。
+        """
+        if self._pattern is None:
+            self._pattern = self._compile()
+        match = self._pattern.match(command)
+        if match is None:
+            return None
+        name = match.group(1)
+        spec = self._commands.get(name) or self._commands[" ".join(name.split())]
+        rest = command[match.end():].strip()
+        if spec.mode == "text":
+            rest, following = split_text(rest, spec.flags)
+            if not spec.flags:
+                return spec, (parse_text(rest),), following
+            rest, found = self._strip_flags(spec.flags, rest)
+            return spec, (parse_text(rest), found), following
+        rest, _, following = rest.partition("\n")
+        rest, following = rest.strip(), following.strip()
+        if spec.mode == "none":
+            return (spec, (), following) if not rest else None
+        return spec, (parse_argv(rest),), following
+
+    async def dispatch(self, command):
+        """
+        执行内置指令并返回结果；不是内置指令时返回 None。
+        代码块中的多条内置指令依次执行，结果逐行拼接；其后跟着的普通 Shell 命令不执行，
+        返回错误说明 (不会整块交给沙箱，避免前面的内置指令在容器中报错而丢失)。
+        """
+        results = []
+        while command:
+            found = self.match(command)
+            if found is None:
+                if not results:
+                    return None
+                results.append(f"错误: 以下命令未执行，内置指令之后的 Shell 命令请另起一个代码块:\n{command[:200]}")
+                break
+            spec, args, command = found
+            if spec.mode == "text" and not args[0]:
+                results.append(spec.usage or f"错误: {spec.name} 指令需要提供参数。")
+                continue
+            result = spec.handler(*args)
+            if inspect.isawaitable(result):
+                result = await result
+            results.append(result)
+        return results[0] if len(results) == 1 else "\n".join(map(str, results))
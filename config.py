@@ -34,3 +34,182 @@ SHORT_TERM_MEMORY_FILE_PATH = "memory/short_term_memory.md"
 
 # 输出目录
 ALICE_OUTPUT_DIR = "alice_output"
+
+# 沙盒执行配置
+# 沙盒镜像名称
+SANDBOX_IMAGE = get_env_var("SANDBOX_IMAGE", "alice-sandbox:latest")
+
+# 是否启用容器内常驻执行内核 (关闭后回退为每个代码块一次 docker exec)
+SANDBOX_KERNEL_ENABLED = get_env_var("SANDBOX_KERNEL_ENABLED", "true").lower() == "true"
+
+# 单个代码块的执行超时 (秒)
+EXECUTION_TIMEOUT = int(get_env_var("EXECUTION_TIMEOUT", "120"))
+
+# 单个代码块反馈给模型的输出上限 (字节)，超出后仅保留开头与结尾，完整输出另存到文件
+EXEC_OUTPUT_MAX_BYTES = int(get_env_var("EXEC_OUTPUT_MAX_BYTES", "16000"))
+
+# 是否在终端实时显示代码块的输出
+EXEC_LIVE_OUTPUT = get_env_var("EXEC_LIVE_OUTPUT", "true").lower() == "true"
+
+# 超长输出的完整记录目录 (位于已挂载的输出目录下，容器内可分页查看)
+EXEC_SPILL_DIR = os.path.join(ALICE_OUTPUT_DIR, "exec_logs")
+
+# 代码块并行模式: off (严格按文档顺序串行) / marked (仅并行 ```bash parallel 标记的代码块) / auto (额外并行只读命令)
+EXEC_PARALLEL_MODE = get_env_var("EXEC_PARALLEL_MODE", "marked").lower()
+
+# 并行代码块的工作槽位数 (即额外的容器内核会话数)
+EXEC_PARALLEL_WORKERS = int(get_env_var("EXEC_PARALLEL_WORKERS", "4"))
+
+# 工具调用方式: fence (从回答中的 ```python / ```bash 代码块提取) / native (注册为结构化 OpenAI tools，
+# 支持一次回答中的多个并行调用，回答中的代码块仍会照常执行)
+TOOL_CALL_MODE = get_env_var("TOOL_CALL_MODE", "fence").lower()
+
+# 工具轮之后的系统消息刷新方式: speculative (已提交的代码块全部执行完毕即在线程池中投机刷新，与模型继续生成、
+# 组装执行反馈并行) / inline (组装完执行反馈后在事件循环中同步刷新)
+SYSTEM_REFRESH_MODE = get_env_var("SYSTEM_REFRESH_MODE", "speculative").lower()
+
+# 上下文管理配置
+# 每次请求的上下文 token 预算 (估算值)，超出后分级压缩历史消息
+CONTEXT_TOKEN_BUDGET = int(get_env_var("CONTEXT_TOKEN_BUDGET", "60000"))
+
+# 始终完整保留的最近对话轮数
+CONTEXT_KEEP_TURNS = int(get_env_var("CONTEXT_KEEP_TURNS", "4"))
+
+# 较早轮次中单条工具反馈压缩后保留的最大字符数
+CONTEXT_FEEDBACK_CHARS = int(get_env_var("CONTEXT_FEEDBACK_CHARS", "2000"))
+
+# 记忆注入配置
+# 记忆注入模式: retrieval (仅注入与当前输入相关的条目) / full (全量注入记忆文件)
+MEMORY_INJECTION_MODE = get_env_var("MEMORY_INJECTION_MODE", "retrieval").lower()
+
+# 检索模式下注入的最相关条目数
+MEMORY_TOP_K = int(get_env_var("MEMORY_TOP_K", "8"))
+
+# 检索模式下额外注入的最近短期记忆条目数
+MEMORY_RECENT_ENTRIES = int(get_env_var("MEMORY_RECENT_ENTRIES", "5"))
+
+# 检索模式下注入记忆的字节预算
+MEMORY_BYTE_BUDGET = int(get_env_var("MEMORY_BYTE_BUDGET", "4000"))
+
+# 记忆日志路径 (LTM/STM 的唯一数据源，memory/*.md 为其渲染视图)
+MEMORY_LOG_PATH = "memory/memory_log.jsonl"
+
+# 记忆提炼配置
+# 单个提炼分块的 token 预算 (估算值)，过期短期记忆按此切分后并行提炼
+DISTILL_CHUNK_TOKENS = int(get_env_var("DISTILL_CHUNK_TOKENS", "6000"))
+
+# 并行提炼请求数
+DISTILL_CONCURRENCY = int(get_env_var("DISTILL_CONCURRENCY", "4"))
+
+# 提炼进度检查点路径 (重试时跳过已完成的分块)
+DISTILL_CHECKPOINT_PATH = "memory/distill_checkpoint.json"
+
+# 沙盒只读命令的结果缓存 (命令与挂载目录均未变化时复用上次结果，不再进入容器)
+TOOL_CACHE_ENABLED = get_env_var("TOOL_CACHE_ENABLED", "true").lower() == "true"
+
+# 每个会话缓存的结果条数上限，超出后淘汰最久未使用的
+TOOL_CACHE_MAX_ENTRIES = int(get_env_var("TOOL_CACHE_MAX_ENTRIES", "128"))
+
+# 历史消息保留策略
+# 推理内容的保留方式: discard 每次回答结束后丢弃; archive 追加写入 REASONING_ARCHIVE_DIR 下的会话文件
+REASONING_RETENTION = get_env_var("REASONING_RETENTION", "discard").lower()
+REASONING_ARCHIVE_DIR = get_env_var("REASONING_ARCHIVE_DIR", "logs/reasoning")
+
+# 工具反馈在消息历史中保留原文的轮数，更早的替换为摘要并把原文归档到输出目录 (0 表示不归档)
+HISTORY_FEEDBACK_KEEP_TURNS = int(get_env_var("HISTORY_FEEDBACK_KEEP_TURNS", "3"))
+
+# 归档后的摘要保留的字符数
+HISTORY_DIGEST_CHARS = int(get_env_var("HISTORY_DIGEST_CHARS", "600"))
+
+# 工具反馈原文的归档目录 (位于已挂载的输出目录下，容器内可直接读取)
+HISTORY_ARCHIVE_DIR = os.path.join(ALICE_OUTPUT_DIR, "exec_logs", "history")
+
+# 终端流式输出的合并刷新间隔 (毫秒)，0 表示逐块输出
+TERMINAL_FLUSH_INTERVAL_MS = int(get_env_var("TERMINAL_FLUSH_INTERVAL_MS", "50"))
+
+# 会话持久化：消息与工具反馈追加写入 <目录>/<会话 ID>.jsonl，可用 main.py --resume <会话 ID> 恢复
+SESSION_LOG_ENABLED = get_env_var("SESSION_LOG_ENABLED", "true").lower() == "true"
+SESSION_LOG_DIR = get_env_var("SESSION_LOG_DIR", "logs/sessions")
+
+# 会话日志的批量 fsync 间隔 (秒)；每轮对话结束与退出时总会落盘
+SESSION_FSYNC_INTERVAL = float(get_env_var("SESSION_FSYNC_INTERVAL", "1.0"))
+
+# 性能追踪配置
+# 是否记录逐轮性能 span (LLM 首 token 延迟、生成速率、代码块耗时等)
+TELEMETRY_ENABLED = get_env_var("TELEMETRY_ENABLED", "true").lower() == "true"
+
+# 追踪文件路径 (JSONL，不挂载进容器)
+TELEMETRY_TRACE_PATH = get_env_var("TELEMETRY_TRACE_PATH", "logs/trace.jsonl")
+
+# 单个追踪文件的大小上限 (字节)，超出后滚动
+TELEMETRY_MAX_BYTES = int(get_env_var("TELEMETRY_MAX_BYTES", str(5 * 1024 * 1024)))
+
+# 保留的历史追踪文件数
+TELEMETRY_BACKUPS = int(get_env_var("TELEMETRY_BACKUPS", "3"))
+
+# LLM 传输层配置
+# 连接池上限与保持的空闲长连接数
+LLM_MAX_CONNECTIONS = int(get_env_var("LLM_MAX_CONNECTIONS", "20"))
+LLM_KEEPALIVE_CONNECTIONS = int(get_env_var("LLM_KEEPALIVE_CONNECTIONS", "10"))
+
+# 空闲长连接的保持时间 (秒)
+LLM_KEEPALIVE_EXPIRY = float(get_env_var("LLM_KEEPALIVE_EXPIRY", "60"))
+
+# 是否启用 HTTP/2 (需要安装 h2，未安装时回退为 HTTP/1.1)
+LLM_HTTP2 = get_env_var("LLM_HTTP2", "false").lower() == "true"
+
+# 建立连接超时与读取超时 (秒)；读取超时即两个流式分块之间允许的最长间隔
+LLM_CONNECT_TIMEOUT = float(get_env_var("LLM_CONNECT_TIMEOUT", "10"))
+LLM_READ_TIMEOUT = float(get_env_var("LLM_READ_TIMEOUT", "120"))
+
+# 收到首个 token 之前的最大重试次数 (指数退避 + 随机抖动)
+LLM_MAX_RETRIES = int(get_env_var("LLM_MAX_RETRIES", "3"))
+
+# 退避的基础间隔与上限 (秒)
+LLM_RETRY_BASE_DELAY = float(get_env_var("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(get_env_var("LLM_RETRY_MAX_DELAY", "8"))
+
+# 流式回答中途断开后，携带已生成内容续传的最大次数
+LLM_RESUME_ATTEMPTS = int(get_env_var("LLM_RESUME_ATTEMPTS", "2"))
+
+# LLM 录制/回放缓存配置
+# 缓存模式: passthrough 不缓存; record 命中回放、未命中请求并录制; replay 只回放 (未命中即报错)
+LLM_CACHE_MODE = get_env_var("LLM_CACHE_MODE", "passthrough").lower()
+
+# 缓存目录 (每条记录一个 gzip 文件)
+LLM_CACHE_DIR = get_env_var("LLM_CACHE_DIR", "cache/llm")
+
+# 缓存总大小上限 (字节)，超出后淘汰最久未使用的记录
+LLM_CACHE_MAX_BYTES = int(get_env_var("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# 回放节奏: fast 全速输出; recorded 按录制时的时间间隔输出
+LLM_CACHE_TIMING = get_env_var("LLM_CACHE_TIMING", "fast").lower()
+
+# 服务模式配置 (server.py)
+# 监听地址与端口
+SERVER_HOST = get_env_var("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(get_env_var("SERVER_PORT", "8765"))
+
+# 沙盒容器池大小，即可同时存在的会话数上限
+SANDBOX_POOL_SIZE = int(get_env_var("SANDBOX_POOL_SIZE", "4"))
+
+# 容器池中容器的名称前缀 (容器名为 <前缀>-<序号>)
+SANDBOX_POOL_PREFIX = get_env_var("SANDBOX_POOL_PREFIX", "alice-sandbox-pool")
+
+# 容器池耗尽时，新会话排队等待空闲容器的最长时间 (秒)，超时返回 503
+SANDBOX_POOL_WAIT = float(get_env_var("SANDBOX_POOL_WAIT", "10"))
+
+# 同时排队等待容器的请求数上限，超出后立即返回 503
+SANDBOX_POOL_MAX_WAITERS = int(get_env_var("SANDBOX_POOL_MAX_WAITERS", "16"))
+
+# 关闭忙碌的会话时等待其当前轮次中断结束的最长时间 (秒)，超时则取消该轮并重启容器
+SESSION_CLOSE_WAIT = float(get_env_var("SESSION_CLOSE_WAIT", "10"))
+
+# 会话空闲多久 (秒) 后自动关闭并回收其容器
+SESSION_IDLE_TIMEOUT = int(get_env_var("SESSION_IDLE_TIMEOUT", "600"))
+
+# 服务与批量模式下各会话专属任务清单的目录 (宿主机，不挂载进容器；人设文件为所有会话共用，这两种模式下不允许修改)
+SESSION_TODO_DIR = os.path.join("memory", "sessions")
+
+# 会话工作目录的根目录 (位于已挂载的输出目录下，容器内为 /app/alice_output/sessions/<会话 ID>)
+SESSION_ROOT_DIR = os.path.join(ALICE_OUTPUT_DIR, "sessions")
@@ -0,0 +1,190 @@
+import re
+from collections import deque
+
+# 工具执行反馈消息的固定前缀 (由 AliceAgent.chat 生成)
+FEEDBACK_PREFIX = "容器执行反馈："
+# 早期对话摘要消息的固定前缀
+SUMMARY_PREFIX = "【早期对话摘要】"
+
+CODE_BLOCK = re.compile(r'```.*?```', re.DOTALL)
+
+
+def estimate_tokens(text):
+    """
+    快速估算 token 数：非 ASCII 字符 (主要是中文) 约 1 token/字，ASCII 约 4 字符/token。
+    只用到 len 与 encode 两个 C 层操作，不依赖分词器。
+    """
+    if not text:
+        return 0
+    chars = len(text)
+    extra_bytes = len(text.encode("utf-8")) - chars
+    non_ascii = extra_bytes // 2 # 中文在 UTF-8 下占 3 字节
+    return non_ascii + (chars - non_ascii + 3) // 4
+
+
+class ContextManager:
+    """
+    对话上下文的 token 预算管理
+    每次请求前估算 messages 的 token 数（按消息内容缓存），超出预算时分级压缩：
+    1. 截断较早轮次中的工具执行反馈，仅保留首尾；
+    2. 将较早的轮次合并为一条本地生成的摘要消息；
+    3. 仍然超限时，逐步缩短摘要并截断近期轮次（当前轮除外）中的工具反馈。
+    系统消息与最近 keep_turns 轮对话始终保留。
+    """
+    MESSAGE_OVERHEAD = 4 # 每条消息的角色与分隔符开销
+    CACHE_LIMIT = 4096
+
+    def __init__(self, budget=60000, keep_turns=4, feedback_chars=2000, summary_chars=4000):
+        self.budget = budget
+        self.keep_turns = max(1, keep_turns)
+        self.feedback_chars = feedback_chars
+        self.summary_chars = summary_chars
+        self._cache = {}
+        self.last_stats = {}
+        self.requests = deque(maxlen=200) # 最近的逐次请求统计
+        self.tokens_saved = 0
+
+    # ---- token 估算 ----
+    def count(self, message):
+        content = message.get("content") or ""
+        if message.get("tool_calls"):
+            content += "".join(call["function"]["arguments"] for call in message["tool_calls"])
+        # 以 (长度, 哈希) 为键，缓存不持有消息原文，已被压缩或归档的旧内容可以及时释放
+        key = (len(content), hash(content))
+        tokens = self._cache.get(key)
+        if tokens is None:
+            if len(self._cache) >= self.CACHE_LIMIT:
+                self._cache.clear()
+            tokens = estimate_tokens(content)
+            self._cache[key] = tokens
+        return tokens + self.MESSAGE_OVERHEAD
+
+    def total(self, messages):
+        return sum(self.count(m) for m in messages)
+
+    # ---- 轮次划分 ----
+    @staticmethod
+    def is_turn_start(message):
+        """真实用户输入开启一个新轮次；工具反馈与摘要消息不算"""
+        if message.get("role") != "user":
+            return False
+        content = message.get("content") or ""
+        return not content.startswith(FEEDBACK_PREFIX) and not content.startswith(SUMMARY_PREFIX)
+
+    @staticmethod
+    def is_feedback(message):
+        """工具执行反馈：回答中代码块的执行反馈，或结构化工具调用的 tool 消息"""
+        if message.get("role") == "tool":
+            return True
+        return message.get("role") == "user" and (message.get("content") or "").startswith(FEEDBACK_PREFIX)
+
+    def _split_turns(self, messages):
+        """拆分为 (系统消息, 已有摘要, 轮次列表)"""
+        system = messages[:1] if messages and messages[0].get("role") == "system" else []
+        rest = messages[len(system):]
+        summary = None
+        if rest and (rest[0].get("content") or "").startswith(SUMMARY_PREFIX):
+            summary, rest = rest[0], rest[1:]
+        turns = []
+        for message in rest:
+            if self.is_turn_start(message) or not turns:
+                turns.append([message])
+            else:
+                turns[-1].append(message)
+        return system, summary, turns
+
+    # ---- 压缩 ----
+    def _truncate(self, content, limit):
+        if len(content) <= limit:
+            return content
+        head = limit * 2 // 3
+        tail = limit - head
+        omitted = len(content) - head - tail
+        return f"{content[:head]}\n…[已截断 {omitted} 字符]…\n{content[-tail:]}"
+
+    def _truncate_feedback(self, turns, limit):
+        compacted = []
+        for turn in turns:
+            new_turn = []
+            for message in turn:
+                content = message.get("content") or ""
+                if self.is_feedback(message) and len(content) > limit:
+                    message = dict(message, content=self._truncate(content, limit))
+                new_turn.append(message)
+            compacted.append(new_turn)
+        return compacted
+
+    def _summarize_turn(self, turn):
+        user_text = (turn[0].get("content") or "").strip().replace("\n", " ")
+        lines = [f"- 用户: {user_text[:100]}{'…' if len(user_text) > 100 else ''}"]
+        replies = [m for m in turn if m.get("role") == "assistant" and m.get("content")]
+        if replies:
+            reply = CODE_BLOCK.sub("[代码块]", replies[-1]["content"]).strip().replace("\n", " ")
+            lines.append(f"  Alice: {reply[:160]}{'…' if len(reply) > 160 else ''}")
+        tool_rounds = sum(1 for m, following in zip(turn, turn[1:])
+                          if m.get("role") == "assistant" and self.is_feedback(following))
+        if tool_rounds:
+            lines.append(f"  (执行了 {tool_rounds} 轮工具调用)")
+        return "\n".join(lines)
+
+    def _build_summary(self, summary, turns, limit):
+        previous = ""
+        if summary:
+            previous = summary["content"][len(SUMMARY_PREFIX):].strip()
+        body = "\n".join(filter(None, [previous] + [self._summarize_turn(t) for t in turns]))
+        if len(body) > limit:
+            # 丢弃最早的摘要内容，保留行边界
+            body = body[-limit:]
+            body = body[body.find("\n- ") + 1:] if "\n- " in body else body
+        return {"role": "user", "content": f"{SUMMARY_PREFIX}以下是更早对话的要点，完整记录已不在上下文中：\n{body}"}
+
+    @staticmethod
+    def _flatten(system, summary, turns):
+        messages = list(system)
+        if summary:
+            messages.append(summary)
+        for turn in turns:
+            messages.extend(turn)
+        return messages
+
+    def compact(self, messages):
+        """在预算内返回压缩后的消息列表，并记录本次请求的 token 统计"""
+        before = self.total(messages)
+        tiers = []
+        result = messages
+        if before > self.budget:
+            system, summary, turns = self._split_turns(messages)
+            pinned = max(0, len(turns) - self.keep_turns)
+            old, recent = turns[:pinned], turns[pinned:]
+
+            # 第一级：截断较早轮次中的工具反馈
+            old = self._truncate_feedback(old, self.feedback_chars)
+            tiers.append("truncate_feedback")
+            result = self._flatten(system, summary, old + recent)
+
+            # 第二级：较早轮次合并为摘要
+            if self.total(result) > self.budget and old:
+                summary = self._build_summary(summary, old, self.summary_chars)
+                old = []
+                tiers.append("summarize")
+                result = self._flatten(system, summary, recent)
+
+            # 第三级：缩短摘要，并截断近期轮次中的工具反馈 (当前轮除外)
+            if self.total(result) > self.budget:
+                if summary:
+                    summary = self._build_summary(summary, [], self.summary_chars // 4)
+                recent = self._truncate_feedback(recent[:-1], self.feedback_chars // 4) + recent[-1:]
+                tiers.append("shrink_recent")
+                result = self._flatten(system, summary, recent)
+
+        after = self.total(result) if tiers else before
+        self.tokens_saved += before - after
+        self.last_stats = {
+            "messages": len(result),
+            "tokens_before": before,
+            "tokens_after": after,
+            "budget": self.budget,
+            "tiers": tiers,
+        }
+        self.requests.append(self.last_stats)
+        return result
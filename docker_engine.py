@@ -0,0 +1,219 @@
+import http.client
+import json
+import os
+import socket
+import subprocess
+import threading
+import time
+from urllib.parse import quote
+
+
+class DockerError(Exception):
+    """Docker 引擎不可用或调用失败"""
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=10):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class DockerEngine:
+    """
+    轻量 Docker 客户端
+    优先通过 unix socket 直接调用 Docker Engine API (免去每次 fork docker CLI 的开销)；
+    socket 不可用时回退为 docker CLI，并用一次 `docker inspect` 同时查询镜像与容器。
+    """
+    def __init__(self, socket_path=None, timeout=10):
+        host = os.environ.get("DOCKER_HOST", "")
+        if socket_path is None:
+            socket_path = host[len("unix://"):] if host.startswith("unix://") else "/var/run/docker.sock"
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.use_api = not host or host.startswith("unix://")
+
+    def _request(self, method, path, body=None):
+        conn = _UnixHTTPConnection(self.socket_path, self.timeout)
+        try:
+            headers = {"Content-Type": "application/json"} if body is not None else {}
+            conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+            response = conn.getresponse()
+            data = response.read()
+            return response.status, (json.loads(data) if data.strip() else None)
+        finally:
+            conn.close()
+
+    def ping(self):
+        """检查 Docker 引擎是否可用；API 不通时回退检查 CLI"""
+        if self.use_api:
+            try:
+                status, _ = self._request("GET", "/_ping")
+                if status == 200:
+                    return "api"
+            except (OSError, ValueError):
+                pass
+            self.use_api = False
+        try:
+            result = subprocess.run(["docker", "version", "--format", "{{.Server.Version}}"],
+                                    capture_output=True, text=True, timeout=self.timeout)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise DockerError(f"系统未检测到 Docker: {e}")
+        if result.returncode != 0:
+            raise DockerError(f"Docker 引擎不可用: {result.stderr.strip()}")
+        return "cli"
+
+    def inspect(self, image, container):
+        """一次性查询镜像与容器，返回 (镜像是否存在, 容器状态 dict 或 None)"""
+        if self.use_api:
+            status, _ = self._request("GET", f"/images/{quote(image, safe='')}/json")
+            image_exists = status == 200
+            status, data = self._request("GET", f"/containers/{quote(container, safe='')}/json")
+            return image_exists, (data.get("State") if status == 200 else None)
+
+        # CLI 回退：一次 docker inspect 同时返回两者 (任一不存在时退出码非零，但已找到的对象仍会输出)
+        result = subprocess.run(["docker", "inspect", image, container],
+                                capture_output=True, text=True, timeout=self.timeout)
+        try:
+            objects = json.loads(result.stdout or "[]")
+        except ValueError:
+            objects = []
+        image_exists, state = False, None
+        for obj in objects:
+            if "State" in obj and obj.get("Name", "").lstrip("/") == container:
+                state = obj["State"]
+            elif image in obj.get("RepoTags", []) or obj.get("Id") == image:
+                image_exists = True
+        return image_exists, state
+
+    def create_container(self, name, image, binds, workdir, cmd):
+        if self.use_api:
+            body = {
+                "Image": image,
+                "Cmd": cmd,
+                "WorkingDir": workdir,
+                "HostConfig": {"Binds": binds, "RestartPolicy": {"Name": "always"}},
+            }
+            status, data = self._request("POST", f"/containers/create?name={quote(name, safe='')}", body)
+            if status not in (200, 201):
+                raise DockerError(f"创建容器失败: {(data or {}).get('message', status)}")
+            return
+        command = ["docker", "create", "--name", name, "--restart", "always", "-w", workdir]
+        for bind in binds:
+            command += ["-v", bind]
+        result = subprocess.run(command + [image] + cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise DockerError(f"创建容器失败: {result.stderr.strip()}")
+
+    def start_container(self, name):
+        if self.use_api:
+            status, data = self._request("POST", f"/containers/{quote(name, safe='')}/start")
+            if status not in (204, 304):
+                raise DockerError(f"启动容器失败: {(data or {}).get('message', status)}")
+            return
+        result = subprocess.run(["docker", "start", name], capture_output=True, text=True)
+        if result.returncode != 0:
+            raise DockerError(f"启动容器失败: {result.stderr.strip()}")
+
+    def restart_container(self, name, timeout=0):
+        """重启容器 (结束容器内的全部进程)，timeout 为强制结束前的等待秒数"""
+        if self.use_api:
+            status, data = self._request("POST", f"/containers/{quote(name, safe='')}/restart?t={timeout}")
+            if status != 204:
+                raise DockerError(f"重启容器失败: {(data or {}).get('message', status)}")
+            return
+        result = subprocess.run(["docker", "restart", "-t", str(timeout), name], capture_output=True, text=True)
+        if result.returncode != 0:
+            raise DockerError(f"重启容器失败: {result.stderr.strip()}")
+
+    def build_image(self, image, dockerfile, context="."):
+        """构建镜像 (沿用 docker CLI 以便实时输出构建进度)"""
+        process = subprocess.Popen(["docker", "build", "-t", image, "-f", dockerfile, context],
+                                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        for line in process.stdout:
+            print(f"  [Docker Build]: {line.strip()}")
+        process.wait()
+        if process.returncode != 0:
+            raise DockerError("Docker 镜像构建失败。请检查 Dockerfile.sandbox 或网络连接。")
+
+
+class SandboxBootstrap:
+    """
+    沙盒环境的后台引导
+    在独立线程中完成 Docker 检测、镜像构建与常驻容器唤醒，与记忆、快照的加载重叠进行；
+    只有真正需要执行代码块时才等待其完成。各阶段耗时记录在 timings (毫秒) 中。
+    """
+    def __init__(self, image, container_name, mounts, dockerfile="Dockerfile.sandbox", workdir="/app"):
+        self.image = image
+        self.container_name = container_name
+        self.mounts = mounts # [(宿主机路径, 容器路径)]
+        self.dockerfile = dockerfile
+        self.workdir = workdir
+        self.engine = DockerEngine()
+        self.engine_mode = None # "api" 或 "cli"
+        self.timings = {}
+        self.error = None
+        self._done = threading.Event()
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self._done.is_set() and self.error is None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="alice-bootstrap", daemon=True)
+            self._thread.start()
+
+    def wait(self, timeout=None):
+        """等待引导完成；失败时抛出 DockerError"""
+        self.start()
+        if not self._done.wait(timeout):
+            raise DockerError("沙盒环境启动超时。")
+        if self.error is not None:
+            raise self.error
+
+    def _phase(self, name, func, *args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.timings[name] = (time.perf_counter() - start) * 1000
+
+    def _run(self):
+        try:
+            # 1. 检查 Docker 引擎
+            self.engine_mode = self._phase("engine", self.engine.ping)
+
+            # 2. 一次查询镜像与容器状态
+            image_exists, state = self._phase("inspect", self.engine.inspect, self.image, self.container_name)
+
+            # 3. 缺少镜像时自动构建
+            if not image_exists:
+                print(f"[系统]: 未找到 Docker 镜像 {self.image}，正在启动全自动构建流程...")
+                print(f"[系统]: 这可能需要几分钟，请稍候...")
+                self._phase("build", self.engine.build_image, self.image, self.dockerfile)
+                print(f"[系统]: 镜像 {self.image} 构建成功。")
+
+            # 4. 检查/启动常驻容器 (最小化权限挂载模式)
+            if state is None:
+                for host_path, _ in self.mounts:
+                    os.makedirs(host_path, exist_ok=True)
+                binds = [f"{os.path.abspath(host)}:{target}" for host, target in self.mounts]
+                print(f"[系统]: 正在初始化 Alice 常驻实验室容器 (最小权限隔离模式)...")
+                self._phase("create", self.engine.create_container, self.container_name, self.image,
+                            binds, self.workdir, ["tail", "-f", "/dev/null"])
+                self._phase("start", self.engine.start_container, self.container_name)
+            elif not state.get("Running"):
+                self._phase("start", self.engine.start_container, self.container_name)
+        except DockerError as e:
+            self.error = e
+        except Exception as e:
+            self.error = DockerError(f"初始化 Docker 环境时出错: {e}")
+        finally:
+            self._done.set()
@@ -0,0 +1,105 @@
+import asyncio
+import re
+
+# 可自动并行的只读命令 (仅在 auto 模式下生效)
+READ_ONLY_COMMANDS = {
+    "cat", "ls", "head", "tail", "wc", "grep", "find", "tree", "pwd",
+    "stat", "du", "df", "file", "which", "date", "whoami",
+}
+READ_ONLY_TOOLKIT = re.compile(r'^toolkit(\s+(list|info\s+\S+))?\s*$')
+UNSAFE_SHELL = re.compile(r'>|\$\(|`|(^|\s)-(delete|exec|execdir|ok)\b')
+SHELL_SPLIT = re.compile(r'&&|\|\||[;|&\n]')
+
+
+def is_read_only_command(command):
+    """粗粒度判断 bash 代码块是否只读：每一段管道/串联命令都必须以只读命令开头且无重定向"""
+    command = command.strip()
+    if not command:
+        return False
+    if READ_ONLY_TOOLKIT.match(command):
+        return True
+    if UNSAFE_SHELL.search(command):
+        return False
+    for segment in SHELL_SPLIT.split(command):
+        words = segment.split()
+        if words and words[0] not in READ_ONLY_COMMANDS:
+            return False
+    return True
+
+
+class ExecutionScheduler:
+    """
+    代码块执行调度器
+    默认严格按文档顺序串行执行；被标记为可并行的 bash 代码块（围栏写作 ```bash parallel，
+    或 auto 模式下的只读命令）会被分发到有界的工作槽位并发执行。
+    Python 代码块始终串行：并行槽位是独立的解释器，看不到也改不了主会话中的变量，
+    即使标记了 parallel 也在槽位 0 执行。
+    调度语义类似屏障：串行块需等待之前所有代码块完成，可并行块只需等待之前最近的串行块。
+    结果的收集顺序始终与文档顺序一致。
+
+    槽位 0 保留给串行块（即主会话），槽位 1..workers 供并行块租用。
+    """
+    MODES = ("off", "marked", "auto")
+
+    def __init__(self, runner, workers=4, mode="marked"):
+        if mode not in self.MODES:
+            raise ValueError(f"未知的并行模式: {mode}，可选值: {', '.join(self.MODES)}")
+        self.runner = runner # async runner(block, slot) -> 执行结果文本
+        self.mode = mode
+        self.workers = max(1, workers)
+        self._slots = None # 空闲的并行槽位，首次使用时在事件循环中创建
+        self._tasks = set()
+        self._barrier = None
+        self._group = []
+
+    def begin_turn(self):
+        """开始新一轮调度（上一轮的所有代码块均已收集完毕）"""
+        self._barrier = None
+        self._group = []
+
+    def is_parallel(self, block):
+        if self.mode == "off":
+            return False
+        if block.lang != "bash":
+            return False # 只有主会话 (槽位 0) 持有 Python 变量与导入
+        if block.parallel:
+            return True
+        return self.mode == "auto" and is_read_only_command(block.code)
+
+    def submit(self, block):
+        """提交一个代码块 (需在事件循环中调用)，返回其执行结果的 Task"""
+        if self.is_parallel(block):
+            deps = [self._barrier] if self._barrier else []
+            task = asyncio.ensure_future(self._run_parallel(deps, block))
+            self._group.append(task)
+        else:
+            deps = ([self._barrier] if self._barrier else []) + self._group
+            task = asyncio.ensure_future(self._run_serial(deps, block))
+            self._barrier = task
+            self._group = []
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _run_serial(self, deps, block):
+        if deps:
+            await asyncio.wait(deps)
+        return await self.runner(block, 0)
+
+    async def _run_parallel(self, deps, block):
+        if deps:
+            await asyncio.wait(deps)
+        if self._slots is None:
+            self._slots = asyncio.Queue()
+            for slot in range(1, self.workers + 1):
+                self._slots.put_nowait(slot)
+        slot = await self._slots.get()
+        try:
+            return await self.runner(block, slot)
+        finally:
+            self._slots.put_nowait(slot)
+
+    def shutdown(self):
+        """取消尚未完成的代码块"""
+        for task in list(self._tasks):
+            task.cancel()
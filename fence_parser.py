@@ -0,0 +1,46 @@
+import re
+from collections import namedtuple
+
+# call_id / arguments 仅结构化工具调用 (见 tool_calls.py) 产生的代码块才有
+CodeBlock = namedtuple("CodeBlock", ["index", "lang", "code", "parallel", "call_id", "arguments"], defaults=(None, None))
+
+
+class FenceParser:
+    """
+    增量式代码块解析器
+    在模型流式输出的过程中逐段喂入 delta，每当一个 ```python / ```bash 代码块的
+    闭合围栏到达时立即产出该代码块，使工具执行与后续 token 的生成相互重叠。
+    解析规则与对完整回复执行 re.findall 的结果保持一致；
+    围栏信息中的 `parallel` 标记 (如 ```bash parallel) 表示该代码块允许并行执行 (仅对 bash 生效，见 ExecutionScheduler)。
+    """
+    PATTERN = re.compile(r'```(python|bash)(?:[ \t]+(parallel)\b)?\s*\n?(.*?)\s*```', re.DOTALL)
+
+    def __init__(self):
+        self._parts = []
+        self._text = ""
+        self._pos = 0
+        self._count = 0
+
+    def feed(self, delta):
+        """喂入一段增量文本，返回本次新闭合的代码块列表 (按文档顺序)"""
+        if not delta:
+            return []
+        self._parts.append(delta)
+        # 只有出现反引号时才可能闭合围栏，其余 delta 只做累积，避免反复拼接与扫描
+        if "`" not in delta:
+            return []
+        return self._scan()
+
+    def _scan(self):
+        if self._parts:
+            self._text += "".join(self._parts)
+            self._parts = []
+        blocks = []
+        while True:
+            match = self.PATTERN.search(self._text, self._pos)
+            if not match:
+                break
+            blocks.append(CodeBlock(self._count, match.group(1), match.group(3).strip(), bool(match.group(2))))
+            self._count += 1
+            self._pos = match.end()
+        return blocks
@@ -0,0 +1,187 @@
+"""
+对话历史的保留策略
+
+长时间运行的会话中，消息历史与流式输出是内存和 token 的主要来源：
+- TextBuffer:      流式增量分块存入列表，需要时才拼接，避免逐块 += 的重复拷贝；
+- OutputCoalescer: 终端输出按短时间间隔合并后再写入与刷新，而不是每个分块一次 flush；
+- HistoryPolicy:   推理内容每轮结束后丢弃或归档到磁盘，不留在内存中；
+                   早于最近 N 轮的工具反馈替换为摘要，原文写入已挂载的输出目录，摘要中附带容器内路径。
+"""
+import asyncio
+import json
+import os
+import re
+import sys
+from datetime import datetime
+from context_manager import ContextManager, FEEDBACK_PREFIX
+
+ARCHIVED_MARK = "[已归档]"
+
+
+class TextBuffer:
+    """流式增量的累积：分块存入列表，按需拼接 (拼接结果会被缓存)"""
+    __slots__ = ("_parts", "_length")
+
+    def __init__(self):
+        self._parts = []
+        self._length = 0
+
+    def append(self, text):
+        self._parts.append(text)
+        self._length += len(text)
+
+    def text(self):
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def __len__(self):
+        return self._length
+
+    def __bool__(self):
+        return self._length > 0
+
+
+class OutputCoalescer:
+    """合并终端输出：interval 秒内的分块一次写入并刷新；interval 为 0 时逐块输出"""
+    def __init__(self, interval=0.05, stream=None):
+        self.interval = interval
+        self.stream = stream or sys.stdout
+        self._parts = []
+        self._handle = None
+
+    def write(self, text):
+        if not text:
+            return
+        self._parts.append(text)
+        if self.interval <= 0:
+            self.flush()
+            return
+        if self._handle is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self.flush()
+                return
+            self._handle = loop.call_later(self.interval, self.flush)
+
+    def flush(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self._parts:
+            self.stream.write("".join(self._parts))
+            self._parts = []
+            self.stream.flush()
+
+
+class HistoryPolicy:
+    """
+    单个会话的历史保留策略
+    reasoning_mode: discard 丢弃推理内容; archive 追加写入 <reasoning_dir>/<会话 ID>.jsonl
+    keep_turns:     工具反馈保留原文的轮数 (0 表示不归档)
+    """
+    def __init__(self, session_id, reasoning_mode="discard", reasoning_dir="logs/reasoning",
+                 keep_turns=3, digest_chars=600, archive_dir=None, container_root=None):
+        self.session_id = re.sub(r"[^\w.-]", "_", session_id)
+        self.reasoning_mode = reasoning_mode
+        self.reasoning_dir = reasoning_dir
+        self.keep_turns = keep_turns
+        self.digest_chars = digest_chars
+        self.archive_dir = archive_dir
+        self.container_root = container_root # (宿主机目录, 容器内目录)
+        self.stats = {"reasoning_archived": 0, "feedback_archived": 0, "chars_released": 0}
+        self._reasoning_file = None
+        self._sequence = 0
+
+    # ---- 推理内容 ----
+    def archive_reasoning(self, turn, round_index, text):
+        if self.reasoning_mode != "archive" or not text:
+            return
+        try:
+            if self._reasoning_file is None:
+                os.makedirs(self.reasoning_dir, exist_ok=True)
+                path = os.path.join(self.reasoning_dir, f"{self.session_id}.jsonl")
+                self._reasoning_file = open(path, "a", encoding="utf-8")
+            record = {"ts": datetime.now().isoformat(timespec="seconds"), "turn": turn, "round": round_index, "text": text}
+            self._reasoning_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._reasoning_file.flush()
+            self.stats["reasoning_archived"] += 1
+        except OSError as e:
+            print(f"归档推理内容失败: {e}")
+
+    # ---- 工具反馈 ----
+    def _display_path(self, path):
+        if self.container_root:
+            host_root, container_root = self.container_root
+            rel = os.path.relpath(path, host_root)
+            if not rel.startswith(".."):
+                return f"{container_root}/{rel.replace(os.sep, '/')}"
+        return path
+
+    @staticmethod
+    def _prefix(content):
+        # 结构化工具调用的 tool 消息没有反馈前缀
+        return FEEDBACK_PREFIX if content.startswith(FEEDBACK_PREFIX) else ""
+
+    def _digest(self, content, pointer):
+        prefix = self._prefix(content)
+        body = content[len(prefix):].strip()
+        head = self.digest_chars * 2 // 3
+        tail = self.digest_chars - head
+        omitted = len(body) - head - tail
+        digest = (f"{ARCHIVED_MARK} 完整内容 ({len(body)} 字符) 见 {pointer}\n"
+                  f"{body[:head]}\n…[已省略 {omitted} 字符]…\n{body[-tail:]}")
+        return f"{prefix}\n{digest}" if prefix else digest
+
+    def _archive_feedback(self, content):
+        self._sequence += 1
+        directory = os.path.join(self.archive_dir, self.session_id)
+        path = os.path.join(directory, f"feedback_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{self._sequence}.txt")
+        os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content[len(self._prefix(content)):].lstrip("\n"))
+        return self._display_path(path)
+
+    def slim(self, messages):
+        """把早于最近 keep_turns 轮的长工具反馈替换为摘要，返回 (新的消息列表, 归档条数)"""
+        if self.keep_turns <= 0 or self.archive_dir is None:
+            return messages, 0
+        # 从后往前数轮次，只处理保留区之前的消息
+        turns_seen = 0
+        boundary = 0
+        for index in range(len(messages) - 1, -1, -1):
+            if ContextManager.is_turn_start(messages[index]):
+                turns_seen += 1
+                if turns_seen == self.keep_turns:
+                    boundary = index
+                    break
+        if not boundary:
+            return messages, 0
+
+        archived = 0
+        result = messages
+        for index in range(boundary):
+            message = messages[index]
+            content = message.get("content") or ""
+            if (not ContextManager.is_feedback(message)
+                    or len(content) <= self.digest_chars * 2 or ARCHIVED_MARK in content[:80]):
+                continue
+            try:
+                pointer = self._archive_feedback(content)
+            except OSError as e:
+                print(f"归档工具反馈失败: {e}")
+                break
+            if result is messages:
+                result = list(messages)
+            digest = self._digest(content, pointer)
+            result[index] = dict(message, content=digest)
+            archived += 1
+            self.stats["feedback_archived"] += 1
+            self.stats["chars_released"] += len(content) - len(digest)
+        return result, archived
+
+    def close(self):
+        if self._reasoning_file is not None:
+            self._reasoning_file.close()
+            self._reasoning_file = None
@@ -0,0 +1,370 @@
+"""
+LLM 调用的录制/回放缓存
+
+包装 OpenAI 客户端的 chat.completions.create，以请求参数 (模型、消息、extra_body 等) 的哈希为键，
+把回答以紧凑格式存到磁盘，之后相同的请求直接从磁盘回放：
+    passthrough  不经过缓存 (默认)
+    record       命中则回放，未命中则照常请求并录制
+    replay       只回放，未命中时抛出 LLMCacheMiss (用于回归测试，保证不会联网)
+流式回答只保存每个分块的推理/正文/工具调用增量及其相对请求开始的时间，回放时可全速 (fast) 或按录制时的节奏 (recorded) 输出。
+每条记录一个 gzip 文件，总大小超过上限时按最近使用时间 (文件 mtime) 淘汰。
+被中断或出错的流不会写入缓存。
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+
+MODES = ("passthrough", "record", "replay")
+FORMAT_VERSION = 1
+
+
+class LLMCacheMiss(Exception):
+    """回放模式下请求不在缓存中"""
+
+
+def request_key(kwargs):
+    """请求参数的哈希 (键名排序，保证与参数传入顺序无关)"""
+    payload = json.dumps(kwargs, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _usage_dict(usage):
+    if usage is None:
+        return None
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "total_tokens": usage.total_tokens,
+    }
+
+
+def _usage_obj(usage):
+    return SimpleNamespace(**usage) if usage is not None else None
+
+
+class LLMCache:
+    """磁盘缓存：目录下每条记录一个 <键>.json.gz 文件，可被多个客户端与线程共享"""
+    def __init__(self, directory, mode="record", max_bytes=256 * 1024 * 1024, timing="fast"):
+        if mode not in MODES:
+            raise ValueError(f"未知的 LLM 缓存模式: {mode} (可选 {', '.join(MODES)})")
+        self.directory = directory
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.timing = timing
+        self.stats = {"hits": 0, "misses": 0, "records": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # 键 -> 文件大小，按最近使用排序
+        self._bytes = 0
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        found = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json.gz"):
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.name[:-len(".json.gz")], stat.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._bytes += size
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json.gz")
+
+    @property
+    def enabled(self):
+        return self.mode != "passthrough"
+
+    def load(self, key):
+        """读取一条记录并标记为最近使用，不存在时返回 None"""
+        path = self._path(key)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self._forget(key)
+            return None
+        if record.get("v") != FORMAT_VERSION:
+            return None
+        with self._lock:
+            self.stats["hits"] += 1
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        try:
+            os.utime(path) # mtime 即最近使用时间，重启后据此恢复淘汰顺序
+        except OSError:
+            pass
+        return record
+
+    def store(self, key, record):
+        record = dict(record, v=FORMAT_VERSION)
+        data = gzip.compress(json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"写入 LLM 缓存失败: {e}")
+            return
+        with self._lock:
+            self._forget(key)
+            self._entries[key] = len(data)
+            self._bytes += len(data)
+            self.stats["records"] += 1
+            self._evict()
+
+    def _forget(self, key):
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._bytes -= size
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.stats["evictions"] += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, mode=self.mode, entries=len(self._entries), bytes=self._bytes)
+
+    def miss(self, key):
+        """记录一次未命中；回放模式下直接抛出 LLMCacheMiss"""
+        with self._lock:
+            self.stats["misses"] += 1
+        if self.mode == "replay":
+            raise LLMCacheMiss(f"LLM 缓存中没有该请求的录制 (键 {key[:12]})，回放模式下不会发起真实请求。")
+
+
+# ---- 流式回答的录制与回放 ----
+
+class _Recorder:
+    """累积流式分块：[相对请求开始的毫秒数, "r"/"c", 增量文本] 或 [毫秒数, "t", [index, id, name, arguments]]"""
+    def __init__(self, start):
+        self.start = start
+        self.events = []
+        self.usage = None
+        self.finish_reason = None
+
+    def add(self, chunk):
+        if getattr(chunk, "usage", None):
+            self.usage = _usage_dict(chunk.usage)
+        if not chunk.choices:
+            return
+        choice = chunk.choices[0]
+        if choice.finish_reason:
+            self.finish_reason = choice.finish_reason
+        delta = choice.delta
+        offset = round((time.perf_counter() - self.start) * 1000, 1)
+        reasoning = getattr(delta, "reasoning_content", None)
+        if reasoning:
+            self.events.append([offset, "r", reasoning])
+        if delta.content:
+            self.events.append([offset, "c", delta.content])
+        for call in getattr(delta, "tool_calls", None) or []:
+            function = call.function
+            self.events.append([offset, "t", [call.index, call.id, function and function.name,
+                                              function and function.arguments]])
+
+    def record(self, model):
+        return {"model": model, "stream": True, "events": self.events,
+                "usage": self.usage, "finish_reason": self.finish_reason}
+
+
+def _replay_chunks(record):
+    """把录制的增量还原为与 ChatCompletionChunk 同形的对象，附带相对时间 (秒)"""
+    for offset, kind, text in record["events"]:
+        delta = SimpleNamespace(role="assistant", content=None, reasoning_content=None, tool_calls=None)
+        if kind == "r":
+            delta.reasoning_content = text
+        elif kind == "t":
+            index, call_id, name, arguments = text
+            delta.tool_calls = [SimpleNamespace(index=index, id=call_id, type="function" if call_id else None,
+                                                function=SimpleNamespace(name=name, arguments=arguments))]
+        else:
+            delta.content = text
+        yield offset / 1000, SimpleNamespace(
+            model=record["model"], usage=None,
+            choices=[SimpleNamespace(index=0, delta=delta, finish_reason=None)]
+        )
+    final = SimpleNamespace(role="assistant", content=None, reasoning_content=None, tool_calls=None)
+    yield None, SimpleNamespace(
+        model=record["model"], usage=_usage_obj(record["usage"]),
+        choices=[SimpleNamespace(index=0, delta=final, finish_reason=record.get("finish_reason") or "stop")]
+    )
+
+
+class _AsyncRecordingStream:
+    """透传真实的流，正常读完后写入缓存 (中途关闭或出错则丢弃)"""
+    from_cache = False
+
+    def __init__(self, stream, cache, key, model, start):
+        self._stream = stream
+        self._cache = cache
+        self._key = key
+        self._model = model
+        self._recorder = _Recorder(start)
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            self._recorder.add(chunk)
+            yield chunk
+        self._cache.store(self._key, self._recorder.record(self._model))
+
+    async def close(self):
+        await self._stream.close()
+
+
+class _AsyncReplayStream:
+    from_cache = True
+
+    def __init__(self, record, timing):
+        self._record = record
+        self._timing = timing
+
+    async def __aiter__(self):
+        start = time.perf_counter()
+        for offset, chunk in _replay_chunks(self._record):
+            if self._timing == "recorded" and offset is not None:
+                delay = start + offset - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield chunk
+
+    async def close(self):
+        pass
+
+
+class _RecordingStream:
+    """_AsyncRecordingStream 的同步版本"""
+    from_cache = False
+
+    def __init__(self, stream, cache, key, model, start):
+        self._stream = stream
+        self._cache = cache
+        self._key = key
+        self._model = model
+        self._recorder = _Recorder(start)
+
+    def __iter__(self):
+        for chunk in self._stream:
+            self._recorder.add(chunk)
+            yield chunk
+        self._cache.store(self._key, self._recorder.record(self._model))
+
+    def close(self):
+        self._stream.close()
+
+
+class _ReplayStream:
+    from_cache = True
+
+    def __init__(self, record, timing):
+        self._record = record
+        self._timing = timing
+
+    def __iter__(self):
+        start = time.perf_counter()
+        for offset, chunk in _replay_chunks(self._record):
+            if self._timing == "recorded" and offset is not None:
+                delay = start + offset - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            yield chunk
+
+    def close(self):
+        pass
+
+
+# ---- 非流式回答 ----
+
+def _completion_record(response):
+    choice = response.choices[0]
+    message = choice.message
+    return {
+        "model": response.model,
+        "stream": False,
+        "content": message.content,
+        "reasoning": getattr(message, "reasoning_content", None),
+        "usage": _usage_dict(response.usage),
+        "finish_reason": choice.finish_reason,
+    }
+
+
+def _replay_completion(record):
+    message = SimpleNamespace(role="assistant", content=record["content"], reasoning_content=record.get("reasoning"))
+    return SimpleNamespace(
+        model=record["model"], usage=_usage_obj(record["usage"]), from_cache=True,
+        choices=[SimpleNamespace(index=0, message=message, finish_reason=record.get("finish_reason") or "stop")]
+    )
+
+
+# ---- 客户端包装 ----
+
+class CachedAsyncOpenAI:
+    """AsyncOpenAI 的包装：client.chat.completions.create 经过缓存，其余接口保持不变"""
+    def __init__(self, client, cache):
+        self._client = client
+        self.cache = cache
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs):
+        if not self.cache.enabled:
+            return await self._client.chat.completions.create(**kwargs)
+        key = request_key(kwargs)
+        record = self.cache.load(key)
+        if record is not None:
+            if record["stream"]:
+                return _AsyncReplayStream(record, self.cache.timing)
+            return _replay_completion(record)
+        self.cache.miss(key)
+        start = time.perf_counter() # 录制的时间从发出请求算起，回放时保留首 token 延迟
+        response = await self._client.chat.completions.create(**kwargs)
+        if kwargs.get("stream"):
+            return _AsyncRecordingStream(response, self.cache, key, kwargs.get("model"), start)
+        self.cache.store(key, _completion_record(response))
+        return response
+
+    async def close(self):
+        await self._client.close()
+
+
+class CachedOpenAI:
+    """OpenAI 同步客户端的包装 (用于后台记忆提炼)"""
+    def __init__(self, client, cache):
+        self._client = client
+        self.cache = cache
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        if not self.cache.enabled:
+            return self._client.chat.completions.create(**kwargs)
+        key = request_key(kwargs)
+        record = self.cache.load(key)
+        if record is not None:
+            if record["stream"]:
+                return _ReplayStream(record, self.cache.timing)
+            return _replay_completion(record)
+        self.cache.miss(key)
+        start = time.perf_counter() # 录制的时间从发出请求算起，回放时保留首 token 延迟
+        response = self._client.chat.completions.create(**kwargs)
+        if kwargs.get("stream"):
+            return _RecordingStream(response, self.cache, key, kwargs.get("model"), start)
+        self.cache.store(key, _completion_record(response))
+        return response
+
+    def close(self):
+        self._client.close()
@@ -0,0 +1,113 @@
+"""
+LLM 请求的传输层：连接池、超时与重试策略
+
+- 连接池：对话与记忆提炼各用一个带长连接池的 HTTP 客户端，池大小、空闲连接保持时间、
+  连接/读取超时均可配置，可选 HTTP/2 (需要 h2)；
+- 重试：收到首个 token 之前的瞬时错误 (连接失败、超时、429/5xx、流在首个 token 前断开)
+  按指数退避 + 随机抖动重试，服务端给出 Retry-After 时以其为准；
+- 续传：回答生成到一半时连接断开，则把已生成的内容作为 assistant 消息附上，请模型从断点续写
+  (见 resume_messages)，已输出的内容与已提交执行的代码块都不会重复。
+对话循环自行处理重试与续传以便计数，因此对话客户端关闭了 SDK 内置的重试；记忆提炼的同步客户端使用 SDK 内置重试。
+"""
+import random
+from openai import AsyncOpenAI, OpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, Timeout
+from openai import APIStatusError, APIConnectionError, APITimeoutError
+import httpx
+import config
+
+RETRYABLE_STATUS = {408, 409, 429}
+RESUME_PREFIX = "[传输中断]"
+RESUME_PROMPT = f"{RESUME_PREFIX} 上一条回答在传输中断开了。请从断点处直接续写，不要重复已输出的内容，也不要添加任何说明。"
+
+
+def http2_available():
+    try:
+        import h2 # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def http_client_options():
+    """连接池与超时设置 (对话与记忆提炼的 HTTP 客户端共用)"""
+    http2 = config.LLM_HTTP2
+    if http2 and not http2_available():
+        print("警告: LLM_HTTP2=true 但未安装 h2，已回退为 HTTP/1.1 (pip install h2)。")
+        http2 = False
+    return {
+        "http2": http2,
+        "limits": httpx.Limits(
+            max_connections=config.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=config.LLM_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=config.LLM_KEEPALIVE_EXPIRY
+        ),
+        # 超时对象使用 SDK 导出的 Timeout，与其底层 HTTP 客户端的类型保持一致
+        "timeout": Timeout(config.LLM_READ_TIMEOUT, connect=config.LLM_CONNECT_TIMEOUT),
+    }
+
+
+def create_clients():
+    """返回 (对话用的异步客户端, 记忆提炼用的同步客户端)"""
+    options = http_client_options()
+    async_client = AsyncOpenAI(
+        base_url=config.BASE_URL,
+        api_key=config.API_KEY,
+        max_retries=0,
+        http_client=DefaultAsyncHttpxClient(**options)
+    )
+    sync_client = OpenAI(
+        base_url=config.BASE_URL,
+        api_key=config.API_KEY,
+        max_retries=config.LLM_MAX_RETRIES,
+        http_client=DefaultHttpxClient(**options)
+    )
+    return async_client, sync_client
+
+
+def is_retryable(exc):
+    """
+    瞬时错误：连接失败/超时、408/409/429/5xx、流中途的传输错误；
+    其余错误 (如响应格式校验失败 APIResponseValidationError) 重试也不会成功，直接报告
+    """
+    if isinstance(exc, APIStatusError):
+        return exc.status_code in RETRYABLE_STATUS or exc.status_code >= 500
+    return isinstance(exc, (APIConnectionError, APITimeoutError, httpx.TransportError))
+
+
+def describe_error(exc):
+    if isinstance(exc, APIStatusError):
+        return f"HTTP {exc.status_code}"
+    return type(exc).__name__
+
+
+def resume_messages(messages, partial):
+    """续传请求的消息：原消息 + 已生成的部分回答 + 续写要求"""
+    return messages + [
+        {"role": "assistant", "content": partial},
+        {"role": "user", "content": RESUME_PROMPT},
+    ]
+
+
+class RetryPolicy:
+    def __init__(self, max_retries=3, base_delay=0.5, max_delay=8.0, resume_attempts=2):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.resume_attempts = resume_attempts
+
+    @classmethod
+    def from_config(cls):
+        return cls(config.LLM_MAX_RETRIES, config.LLM_RETRY_BASE_DELAY,
+                   config.LLM_RETRY_MAX_DELAY, config.LLM_RESUME_ATTEMPTS)
+
+    def delay(self, attempt, exc=None):
+        """第 attempt 次重试前的等待时间 (秒)：full jitter 指数退避，服务端的 Retry-After 优先"""
+        retry_after = None
+        if isinstance(exc, APIStatusError):
+            try:
+                retry_after = float(exc.response.headers.get("retry-after"))
+            except (TypeError, ValueError):
+                pass
+        if retry_after is not None:
+            return min(self.max_delay, max(0.0, retry_after))
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
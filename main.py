@@ -1,30 +1,90 @@
+import argparse
 import sys
+import threading
+import config
 from agent import AliceAgent
+from session_log import SessionLog
+
+def run_chat(alice, user_input):
+    """
+    在工作线程中执行一轮对话，主线程保持响应 Ctrl-C：
+    回答或执行期间按 Ctrl-C 只中断本轮并回到输入提示，在输入提示处按 Ctrl-C 才退出程序。
+    """
+    error = []
+
+    def target():
+        try:
+            alice.chat(user_input)
+        except Exception as e:
+            error.append(e)
+
+    worker = threading.Thread(target=target, name="alice-chat", daemon=True)
+    worker.start()
+    while worker.is_alive():
+        try:
+            worker.join(0.1)
+        except KeyboardInterrupt:
+            print("\n[系统]: 正在中断...")
+            alice.interrupt()
+    if error:
+        raise error[0]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Alice 智能体命令行")
+    parser.add_argument("--resume", metavar="SESSION_ID",
+                        help="恢复之前的会话 (会话 ID 见启动提示，last 表示最近一次会话)")
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
+    session_id = args.resume
+    if session_id == "last":
+        session_id = SessionLog.latest(config.SESSION_LOG_DIR)
+        if session_id is None:
+            print(f"[系统]: {config.SESSION_LOG_DIR} 下没有可恢复的会话。")
+            return
+    if session_id and not SessionLog(config.SESSION_LOG_DIR, session_id).exists:
+        print(f"[系统]: 未找到会话 {session_id}。")
+        return
+
     print("\n" + "*"*50)
     print("      Alice 智能体系统已就绪")
     print("*"*50)
     print("输入 'quit' 或 'exit' 退出程序。")
 
-    alice = AliceAgent()
+    alice = AliceAgent(session_id=session_id, resume=bool(session_id))
+    print(f"[系统]: {alice.startup_report()}")
+    if session_id:
+        print(f"[系统]: 已恢复会话 {session_id} (已完成 {alice.turn_index} 轮，{len(alice.messages) - 1} 条消息)。")
+    elif alice.session_log is not None:
+        print(f"[系统]: 会话 ID {alice.session_id}，可用 python main.py --resume {alice.session_id} 恢复。")
 
-    while True:
-        try:
-            user_input = input("\n[您]: ").strip()
-            if not user_input:
-                continue
-            if user_input.lower() in ['quit', 'exit']:
-                print("再见！")
+    shown_status = ""
+    try:
+        while True:
+            try:
+                # 后台记忆提炼的状态指示
+                status = alice.distiller.label
+                if status != shown_status and alice.distiller.status != alice.distiller.RUNNING:
+                    print(f"\n[系统]: {status}")
+                shown_status = status
+                indicator = f" ({status})" if alice.distiller.status == alice.distiller.RUNNING else ""
+                user_input = input(f"\n[您]{indicator}: ").strip()
+                if not user_input:
+                    continue
+                if user_input.lower() in ['quit', 'exit']:
+                    print("再见！")
+                    break
+                
+                run_chat(alice, user_input)
+                
+            except KeyboardInterrupt:
+                print("\n程序终止。")
                 break
-            
-            alice.chat(user_input)
-            
-        except KeyboardInterrupt:
-            print("\n程序终止。")
-            break
-        except Exception as e:
-            print(f"发生错误: {e}")
+            except Exception as e:
+                print(f"发生错误: {e}")
+    finally:
+        alice.close()
 
 if __name__ == "__main__":
     main()
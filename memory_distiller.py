@@ -0,0 +1,243 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from context_manager import estimate_tokens
+from memory_index import tokenize
+
+NO_UPDATE = "无重要更新"
+DATE_PREFIX = re.compile(r'^\[?\d{4}-\d{2}-\d{2}\]?\s*')
+# 提炼结果中一行开头的列表标记：- * + 或 1. 1) 1、
+LIST_MARKER = re.compile(r'^(?:[-*+]|\d+[.)、])\s+')
+
+
+class MemoryDistiller:
+    """
+    后台记忆提炼 (map-reduce)
+    在独立线程中把过期的短期记忆提炼为长期记忆，启动时不再阻塞用户输入：
+    - map: 过期天数按 token 预算切分为若干分块，以有界并发分别请求 LLM 提炼；
+    - reduce: 合并各分块的要点，并与已有长期记忆及彼此之间去重。
+    每个分块完成后其结果写入检查点，重试时跳过已完成的分块。
+    提炼结果与过期 STM 的删除写在同一条日志记录中 (见 MemoryStore.prune)：
+    LLM 返回前不改动记忆，中途崩溃只会在下次启动时继续提炼，不会丢失或重复条目。
+    """
+    IDLE, RUNNING, DONE, FAILED = "idle", "running", "done", "failed"
+    LABELS = {
+        IDLE: "",
+        RUNNING: "记忆提炼中",
+        DONE: "记忆提炼完成",
+        FAILED: "记忆提炼失败",
+    }
+    SIMILARITY_THRESHOLD = 0.8
+
+    def __init__(self, store, client, model_name, retention_days=7,
+                 chunk_tokens=6000, concurrency=4, checkpoint_path=None):
+        self.store = store
+        self.client = client
+        self.model_name = model_name
+        self.retention_days = retention_days
+        self.chunk_tokens = chunk_tokens
+        self.concurrency = max(1, concurrency)
+        self.checkpoint_path = checkpoint_path
+        self.status = self.IDLE
+        self.detail = ""
+        self._thread = None
+        self._checkpoint_lock = threading.Lock()
+
+    @property
+    def label(self):
+        """供界面展示的状态文字 (空闲时为空串)"""
+        label = self.LABELS[self.status]
+        return f"{label}: {self.detail}" if label and self.detail else label
+
+    def expired_dates(self):
+        limit = (datetime.now().date() - timedelta(days=self.retention_days)).strftime('%Y-%m-%d')
+        return self.store.dates_before(limit)
+
+    def start(self):
+        """有过期记忆时启动后台提炼，返回是否启动"""
+        if self._thread is not None and self._thread.is_alive():
+            return False
+        if not self.expired_dates():
+            return False
+        self.status = self.RUNNING
+        self.detail = f"{len(self.expired_dates())} 天"
+        self._thread = threading.Thread(target=self.run, name="alice-distill", daemon=True)
+        self._thread.start()
+        return True
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self):
+        """执行一次提炼 (可直接同步调用)"""
+        self.status = self.RUNNING
+        try:
+            to_prune = self.expired_dates()
+            if not to_prune:
+                self.status, self.detail = self.DONE, "无过期记忆"
+                return
+
+            chunks = self.split_chunks(to_prune)
+            partials = self.map_chunks([text for text, _ in chunks])
+            summary = self.reduce(partials)
+
+            # 提炼结果为空的分块 (既没有内容也没有明确回复无更新) 所涉及的日期保留，下次启动时重新提炼
+            kept = {date for (_, dates), partial in zip(chunks, partials) if not (partial or "").strip() for date in dates}
+            to_prune = [date for date in to_prune if date not in kept]
+
+            # 提炼结果写入长期记忆与清理过期短期记忆在同一条日志记录中完成
+            section = None
+            if summary:
+                section = f"### 自动提炼记忆 ({datetime.now().strftime('%Y-%m-%d')})\n{summary}"
+            if to_prune or section:
+                self.store.prune(to_prune, section=section)
+                self.store.export()
+            self._clear_checkpoint()
+            self.status = self.DONE
+            self.detail = f"已清理 {len(to_prune)} 天短期记忆" + ("，长期记忆已更新" if section else "")
+            if kept:
+                self.detail += f"，{len(kept)} 天的提炼结果为空，已保留"
+        except Exception as e:
+            self.status, self.detail = self.FAILED, str(e)
+
+    # ---- map ----
+    def split_chunks(self, dates):
+        """按 token 预算把过期天数切分为分块；单日超出预算时再按行切分。返回 [(分块文本, 涉及的日期)]"""
+        chunks, current, current_dates, current_tokens = [], [], [], 0
+        for date in dates:
+            for piece in self._split_day(date):
+                tokens = estimate_tokens(piece)
+                if current and current_tokens + tokens > self.chunk_tokens:
+                    chunks.append(("\n".join(current), current_dates))
+                    current, current_dates, current_tokens = [], [], 0
+                current.append(piece)
+                if date not in current_dates:
+                    current_dates.append(date)
+                current_tokens += tokens
+        if current:
+            chunks.append(("\n".join(current), current_dates))
+        return chunks
+
+    def _split_day(self, date):
+        text = self.store.render_stm_days([date])
+        if estimate_tokens(text) <= self.chunk_tokens:
+            return [text]
+        header, *lines = text.splitlines()
+        pieces, current, current_tokens = [], [header], 0
+        for line in lines:
+            tokens = estimate_tokens(line)
+            if len(current) > 1 and current_tokens + tokens > self.chunk_tokens:
+                pieces.append("\n".join(current))
+                current, current_tokens = [f"{header} (续)"], 0
+            current.append(line)
+            current_tokens += tokens
+        pieces.append("\n".join(current))
+        return pieces
+
+    def map_chunks(self, chunks):
+        """并发提炼各分块，已在检查点中完成的分块直接复用"""
+        checkpoint = self._load_checkpoint()
+        keys = [hashlib.sha1(chunk.encode("utf-8")).hexdigest() for chunk in chunks]
+        todo = [(key, chunk) for key, chunk in zip(keys, chunks) if key not in checkpoint]
+        self.detail = f"{len(chunks)} 个分块，{len(chunks) - len(todo)} 个已完成"
+
+        def work(item):
+            key, chunk = item
+            result = self.distill(chunk)
+            with self._checkpoint_lock:
+                checkpoint[key] = result
+                if result:
+                    self._save_checkpoint(checkpoint) # 空结果不写入检查点，下次重新提炼
+                self.detail = f"{len(chunks)} 个分块，{sum(k in checkpoint for k in keys)} 个已完成"
+            return result
+
+        if todo:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="alice-distill") as pool:
+                list(pool.map(work, todo))
+        return [checkpoint[key] for key in keys]
+
+    def distill(self, chunk):
+        distill_prompt = (
+            f"你是一个记忆提炼专家。以下是用户短期记忆中即将被删除的一段旧记录：\n\n{chunk}\n\n"
+            "请提炼出其中具有长期价值的：\n"
+            "1. 用户的新习惯或偏好变更。\n"
+            "2. 重要的项目决策或里程碑进展。\n"
+            "3. 用户提到的重要个人事实。\n\n"
+            f"请以 Markdown 列表格式输出提炼结果，每条一行，保持简洁。如果没有值得记录的长期价值，请回复“{NO_UPDATE}”。"
+        )
+        response = self.client.chat.completions.create(
+            model=self.model_name,
+            messages=[{"role": "user", "content": distill_prompt}]
+        )
+        return (response.choices[0].message.content or "").strip()
+
+    # ---- reduce ----
+    @staticmethod
+    def _signature(text):
+        return set(tokenize(DATE_PREFIX.sub("", text)))
+
+    def _is_duplicate(self, signature, seen):
+        """新要点的词元大部分已被某条已有记忆覆盖即视为重复"""
+        for other in seen:
+            if len(signature & other) / len(signature) >= self.SIMILARITY_THRESHOLD:
+                return True
+        return False
+
+    @staticmethod
+    def _items(partial):
+        """提炼结果中的各行要点：去掉列表标记 (- * + 或编号)，不带标记的文字行同样保留"""
+        items = []
+        for line in partial.splitlines():
+            item = LIST_MARKER.sub("", line.strip()).strip()
+            if item:
+                items.append(item)
+        return items
+
+    def reduce(self, partials):
+        """合并各分块的要点，并与已有长期记忆及彼此之间去重；没有新要点时返回空串"""
+        seen = [self._signature(text) for _, text in self.store.entries("ltm")]
+        merged = []
+        for partial in partials:
+            if not (partial or "").strip() or NO_UPDATE in partial:
+                continue
+            items = self._items(partial)
+            if not items:
+                # 解析不出要点时原文照录，对应的短期记忆随后会被清理，不能丢弃
+                merged.append(partial.strip())
+                continue
+            for item in items:
+                signature = self._signature(item)
+                if signature:
+                    if self._is_duplicate(signature, seen):
+                        continue
+                    seen.append(signature)
+                merged.append(f"- {item}") # 没有可比对词元的要点无法去重，照常保留
+        return "\n".join(merged)
+
+    # ---- 检查点 ----
+    def _load_checkpoint(self):
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return {}
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                return json.load(f).get("chunks", {})
+        except (OSError, ValueError):
+            return {}
+
+    def _save_checkpoint(self, chunks):
+        if not self.checkpoint_path:
+            return
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"chunks": chunks}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _clear_checkpoint(self):
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
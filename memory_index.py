@@ -0,0 +1,162 @@
+import math
+import re
+import threading
+from collections import Counter, namedtuple
+
+MemoryEntry = namedtuple("MemoryEntry", ["id", "source", "date", "text"])
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9_]+|[\u3400-\u4dbf\u4e00-\u9fff]+')
+
+
+def tokenize(text):
+    """
+    中英文混合分词：英文/数字按单词切分并转小写，中文连续片段切分为字符二元组 (bigram)，
+    单个汉字保留为一元组。无需词典与网络。
+    """
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text.lower()):
+        word = match.group()
+        if word[0] < "\u3400":
+            tokens.append(word)
+        elif len(word) == 1:
+            tokens.append(word)
+        else:
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+class MemoryIndex:
+    """
+    记忆条目的本地 BM25 检索索引
+    支持增量添加条目（随 memory 指令的写入同步更新）。
+    """
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.entries = {}
+        self.postings = {} # token -> {entry_id: 词频}
+        self.lengths = {}
+        self.total_length = 0
+        self.version = 0
+        self._next_id = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, source, date, text):
+        entry = MemoryEntry(self._next_id, source, date, text)
+        self._next_id += 1
+        counts = Counter(tokenize(text))
+        for token, tf in counts.items():
+            self.postings.setdefault(token, {})[entry.id] = tf
+        length = sum(counts.values())
+        self.entries[entry.id] = entry
+        self.lengths[entry.id] = length
+        self.total_length += length
+        self.version += 1
+        return entry
+
+    def search(self, query, k=10):
+        """返回 [(得分, 条目)]，按得分从高到低排列"""
+        if not self.entries:
+            return []
+        n = len(self.entries)
+        avgdl = self.total_length / n if n else 1
+        scores = {}
+        for token in set(tokenize(query)):
+            posting = self.postings.get(token)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for eid, tf in posting.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[eid] / avgdl)
+                scores[eid] = scores.get(eid, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))[:k]
+        return [(score, self.entries[eid]) for eid, score in ranked]
+
+    def recent(self, source, count):
+        """某一来源最近写入的若干条目"""
+        if count <= 0:
+            return []
+        entries = [e for e in self.entries.values() if e.source == source]
+        return entries[-count:]
+
+
+class MemoryRetriever:
+    """
+    相关性记忆注入
+    基于 MemoryStore 维护检索索引：memory 指令追加的条目增量入索引，存储发生其它变更
+    (如记忆滚动删除、重新迁移) 时整体重建。每次请求只注入与当前用户输入最相关的 top-k 条目，
+    外加最近几条短期记忆，总量受字节预算约束。
+    """
+    TITLES = {"ltm": "长期记忆", "stm": "短期记忆"}
+
+    def __init__(self, store, top_k=8, byte_budget=4000, recent_count=5):
+        self.store = store
+        self.top_k = top_k
+        self.byte_budget = byte_budget
+        self.recent_count = recent_count
+        self.index = MemoryIndex()
+        self._state = None
+        # 系统消息可能在线程池中投机刷新 (服务模式下各会话共用同一个检索器)，同步与选取需互斥
+        self._lock = threading.RLock()
+
+    def sync(self):
+        """存储状态与索引不一致时重建索引 (建好后整体替换，读取方不会看到建到一半的索引)"""
+        with self._lock:
+            state = self.store.state
+            if state != self._state:
+                index = MemoryIndex()
+                for source in ("ltm", "stm"):
+                    for date, text in self.store.entries(source):
+                        index.add(source, date, text)
+                self.index = index
+                self._state = state
+            return self.index.version
+
+    def append(self, source, date, text):
+        """存储追加条目后调用：若这是索引上次同步后的唯一变更则增量添加，否则整体重建"""
+        with self._lock:
+            generation, ltm, stm = self._state or (None, None, None)
+            expected = (generation, ltm + (source == "ltm"), stm + (source == "stm")) if self._state else None
+            if self.store.state != expected:
+                self.sync()
+                return
+            self.index.add(source, date, text)
+            self._state = expected
+
+    def select(self, query):
+        """按相关性 (及短期记忆的时间近因) 选出要注入的条目，受 top_k 与字节预算约束"""
+        with self._lock:
+            self.sync()
+            candidates = [entry for _, entry in self.index.search(query, self.top_k)] if query else []
+            candidates += reversed(self.index.recent("stm", self.recent_count))
+        chosen, seen, used = [], set(), 0
+        for entry in candidates:
+            if entry.id in seen:
+                continue
+            size = len(entry.text.encode("utf-8")) + 16
+            if used + size > self.byte_budget:
+                continue
+            seen.add(entry.id)
+            chosen.append(entry)
+            used += size
+        return chosen
+
+    def render(self, query):
+        chosen = self.select(query)
+        if not chosen:
+            return "暂无相关记忆。"
+        sections = []
+        for source, title in self.TITLES.items():
+            entries = sorted((e for e in chosen if e.source == source), key=lambda e: (e.date or "", e.id))
+            if not entries:
+                continue
+            lines = []
+            for e in entries:
+                if source == "stm" and e.date:
+                    lines.append(f"- {e.date} {e.text}")
+                else:
+                    lines.append(f"- {e.text}")
+            sections.append(f"#### {title}\n" + "\n".join(lines))
+        return "\n\n".join(sections)
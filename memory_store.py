@@ -0,0 +1,310 @@
+"""
+Alice 的结构化记忆存储
+
+以追加写的 JSONL 日志作为 LTM/STM 的唯一数据源，启动时回放日志构建内存中的日期索引：
+- 写入记忆只追加一行日志，复杂度 O(1)，不再整文件读取与重写；
+- 过期查询基于有序日期列表做区间查找；
+- memory/*.md 只是渲染视图，在需要展示时才按需重新生成。
+
+首次启动 (日志不存在) 时自动从现有的 Markdown 记忆文件迁移，也可手动执行：
+    python memory_store.py migrate   # 从 Markdown 重新导入 (会覆盖现有日志)
+    python memory_store.py export    # 把日志渲染回 Markdown
+"""
+import bisect
+import json
+import os
+import re
+import sys
+import threading
+from datetime import datetime
+
+DATE_HEADER = re.compile(r'^## (\d{4}-\d{2}-\d{2})')
+LESSONS_HEADER = "## 经验教训"
+STM_PREAMBLE = [
+    "# Alice 的短期记忆 (最近 7 天)",
+    "这是 Alice 的短期记忆空间，以“时间-事件-行动”格式记录最近 7 天的有价值交互。系统会自动滚动清理并提炼长期记忆。",
+]
+LTM_PREAMBLE = ["# Alice 的长期记忆"]
+
+
+class MemoryStore:
+    """
+    追加写的记忆日志
+    日志记录类型:
+      {"op": "add", "kind": "stm"|"ltm", "date": ..., "text": ..., "raw": bool}  新增条目
+      {"op": "section", "text": ...}                                           LTM 中的其它 Markdown 小节 (如自动提炼记忆)
+      {"op": "preamble", "kind": ..., "lines": [...]}                           Markdown 视图的标题与说明
+      {"op": "prune", "dates": [...], "section": ...}                           删除若干天的 STM，可原子地附带一段 LTM 小节
+    单条记录以一次 write 追加，加载时忽略不完整的尾行，因此崩溃不会留下半条记录。
+    """
+    def __init__(self, log_path, ltm_md_path=None, stm_md_path=None):
+        self.log_path = log_path
+        self.md_paths = {"ltm": ltm_md_path, "stm": stm_md_path}
+        self._lock = threading.RLock()
+        self._file = None
+        self._reset_state()
+
+        if not os.path.exists(log_path):
+            self.migrate_from_markdown()
+        else:
+            self._load()
+
+    def _reset_state(self):
+        self.preambles = {"ltm": list(LTM_PREAMBLE), "stm": list(STM_PREAMBLE)}
+        self.stm = {} # 日期 -> [条目]
+        self.stm_dates = [] # 有序日期列表
+        self.ltm = [] # 经验教训条目，按写入顺序
+        self.sections = [] # LTM 中的其它小节
+        self.versions = {"ltm": 0, "stm": 0}
+        self.generation = 0 # 非追加类变更 (删除、迁移) 时递增，供索引判断是否需要重建
+        self._rendered = {}
+        self._exported = {}
+
+    # ---- 日志读写 ----
+    def _load(self):
+        valid_size = 0
+        with open(self.log_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break # 崩溃遗留的不完整尾行
+                valid_size += len(line)
+                try:
+                    record = json.loads(line.decode("utf-8"))
+                except ValueError:
+                    continue
+                self._apply(record)
+        # 截掉不完整尾行，避免后续追加的记录与其拼接成坏行
+        if valid_size < os.path.getsize(self.log_path):
+            with open(self.log_path, "r+b") as f:
+                f.truncate(valid_size)
+        # 视图以加载完成时为准，避免启动时无谓地重写 Markdown
+        self._exported = dict(self.versions)
+
+    def _append(self, record):
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+                self._file = open(self.log_path, "a", encoding="utf-8")
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+            self._apply(record)
+
+    def _apply(self, record):
+        op = record.get("op")
+        if op == "add":
+            entry = {"date": record.get("date"), "text": record["text"], "raw": record.get("raw", False)}
+            if record["kind"] == "stm":
+                date = entry["date"]
+                if date not in self.stm:
+                    self.stm[date] = []
+                    bisect.insort(self.stm_dates, date)
+                self.stm[date].append(entry)
+            else:
+                self.ltm.append(entry)
+            self.versions[record["kind"]] += 1
+        elif op == "section":
+            self.sections.append(record["text"])
+            self.versions["ltm"] += 1
+        elif op == "preamble":
+            self.preambles[record["kind"]] = record["lines"]
+            self.versions[record["kind"]] += 1
+        elif op == "prune":
+            for date in record.get("dates", []):
+                if self.stm.pop(date, None) is not None:
+                    self.stm_dates.remove(date)
+            self.versions["stm"] += 1
+            if record.get("section"):
+                self.sections.append(record["section"])
+                self.versions["ltm"] += 1
+            self.generation += 1
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    # ---- 写入 ----
+    def add_stm(self, text, date=None):
+        date = date or datetime.now().strftime("%Y-%m-%d")
+        self._append({"op": "add", "kind": "stm", "date": date, "text": text})
+        return date
+
+    def add_ltm(self, text, date=None):
+        date = date or datetime.now().strftime("%Y-%m-%d")
+        self._append({"op": "add", "kind": "ltm", "date": date, "text": text})
+        return date
+
+    def prune(self, dates, section=None):
+        """删除若干天的 STM；section 不为空时同一条记录内追加 LTM 小节，两者要么同时生效要么都不生效"""
+        self._append({"op": "prune", "dates": sorted(dates), "section": section})
+
+    # ---- 查询 ----
+    def dates_before(self, limit):
+        """早于 limit (YYYY-MM-DD，不含) 的 STM 日期"""
+        with self._lock:
+            return self.stm_dates[:bisect.bisect_left(self.stm_dates, limit)]
+
+    def entries(self, kind):
+        """按写入顺序列出 (日期, 文本)；LTM 还包括其它小节中的列表项"""
+        with self._lock:
+            if kind == "stm":
+                items = [(d, e["text"]) for d in self.stm_dates for e in self.stm[d] if not e["raw"]]
+            else:
+                items = [(e["date"], e["text"]) for e in self.ltm if not e["raw"]]
+                for section in self.sections:
+                    items += [(None, line.strip()[2:].strip()) for line in section.splitlines()
+                              if line.strip().startswith("- ")]
+        return items
+
+    @property
+    def state(self):
+        """存储状态指纹，供派生索引判断是否需要同步"""
+        return (self.generation, self.versions["ltm"], self.versions["stm"])
+
+    # ---- Markdown 视图 ----
+    def render_stm_days(self, dates):
+        lines = []
+        for date in dates:
+            lines.append(f"## {date}")
+            lines += [e["text"] if e["raw"] else f"- {e['text']}" for e in self.stm.get(date, [])]
+            lines.append("")
+        return "\n".join(lines)
+
+    def render_markdown(self, kind):
+        """渲染 Markdown 视图，结果按版本缓存"""
+        with self._lock:
+            version = self.versions[kind]
+            cached = self._rendered.get(kind)
+            if cached and cached[0] == version:
+                return cached[1]
+            lines = list(self.preambles[kind])
+            if kind == "stm":
+                lines.append("")
+                lines.append(self.render_stm_days(self.stm_dates))
+            else:
+                lines += ["", LESSONS_HEADER]
+                # 经验教训新条目在上
+                lines += [e["text"] if e["raw"] else f"- {e['text']}" for e in reversed(self.ltm)]
+                for section in self.sections:
+                    lines += ["", section]
+            text = "\n".join(lines).rstrip("\n") + "\n"
+            self._rendered[kind] = (version, text)
+            return text
+
+    def export(self, kind=None):
+        """把有变化的记忆渲染回 Markdown 文件 (临时文件 + 原子替换)"""
+        with self._lock:
+            for k in ([kind] if kind else ["ltm", "stm"]):
+                path = self.md_paths.get(k)
+                if not path or self._exported.get(k) == self.versions[k]:
+                    continue
+                text = self.render_markdown(k)
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(text)
+                os.replace(tmp_path, path)
+                self._exported[k] = self.versions[k]
+
+    # ---- 迁移 ----
+    def migrate_from_markdown(self):
+        """从现有 Markdown 记忆文件构建日志 (覆盖现有日志)"""
+        with self._lock:
+            self.close()
+            self._reset_state()
+            records = []
+            stm_path, ltm_path = self.md_paths["stm"], self.md_paths["ltm"]
+            if stm_path and os.path.exists(stm_path):
+                with open(stm_path, "r", encoding="utf-8") as f:
+                    records += self._parse_stm(f.read())
+            if ltm_path and os.path.exists(ltm_path):
+                with open(ltm_path, "r", encoding="utf-8") as f:
+                    records += self._parse_ltm(f.read())
+
+            os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+            tmp_path = f"{self.log_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.log_path)
+            for record in records:
+                self._apply(record)
+            self.generation += 1
+            self._exported = dict(self.versions)
+            return len(records)
+
+    @staticmethod
+    def _parse_stm(text):
+        records = []
+        lines = text.splitlines()
+        preamble = []
+        current_date = None
+        for line in lines:
+            header = DATE_HEADER.match(line)
+            if header:
+                current_date = header.group(1)
+                continue
+            if current_date is None:
+                if line.strip():
+                    preamble.append(line)
+                continue
+            if not line.strip():
+                continue
+            if line.startswith("- "):
+                records.append({"op": "add", "kind": "stm", "date": current_date, "text": line[2:].strip()})
+            else:
+                records.append({"op": "add", "kind": "stm", "date": current_date, "text": line, "raw": True})
+        if preamble:
+            records.insert(0, {"op": "preamble", "kind": "stm", "lines": preamble})
+        return records
+
+    @staticmethod
+    def _parse_ltm(text):
+        before, lessons_header, after = text.partition(LESSONS_HEADER)
+        if not lessons_header:
+            # 没有经验教训小节：首行作为标题，其余整体保留为一个小节
+            title, _, body = text.strip().partition("\n")
+            records = [{"op": "preamble", "kind": "ltm", "lines": [title]}] if title else []
+            if body.strip():
+                records.append({"op": "section", "text": body.strip()})
+            return records
+        preamble = [line for line in before.splitlines() if line.strip()]
+        records = [{"op": "preamble", "kind": "ltm", "lines": preamble}] if preamble else []
+
+        # 经验教训小节到下一个标题为止，其余内容作为独立小节保留
+        lesson_lines, rest = [], []
+        target = lesson_lines
+        for line in after.splitlines():
+            if target is lesson_lines and line.startswith("#"):
+                target = rest
+            target.append(line)
+        lessons = []
+        for line in lesson_lines:
+            if line.startswith("- "):
+                lessons.append(line[2:].strip())
+            elif line.strip() and lessons:
+                lessons[-1] += "\n" + line
+        for lesson in reversed(lessons): # Markdown 中新条目在上，日志按时间顺序写入
+            date_match = re.match(r'^\[?(\d{4}-\d{2}-\d{2})\]?', lesson)
+            records.append({"op": "add", "kind": "ltm", "date": date_match.group(1) if date_match else None, "text": lesson})
+        rest_text = "\n".join(rest).strip()
+        if rest_text:
+            records.append({"op": "section", "text": rest_text})
+        return records
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import config
+
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    store = MemoryStore(config.MEMORY_LOG_PATH, config.MEMORY_FILE_PATH, config.SHORT_TERM_MEMORY_FILE_PATH)
+    if command == "migrate":
+        count = store.migrate_from_markdown()
+        print(f"已从 Markdown 导入 {count} 条记录到 {config.MEMORY_LOG_PATH}。")
+    elif command == "export":
+        store._exported = {}
+        store.export()
+        print("已将记忆日志渲染为 Markdown。")
+    else:
+        print("用法: python memory_store.py [migrate|export]")
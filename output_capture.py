@@ -0,0 +1,142 @@
+import itertools
+import os
+import threading
+from collections import deque
+from datetime import datetime
+
+
+def _clip_bytes(text, size, from_end=False):
+    """按 UTF-8 字节数截取字符串，不切断多字节字符"""
+    data = text.encode("utf-8")
+    if len(data) <= size:
+        return text
+    data = data[-size:] if from_end else data[:size]
+    return data.decode("utf-8", errors="ignore")
+
+
+class RingBuffer:
+    """
+    有界输出缓冲：保留开头 head_bytes 与结尾 tail_bytes，中间部分只计数
+    内存占用与输出总量无关。
+    """
+    def __init__(self, head_bytes, tail_bytes):
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.head = []
+        self.head_size = 0
+        self.tail = deque()
+        self.tail_size = 0
+        self.total = 0
+
+    def write(self, text):
+        size = len(text.encode("utf-8"))
+        self.total += size
+        if self.head_size < self.head_bytes:
+            room = self.head_bytes - self.head_size
+            if size <= room:
+                self.head.append(text)
+                self.head_size += size
+                return
+            kept = _clip_bytes(text, room)
+            self.head.append(kept)
+            self.head_size = self.head_bytes
+            text = text[len(kept):]
+            size = len(text.encode("utf-8"))
+        self.tail.append(text)
+        self.tail_size += size
+        # 丢弃已完全落在结尾窗口之外的旧分块
+        while self.tail and self.tail_size - len(self.tail[0].encode("utf-8")) >= self.tail_bytes:
+            self.tail_size -= len(self.tail.popleft().encode("utf-8"))
+
+    @property
+    def truncated(self):
+        return self.total > self.head_bytes + self.tail_bytes
+
+    def render(self, spill_note=""):
+        head = "".join(self.head)
+        tail = "".join(self.tail)
+        if not self.truncated:
+            return head + tail
+        tail = _clip_bytes(tail, self.tail_bytes, from_end=True)
+        omitted = self.total - len(head.encode("utf-8")) - len(tail.encode("utf-8"))
+        return f"{head}\n...[输出过长，已省略中间 {omitted} 字节{spill_note}]...\n{tail}"
+
+
+class OutputCapture:
+    """
+    单个代码块的流式输出捕获
+    - stdout/stderr 各自经由 RingBuffer 限制进入消息历史的字节数；
+    - 完整输出同时写入 spill_dir 下的日志文件，未超限时执行结束后删除；
+    - live 回调在输出到达时即被调用，用于终端实时显示。
+    """
+    _counter = itertools.count(1)
+
+    def __init__(self, max_bytes, spill_dir=None, container_root=None, live=None):
+        head = max_bytes // 4
+        self.buffers = {
+            "stdout": RingBuffer(head, max_bytes - head),
+            "stderr": RingBuffer(head, max_bytes - head),
+        }
+        self.spill_dir = spill_dir
+        self.container_root = container_root # (宿主机目录, 容器内目录)，用于向模型展示容器内路径
+        self.live = live
+        self.spill_path = None
+        self.returncode = None # 执行结束后由调用方填入 (None 表示超时或未能执行)
+        self.closed = False
+        self._spill = None
+        self._lock = threading.Lock()
+
+    def write(self, stream, text):
+        if not text:
+            return
+        with self._lock:
+            if self.closed:
+                return # 结束后到达的残留输出 (如超时后仍在运行的子进程) 直接丢弃
+            self.buffers[stream].write(text)
+            self._write_spill(text)
+        if self.live is not None:
+            self.live(stream, text)
+
+    def _write_spill(self, text):
+        if self.spill_dir is None:
+            return
+        if self._spill is None:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            name = f"exec_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}_{next(self._counter)}.log"
+            self.spill_path = os.path.join(self.spill_dir, name)
+            self._spill = open(self.spill_path, "w", encoding="utf-8")
+        self._spill.write(text)
+
+    @property
+    def truncated(self):
+        return any(buf.truncated for buf in self.buffers.values())
+
+    def display_path(self):
+        """完整输出文件在容器内的路径 (不在挂载目录下时返回宿主机路径)"""
+        if self.spill_path is None:
+            return None
+        if self.container_root:
+            host_root, container_root = self.container_root
+            rel = os.path.relpath(self.spill_path, host_root)
+            if not rel.startswith(".."):
+                return f"{container_root}/{rel.replace(os.sep, '/')}"
+        return self.spill_path
+
+    def close(self):
+        """结束捕获；输出未超限时删除完整记录文件"""
+        with self._lock:
+            self.closed = True
+            if self._spill is not None:
+                self._spill.close()
+                self._spill = None
+                if not self.truncated:
+                    os.remove(self.spill_path)
+                    self.spill_path = None
+
+    def result(self):
+        """返回 (stdout, stderr)，超限部分以省略说明代替"""
+        self.close()
+        note = ""
+        if self.spill_path:
+            note = f"；完整输出已保存至 {self.display_path()}，可用 sed -n '起,止p' 或 tail 分页查看"
+        return self.buffers["stdout"].render(note), self.buffers["stderr"].render(note)
@@ -0,0 +1,237 @@
+"""
+Alice 沙盒常驻执行内核（容器端）
+
+由宿主机通过 `docker exec -i <容器> python3 -u -c <本文件源码>` 启动，常驻于容器内。
+宿主机与内核通过 stdin/stdout 上的长度前缀帧通信：每帧为 4 字节大端长度 + UTF-8 JSON。
+代码块执行期间，stdout/stderr 经由管道实时读取，以 {"op": "output"} 帧流式发回宿主机，
+执行结束后再发送携带退出码的响应帧。
+宿主机中断代码块时向内核发送 SIGINT：Python 代码块收到 KeyboardInterrupt，
+Bash 代码块所在的进程组被整体结束，内核本身保持常驻。
+内核保持 Python 解释器与已导入模块常驻，并按会话 (session) 隔离代码执行的命名空间。
+每个代码块都从内核启动时的当前目录 (即 `docker exec -w` 指定的工作目录) 开始执行。
+
+注意：本文件在容器内以 `-c` 方式运行，只能依赖标准库。
+"""
+import builtins
+import codecs
+import json
+import os
+import signal
+import struct
+import subprocess
+import sys
+import threading
+import time
+import traceback
+
+HEADER = struct.Struct(">I")
+WORKDIR = "/app"
+CHUNK_SIZE = 65536
+DRAIN_IDLE = 0.5 # 代码块结束后，输出管道持续空闲多久即停止等待 (后台进程可能一直持有管道)
+
+
+class KernelServer:
+    def __init__(self, workdir=WORKDIR):
+        self.workdir = workdir
+        self.namespaces = {}
+        self._send_lock = threading.Lock()
+        self._executing = False
+
+        # 只在执行代码块期间响应 SIGINT，空闲时收到的中断信号直接忽略
+        signal.signal(signal.SIGINT, self._on_interrupt)
+
+        # 独立进程组，便于宿主机在超时时整体清理内核及其子进程
+        try:
+            os.setsid()
+        except OSError:
+            pass
+
+        # 复制协议通道后，把 fd 0/1 指向 /dev/null，防止用户代码读写污染帧流
+        self.proto_in = os.fdopen(os.dup(0), "rb", buffering=0)
+        self.proto_out = os.fdopen(os.dup(1), "wb", buffering=0)
+        devnull = os.open(os.devnull, os.O_RDWR)
+        os.dup2(devnull, 0)
+        os.dup2(devnull, 1)
+        os.close(devnull)
+
+    def _on_interrupt(self, signum, frame):
+        if self._executing:
+            raise KeyboardInterrupt
+
+    # ---- 帧协议 ----
+    def _read_exact(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self.proto_in.read(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def recv(self):
+        header = self._read_exact(HEADER.size)
+        if header is None:
+            return None
+        payload = self._read_exact(HEADER.unpack(header)[0])
+        if payload is None:
+            return None
+        return json.loads(payload.decode("utf-8"))
+
+    def send(self, message):
+        payload = json.dumps(message, ensure_ascii=False).encode("utf-8")
+        with self._send_lock:
+            self.proto_out.write(HEADER.pack(len(payload)) + payload)
+
+    # ---- 输出流 ----
+    def _pump(self, fd, stream, request_id, state):
+        """读取输出管道并以 output 帧实时转发，直到管道关闭"""
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        try:
+            while True:
+                data = os.read(fd, CHUNK_SIZE)
+                state["active"] = time.monotonic()
+                text = decoder.decode(data, final=not data)
+                if text:
+                    self.send({"op": "output", "id": request_id, "stream": stream, "data": text})
+                    state["active"] = time.monotonic()
+                if not data:
+                    break
+        finally:
+            os.close(fd)
+
+    def _open_streams(self, request_id):
+        """为 stdout/stderr 各建一条管道，返回 (写端 fd 列表, 转发线程列表, 活动状态)"""
+        state = {"active": time.monotonic()}
+        write_fds, pumps = [], []
+        for stream in ("stdout", "stderr"):
+            read_fd, write_fd = os.pipe()
+            pump = threading.Thread(target=self._pump, args=(read_fd, stream, request_id, state), daemon=True)
+            pump.start()
+            write_fds.append(write_fd)
+            pumps.append(pump)
+        return write_fds, pumps, state
+
+    def _drain(self, pumps, state):
+        """等待输出转发完毕；管道被后台进程持有而长时间无输出时不再等待"""
+        for pump in pumps:
+            while pump.is_alive():
+                pump.join(DRAIN_IDLE)
+                if pump.is_alive() and time.monotonic() - state["active"] >= DRAIN_IDLE:
+                    return
+
+    # ---- 执行 ----
+    def _namespace(self, session):
+        if session not in self.namespaces:
+            self.namespaces[session] = {"__name__": "__main__", "__builtins__": builtins}
+        return self.namespaces[session]
+
+    def run_python(self, code, session, request_id):
+        namespace = self._namespace(session)
+        returncode = 0
+        (out_w, err_w), pumps, state = self._open_streams(request_id)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        saved_out, saved_err = os.dup(1), os.dup(2)
+        os.dup2(out_w, 1)
+        os.dup2(err_w, 2)
+        os.close(out_w)
+        os.close(err_w)
+        try:
+            self._executing = True
+            exec(compile(code, "<string>", "exec"), namespace)
+        except KeyboardInterrupt:
+            print("KeyboardInterrupt: 代码块已被中断", file=sys.stderr)
+            returncode = 130
+        except SystemExit as e:
+            if e.code is None:
+                returncode = 0
+            elif isinstance(e.code, int):
+                returncode = e.code
+            else:
+                print(e.code, file=sys.stderr)
+                returncode = 1
+        except BaseException:
+            # 跳过内核自身的栈帧，使回溯与 `python3 -c` 的输出保持一致
+            etype, value, tb = sys.exc_info()
+            traceback.print_exception(etype, value, tb.tb_next)
+            returncode = 1
+        finally:
+            self._executing = False
+            sys.stdout.flush()
+            sys.stderr.flush()
+            # 恢复 fd 1/2 的同时关闭管道写端，转发线程随之读到 EOF
+            os.dup2(saved_out, 1)
+            os.dup2(saved_err, 2)
+            os.close(saved_out)
+            os.close(saved_err)
+        self._drain(pumps, state)
+        return {"returncode": returncode}
+
+    def run_bash(self, command, request_id):
+        (out_w, err_w), pumps, state = self._open_streams(request_id)
+        try:
+            process = subprocess.Popen(
+                ["bash", "-c", command],
+                cwd=self.workdir,
+                stdin=subprocess.DEVNULL,
+                stdout=out_w,
+                stderr=err_w,
+                start_new_session=True, # 独立进程组，中断时连同其子进程一起结束
+            )
+        finally:
+            os.close(out_w)
+            os.close(err_w)
+        # 告知宿主机子进程组，超时强制回收时一并清理
+        self.send({"op": "spawn", "id": request_id, "pgid": process.pid})
+        try:
+            self._executing = True
+            returncode = process.wait()
+        except KeyboardInterrupt:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except OSError:
+                pass
+            process.wait()
+            returncode = 130
+        finally:
+            self._executing = False
+        self._drain(pumps, state)
+        return {"returncode": returncode}
+
+    def handle(self, request):
+        op = request.get("op")
+        if op == "exec":
+            # 每个代码块都从容器工作目录开始，与一次性 docker exec 的行为保持一致
+            os.chdir(self.workdir)
+            if request.get("lang") == "python":
+                result = self.run_python(request["code"], request.get("session", "default"), request.get("id"))
+            else:
+                result = self.run_bash(request["code"], request.get("id"))
+            return dict(result, ok=True)
+        if op == "reset":
+            session = request.get("session")
+            if session is None:
+                self.namespaces.clear()
+            else:
+                self.namespaces.pop(session, None)
+            return {"ok": True}
+        if op == "ping":
+            return {"ok": True}
+        return {"ok": False, "error": f"未知操作: {op}"}
+
+    def serve(self):
+        self.send({"op": "hello", "pid": os.getpid(), "python": sys.version.split()[0]})
+        while True:
+            request = self.recv()
+            if request is None:
+                break
+            try:
+                response = self.handle(request)
+            except Exception as e:
+                response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            response["id"] = request.get("id")
+            self.send(response)
+
+
+if __name__ == "__main__":
+    KernelServer(os.getcwd()).serve()
@@ -0,0 +1,249 @@
+import asyncio
+import itertools
+import json
+import os
+import struct
+import time
+
+HEADER = struct.Struct(">I")
+EXECUTOR_SOURCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_executor.py")
+
+
+class KernelError(Exception):
+    """常驻内核不可用或协议异常"""
+
+
+class KernelTimeout(KernelError):
+    """代码块执行超时（内核已被强制回收）"""
+
+
+class KernelCancelled(KernelError):
+    """代码块被中断后未能在宽限期内结束（内核已被强制回收）"""
+
+
+class SandboxKernel:
+    """
+    宿主机端的常驻执行内核客户端 (asyncio)
+    通过一次 `docker exec -i` 在容器内拉起 sandbox_executor.py，此后所有代码块都经由
+    stdin/stdout 上的帧协议发送给同一个进程执行，省去每个代码块的 docker CLI、exec 与
+    解释器冷启动开销，并让已导入的模块在代码块之间保持常驻。
+    所有方法均需在同一个事件循环中调用。
+    """
+    def __init__(self, container_name, workdir="/app", startup_timeout=30):
+        self.container_name = container_name
+        self.workdir = workdir
+        self.startup_timeout = startup_timeout
+        self.process = None
+        self.pid = None  # 内核在容器内的进程号
+        self.child_pgid = None  # 正在执行的 Bash 代码块的进程组
+        self.busy = False
+        self._frames = None
+        self._reader = None
+        self._ids = itertools.count(1)
+        self._lock = None
+        self._interrupt_deadline = None
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.returncode is None
+
+    def _get_lock(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def start(self):
+        """启动容器内的常驻内核并等待握手"""
+        if self.alive:
+            return
+        with open(EXECUTOR_SOURCE_PATH, "r", encoding="utf-8") as f:
+            source = f.read()
+        self.process = await asyncio.create_subprocess_exec(
+            "docker", "exec", "-i", "-w", self.workdir, self.container_name, "python3", "-u", "-c", source,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        self._frames = asyncio.Queue()
+        self._reader = asyncio.ensure_future(self._read_loop(self.process.stdout, self._frames))
+
+        try:
+            hello = await self._next_frame(self.startup_timeout)
+        except KernelTimeout:
+            hello = None
+        if hello is None or hello.get("op") != "hello":
+            await self._kill()
+            raise KernelError("常驻执行内核握手失败。")
+        self.pid = hello.get("pid")
+
+    async def _read_loop(self, stream, frames):
+        """后台读取帧，流关闭时投递 None 作为结束标记"""
+        try:
+            while True:
+                header = await stream.readexactly(HEADER.size)
+                payload = await stream.readexactly(HEADER.unpack(header)[0])
+                frames.put_nowait(json.loads(payload.decode("utf-8")))
+        except (asyncio.IncompleteReadError, ValueError, OSError):
+            pass
+        frames.put_nowait(None)
+
+    async def _next_frame(self, timeout):
+        try:
+            return await asyncio.wait_for(self._frames.get(), timeout)
+        except asyncio.TimeoutError:
+            raise KernelTimeout("常驻执行内核响应超时。")
+
+    async def _send(self, message):
+        payload = json.dumps(message, ensure_ascii=False).encode("utf-8")
+        try:
+            self.process.stdin.write(HEADER.pack(len(payload)) + payload)
+            await self.process.stdin.drain()
+        except (ConnectionError, OSError) as e:
+            await self._kill()
+            raise KernelError(f"常驻执行内核连接已断开: {e}")
+
+    async def request(self, message, timeout=None, on_output=None):
+        """
+        发送一个请求并等待对应响应；执行期间的 output 帧交给 on_output(stream, data) 处理。
+        timeout 为整个请求的截止时间，超时后内核会被回收，下次请求时自动重启。
+        """
+        async with self._get_lock():
+            await self.start()
+            message = dict(message, id=next(self._ids))
+            deadline = time.monotonic() + timeout if timeout is not None else None
+            self._interrupt_deadline = None
+            await self._send(message)
+            self.busy = True
+            try:
+                while True:
+                    frame = await self._next_frame(self._remaining(deadline))
+                    if frame is None:
+                        await self._kill()
+                        raise KernelError("常驻执行内核意外退出。")
+                    if frame.get("id") != message["id"]:
+                        continue # 上一个代码块遗留的后台输出
+                    if frame.get("op") == "output":
+                        if on_output is not None:
+                            on_output(frame["stream"], frame["data"])
+                        continue
+                    if frame.get("op") == "spawn":
+                        self.child_pgid = frame.get("pgid")
+                        continue
+                    break
+            except KernelTimeout:
+                cancelled = self._interrupt_deadline is not None
+                await self._kill()
+                if cancelled:
+                    raise KernelCancelled("代码块已被中断，常驻执行内核已重启。")
+                raise
+            finally:
+                self.busy = False
+                self.child_pgid = None
+                self._interrupt_deadline = None
+            if not frame.get("ok"):
+                raise KernelError(frame.get("error", "未知错误"))
+            return frame
+
+    def _remaining(self, deadline):
+        """距离截止时间 (或中断宽限期结束) 的剩余秒数"""
+        if self._interrupt_deadline is not None:
+            deadline = min(deadline, self._interrupt_deadline) if deadline is not None else self._interrupt_deadline
+        return max(0, deadline - time.monotonic()) if deadline is not None else None
+
+    async def interrupt(self, grace=2.0):
+        """
+        中断正在执行的代码块：向内核发送 SIGINT，
+        内核在宽限期内未返回时由 request 强制回收，返回是否发出了中断
+        """
+        if not self.busy or not self.pid:
+            return False
+        self._interrupt_deadline = time.monotonic() + grace
+        self._frames.put_nowait({"op": "wakeup"}) # 唤醒 request 以按宽限期重新计算等待时间
+        await self._docker_exec("kill", "-INT", str(self.pid))
+        return True
+
+    async def execute(self, code, lang="python", session="default", timeout=120, on_output=None):
+        """
+        执行代码块，返回与一次性 docker exec 相同形状的 {stdout, stderr, returncode}
+        传入 on_output 时输出随到随交给回调，返回值中的 stdout/stderr 为空串。
+        """
+        collected = {"stdout": [], "stderr": []}
+        if on_output is None:
+            on_output = lambda stream, data: collected[stream].append(data)
+        frame = await self.request({"op": "exec", "lang": lang, "code": code, "session": session},
+                                   timeout=timeout, on_output=on_output)
+        return {
+            "stdout": "".join(collected["stdout"]),
+            "stderr": "".join(collected["stderr"]),
+            "returncode": frame.get("returncode", 0),
+        }
+
+    async def reset(self, session=None):
+        """清空指定会话（或全部会话）的 Python 命名空间"""
+        if not self.alive:
+            return
+        await self.request({"op": "reset", "session": session}, timeout=self.startup_timeout)
+
+    async def _docker_exec(self, *args):
+        """在容器内执行一条辅助命令 (忽略输出与失败)"""
+        try:
+            process = await asyncio.create_subprocess_exec(
+                "docker", "exec", self.container_name, *args,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+            await process.wait()
+        except OSError:
+            pass
+
+    async def _kill(self):
+        """强制回收内核：先清理容器内的进程组 (含正在执行的 Bash 进程组)，再结束本地 docker exec 客户端"""
+        if self.pid:
+            groups = [f"-{self.pid}"] + ([f"-{self.child_pgid}"] if self.child_pgid else [])
+            await self._docker_exec("kill", "-9", "--", *groups)
+        if self.process is not None:
+            if self.process.returncode is None:
+                try:
+                    self.process.kill()
+                except ProcessLookupError:
+                    pass
+            await self.process.wait()
+        if self._reader is not None:
+            self._reader.cancel()
+            self._reader = None
+        self.process = None
+        self.pid = None
+
+    async def close(self):
+        async with self._get_lock():
+            if self.alive:
+                try:
+                    self.process.stdin.close()
+                    await asyncio.wait_for(self.process.wait(), 5)
+                except Exception:
+                    pass
+            await self._kill()
+
+
+class KernelPool:
+    """
+    常驻内核池：按槽位管理同一容器内的多个内核会话
+    槽位 0 为主会话，其余槽位供并行代码块使用，各内核在首次使用时惰性启动。
+    """
+    def __init__(self, container_name, size, workdir="/app"):
+        self.kernels = [SandboxKernel(container_name, workdir) for _ in range(max(1, size))]
+
+    def get(self, slot=0):
+        return self.kernels[slot]
+
+    async def reset(self, session=None):
+        for kernel in self.kernels:
+            await kernel.reset(session)
+
+    async def interrupt(self):
+        """中断所有正在执行的内核，返回发出中断的数量"""
+        results = await asyncio.gather(*(kernel.interrupt() for kernel in self.kernels))
+        return sum(results)
+
+    async def close(self):
+        await asyncio.gather(*(kernel.close() for kernel in self.kernels))
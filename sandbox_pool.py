@@ -0,0 +1,161 @@
+import asyncio
+import os
+import time
+from docker_engine import SandboxBootstrap, DockerError
+
+
+class PoolExhausted(Exception):
+    """容器池已无空闲容器，且排队超时或排队人数已达上限"""
+
+
+class SandboxLease:
+    """
+    一次容器租约：会话独占一个池内容器，并拥有自己的工作目录
+    工作目录位于已挂载的输出目录下，宿主机与容器内路径分别为 host_dir / workdir。
+    """
+    def __init__(self, slot, sandbox, session_id, host_dir, workdir):
+        self.slot = slot
+        self.sandbox = sandbox
+        self.session_id = session_id
+        self.host_dir = host_dir
+        self.workdir = workdir
+        self.acquired_at = time.monotonic()
+
+    @property
+    def container_name(self):
+        return self.sandbox.container_name
+
+
+class SandboxPool:
+    """
+    预热的沙盒容器池 (asyncio)
+    - 启动时先引导第一个容器 (必要时构建镜像)，其余容器随后并行预热；
+    - 会话通过 acquire 独占租用一个容器，容器的引导在后台进行，首个代码块才会等待；
+    - 池耗尽时请求排队等待，排队超时或排队人数超过上限时抛出 PoolExhausted (由服务端转为 503)；
+    - 归还时执行过代码的容器会被重启以清理残留进程，之后才重新进入空闲队列。
+    """
+    def __init__(self, size, image, mounts, name_prefix="alice-sandbox-pool", max_waiters=16,
+                 session_root=None, container_session_root="/app/alice_output/sessions"):
+        self.size = max(1, size)
+        self.image = image
+        self.mounts = mounts
+        self.name_prefix = name_prefix
+        self.max_waiters = max_waiters
+        self.session_root = session_root
+        self.container_session_root = container_session_root
+        self.sandboxes = [self._create(slot) for slot in range(self.size)]
+        self.leases = {} # 会话 ID -> SandboxLease
+        self.waiting = 0
+        self.stats = {"leases": 0, "rejected": 0, "recycled": 0, "rebuilt": 0, "wait_ms": 0.0}
+        self._free = None
+        self._background = set()
+
+    def _create(self, slot):
+        return SandboxBootstrap(self.image, f"{self.name_prefix}-{slot}", self.mounts)
+
+    def _spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    async def start(self):
+        """所有槽位立即可租用；容器在后台预热"""
+        self._free = asyncio.Queue()
+        for slot in range(self.size):
+            self._free.put_nowait(slot)
+        self._spawn(self._warm())
+
+    async def _warm(self):
+        # 第一个容器单独引导，避免镜像缺失时多个槽位同时构建镜像
+        first = self.sandboxes[0]
+        first.start()
+        await asyncio.get_running_loop().run_in_executor(None, self._settle, first)
+        for sandbox in self.sandboxes[1:]:
+            sandbox.start()
+        if first.error is not None:
+            print(f"[系统]: 沙盒容器池预热失败 ({first.error})，会话仍可对话，但无法执行代码。")
+
+    @staticmethod
+    def _settle(sandbox):
+        try:
+            sandbox.wait()
+        except DockerError:
+            pass
+
+    @property
+    def free(self):
+        return self._free.qsize() if self._free is not None else 0
+
+    async def acquire(self, session_id, timeout=None):
+        """为会话租用一个容器；池耗尽时最多排队 timeout 秒"""
+        if self._free is None:
+            await self.start()
+        if self._free.empty() and self.waiting >= self.max_waiters:
+            self.stats["rejected"] += 1
+            raise PoolExhausted(f"沙盒容器池已满，且已有 {self.waiting} 个请求在排队。")
+        self.waiting += 1
+        wait_start = time.perf_counter()
+        try:
+            slot = await asyncio.wait_for(self._free.get(), timeout)
+        except asyncio.TimeoutError:
+            self.stats["rejected"] += 1
+            raise PoolExhausted(f"沙盒容器池已满，排队 {timeout:.0f} 秒后仍无空闲容器。")
+        finally:
+            self.waiting -= 1
+        self.stats["wait_ms"] += (time.perf_counter() - wait_start) * 1000
+        self.stats["leases"] += 1
+
+        host_dir = os.path.join(self.session_root, session_id) if self.session_root else None
+        workdir = f"{self.container_session_root}/{session_id}" if self.session_root else "/app"
+        if host_dir is not None:
+            os.makedirs(host_dir, exist_ok=True)
+        lease = SandboxLease(slot, self.sandboxes[slot], session_id, host_dir, workdir)
+        self.leases[session_id] = lease
+        return lease
+
+    def release(self, lease, dirty=True):
+        """归还容器：dirty 表示会话执行过代码，需要重启容器后才能再次租用"""
+        if self.leases.pop(lease.session_id, None) is None:
+            return
+        if lease.host_dir is not None:
+            try:
+                os.rmdir(lease.host_dir) # 只清理空目录，会话产出的文件保留在宿主机
+            except OSError:
+                pass
+        self._spawn(self._recycle(lease.slot, dirty))
+
+    async def _recycle(self, slot, dirty):
+        sandbox = self.sandboxes[slot]
+        loop = asyncio.get_running_loop()
+        if sandbox.error is not None:
+            # 引导失败的槽位重新引导 (例如 Docker 在服务启动后才可用)
+            self._replace(slot)
+        elif dirty and sandbox.ready:
+            try:
+                await loop.run_in_executor(None, sandbox.engine.restart_container, sandbox.container_name)
+                self.stats["recycled"] += 1
+            except (DockerError, OSError) as e:
+                print(f"[系统]: 回收容器 {sandbox.container_name} 失败 ({e})，将重新引导。")
+                self._replace(slot)
+        self._free.put_nowait(slot)
+
+    def _replace(self, slot):
+        self.sandboxes[slot] = self._create(slot)
+        self.sandboxes[slot].start()
+        self.stats["rebuilt"] += 1
+
+    def snapshot(self):
+        """容器池状态 (供 /stats 展示)"""
+        return {
+            "size": self.size,
+            "free": self.free,
+            "leased": len(self.leases),
+            "waiting": self.waiting,
+            "ready": sum(1 for sandbox in self.sandboxes if sandbox.ready),
+            **self.stats,
+        }
+
+    async def close(self):
+        for task in list(self._background):
+            task.cancel()
@@ -0,0 +1,352 @@
+"""
+Alice 服务模式
+
+以 HTTP + SSE 的方式同时为多个会话提供服务 (仅依赖标准库 asyncio)：
+    POST   /sessions                  创建会话，从沙盒容器池租用一个容器；池满时排队，超时返回 503
+    POST   /sessions/<id>/chat        发送 {"message": "..."}，以 SSE 流式返回本轮事件，最后一个事件为 done
+    POST   /sessions/<id>/interrupt   中断会话正在进行的轮次
+    DELETE /sessions/<id>             关闭会话并回收容器
+    GET    /stats                     会话与容器池状态
+
+所有会话共享记忆、技能快照与 LLM 客户端，各自拥有独立的消息历史、执行内核、容器工作目录
+(宿主机 alice_output/sessions/<id>) 与任务清单 (memory/sessions/<id>.md，会话关闭时删除)；
+人设文件为所有会话共用，服务模式下 update_prompt 会被拒绝。空闲超过 SESSION_IDLE_TIMEOUT 秒的会话会被自动关闭。
+
+用法: python server.py [--host 127.0.0.1] [--port 8765] [--pool-size 4]
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import time
+import uuid
+from http import HTTPStatus
+from urllib.parse import urlsplit
+import config
+from async_agent import AgentResources, AsyncAliceAgent, sandbox_mounts, session_todo_path
+from sandbox_pool import SandboxPool, PoolExhausted
+
+MAX_BODY_BYTES = 1 << 20
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class Session:
+    def __init__(self, session_id, agent, lease):
+        self.session_id = session_id
+        self.agent = agent
+        self.lease = lease
+        self.busy = False
+        self.turn_task = None # 进行中的 chat() Task
+        self.turns = 0
+        self.created_at = time.monotonic()
+        self.last_active = self.created_at
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+
+class AliceServer:
+    def __init__(self, pool_size=None, idle_timeout=None):
+        self.resources = AgentResources()
+        self.pool = SandboxPool(
+            pool_size or config.SANDBOX_POOL_SIZE,
+            config.SANDBOX_IMAGE,
+            sandbox_mounts(os.getcwd()),
+            name_prefix=config.SANDBOX_POOL_PREFIX,
+            max_waiters=config.SANDBOX_POOL_MAX_WAITERS,
+            session_root=config.SESSION_ROOT_DIR
+        )
+        self.idle_timeout = idle_timeout if idle_timeout is not None else config.SESSION_IDLE_TIMEOUT
+        self.sessions = {}
+        self.stats = {"sessions": 0, "turns": 0, "expired": 0}
+        self._reaper = None
+
+    async def start(self):
+        await self.pool.start()
+        if self.resources.distiller.start():
+            print(f"[系统]: 发现过期短期记忆 ({self.resources.distiller.detail})，已在后台启动提炼流程...")
+        self._reaper = asyncio.ensure_future(self._reap_idle())
+
+    async def close(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+        for session_id in list(self.sessions):
+            await self.close_session(session_id)
+        await self.pool.close()
+        await self.resources.close()
+
+    # ---- 会话管理 ----
+    async def create_session(self):
+        session_id = uuid.uuid4().hex[:12]
+        try:
+            lease = await self.pool.acquire(session_id, config.SANDBOX_POOL_WAIT)
+        except PoolExhausted as e:
+            raise HTTPError(503, str(e), {"Retry-After": "1"})
+        try:
+            agent = AsyncAliceAgent(resources=self.resources, sandbox=lease.sandbox, workdir=lease.workdir,
+                                    session_id=session_id, todo_path=session_todo_path(session_id),
+                                    prompt_editable=False)
+        except Exception:
+            self.pool.release(lease, dirty=False)
+            raise
+        session = Session(session_id, agent, lease)
+        self.sessions[session_id] = session
+        self.stats["sessions"] += 1
+        return session
+
+    async def close_session(self, session_id):
+        session = self.sessions.pop(session_id, None)
+        if session is None:
+            return False
+        finished = await self._finish_turn(session)
+        try:
+            await session.agent.close()
+        finally:
+            # 未能按时结束的轮次可能仍有代码块在容器内运行，归还前必须重启容器
+            self.pool.release(session.lease, dirty=session.agent.sandbox_used or not finished)
+            try:
+                os.remove(session.agent.todo_path)
+            except OSError:
+                pass
+        return True
+
+    async def _finish_turn(self, session):
+        """
+        中断会话进行中的轮次并等待其结束 (中断是协作式的，代码块需要一点时间才能停下)，
+        超过 SESSION_CLOSE_WAIT 秒则取消；返回轮次是否已经结束
+        """
+        task = session.turn_task
+        if task is None or task.done():
+            return True
+        session.agent.interrupt()
+        # asyncio.wait 不会抛出轮次本身的异常 (已由 _chat 报告给客户端)，超时也不会取消它
+        await asyncio.wait([task], timeout=config.SESSION_CLOSE_WAIT)
+        if not task.done():
+            task.cancel()
+            await asyncio.wait([task], timeout=1)
+        return task.done()
+
+    async def _reap_idle(self):
+        """定期关闭空闲超时的会话，把容器还给容器池"""
+        interval = min(30, max(1, self.idle_timeout / 4))
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for session_id, session in list(self.sessions.items()):
+                if not session.busy and now - session.last_active > self.idle_timeout:
+                    print(f"[系统]: 会话 {session_id} 空闲超时，已关闭并回收容器。")
+                    self.stats["expired"] += 1
+                    await self.close_session(session_id)
+
+    def _get_session(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise HTTPError(404, f"会话 {session_id} 不存在或已过期。")
+        return session
+
+    # ---- HTTP ----
+    async def handle(self, reader, writer):
+        try:
+            request = await self._read_request(reader)
+            if request is not None:
+                await self._dispatch(*request, writer)
+        except HTTPError as e:
+            await self._respond(writer, e.status, {"error": str(e)}, e.headers)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            print(f"[系统]: 处理请求时出错: {e}")
+            await self._respond(writer, 500, {"error": str(e)})
+        finally:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+    async def _read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, _ = line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "无效的请求行。")
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        raw_length = headers.get("content-length") or "0"
+        # isdigit 还会接受 "²" 等字符，int() 随后抛出 ValueError；只接受 ASCII 十进制数字
+        if not (raw_length.isascii() and raw_length.isdecimal()):
+            raise HTTPError(400, "Content-Length 不是合法的非负整数。")
+        length = int(raw_length)
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, "请求体过大。")
+        body = await reader.readexactly(length) if length else b""
+        try:
+            payload = json.loads(body) if body.strip() else {}
+        except ValueError:
+            raise HTTPError(400, "请求体不是合法的 JSON。")
+        if not isinstance(payload, dict):
+            raise HTTPError(400, "请求体必须是 JSON 对象。")
+        return method.upper(), urlsplit(target).path.rstrip("/"), payload
+
+    async def _dispatch(self, method, path, payload, writer):
+        parts = [part for part in path.split("/") if part]
+        if parts == ["stats"] and method == "GET":
+            return await self._respond(writer, 200, self.snapshot())
+        if parts == ["sessions"] and method == "POST":
+            session = await self.create_session()
+            return await self._respond(writer, 201, {"session_id": session.session_id, "workdir": session.lease.workdir})
+        if len(parts) == 2 and parts[0] == "sessions" and method == "DELETE":
+            if not await self.close_session(parts[1]):
+                raise HTTPError(404, f"会话 {parts[1]} 不存在或已过期。")
+            return await self._respond(writer, 200, {"closed": parts[1]})
+        if len(parts) == 3 and parts[0] == "sessions" and method == "POST":
+            session = self._get_session(parts[1])
+            if parts[2] == "chat":
+                return await self._chat(session, payload, writer)
+            if parts[2] == "interrupt":
+                if session.busy:
+                    session.agent.interrupt()
+                return await self._respond(writer, 200, {"interrupted": session.busy})
+        raise HTTPError(404, f"未知接口: {method} {path or '/'}")
+
+    async def _respond(self, writer, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        head = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+                "Content-Type: application/json; charset=utf-8",
+                f"Content-Length: {len(body)}",
+                "Connection: close"]
+        head += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        try:
+            writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+            await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+
+    @staticmethod
+    def _sse(event, payload):
+        return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+
+    async def _chat(self, session, payload, writer):
+        """执行一轮对话，期间的事件以 SSE 流式写回；客户端断开时中断本轮"""
+        message = str(payload.get("message") or "").strip()
+        if not message:
+            raise HTTPError(400, "缺少 message 字段。")
+        if session.busy:
+            raise HTTPError(409, "该会话正在处理上一条消息。")
+        session.busy = True
+        session.touch()
+        agent = session.agent
+        events = asyncio.Queue()
+        agent.on_event = lambda event, data: events.put_nowait((event, data))
+        writer.write(("HTTP/1.1 200 OK\r\n"
+                      "Content-Type: text/event-stream; charset=utf-8\r\n"
+                      "Cache-Control: no-cache\r\n"
+                      "Connection: close\r\n\r\n").encode("latin-1"))
+
+        start = time.perf_counter()
+        turn = asyncio.ensure_future(agent.chat(message))
+        session.turn_task = turn
+        turn.add_done_callback(lambda _: events.put_nowait(None))
+        connected = True
+        try:
+            finished = False
+            while not finished:
+                # 一次写出队列中已积压的全部事件，减少逐 token 的系统调用
+                items = [await events.get()]
+                while not events.empty():
+                    items.append(events.get_nowait())
+                if None in items:
+                    finished = True
+                    items = items[:items.index(None)]
+                if connected and items:
+                    try:
+                        writer.write(b"".join(self._sse(event, data) for event, data in items))
+                        await writer.drain()
+                    except (ConnectionError, OSError):
+                        connected = False
+                        agent.interrupt() # 客户端已断开，尽快结束本轮
+            if turn.cancelled():
+                error = "本轮对话已被取消。"
+            else:
+                error = turn.exception()
+            done = {
+                "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+                "interrupted": agent.interrupted,
+                "messages": len(agent.messages),
+            }
+            if connected:
+                if error:
+                    writer.write(self._sse("error", {"text": str(error)}))
+                writer.write(self._sse("done", done))
+                try:
+                    await writer.drain()
+                except (ConnectionError, OSError):
+                    pass
+        finally:
+            if not turn.done():
+                turn.cancel()
+            agent.on_event = None
+            session.turn_task = None
+            session.busy = False
+            session.turns += 1
+            session.touch()
+            self.stats["turns"] += 1
+
+    def snapshot(self):
+        now = time.monotonic()
+        return {
+            "sessions": {
+                "active": len(self.sessions),
+                "busy": sum(1 for s in self.sessions.values() if s.busy),
+                "oldest_idle_s": round(max((now - s.last_active for s in self.sessions.values()), default=0), 1),
+                **self.stats,
+            },
+            "pool": self.pool.snapshot(),
+            "distiller": self.resources.distiller.label,
+        }
+
+
+async def serve(host, port, pool_size=None):
+    server = AliceServer(pool_size)
+    await server.start()
+    listener = await asyncio.start_server(server.handle, host, port)
+    # SIGTERM 与 Ctrl-C 一样走正常收尾流程 (关闭会话、导出记忆视图)
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    print(f"[系统]: Alice 服务已启动 http://{host}:{port} (容器池 {server.pool.size})")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Alice 多会话服务 (HTTP + SSE)")
+    parser.add_argument("--host", default=config.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVER_PORT)
+    parser.add_argument("--pool-size", type=int, default=config.SANDBOX_POOL_SIZE)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.pool_size))
+    except KeyboardInterrupt:
+        print("\n服务已停止。")
+
+
+if __name__ == "__main__":
+    main()
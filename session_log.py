@@ -0,0 +1,157 @@
+"""
+会话持久化：只追加的消息日志
+
+每个会话一个 JSONL 文件 (<目录>/<会话 ID>.jsonl)，每行一条记录，op 字段总在最前：
+    {"op":"meta","session":...,"created":...}          文件头
+    {"op":"msg","m":{"role":...,"content":...}}        追加一条消息 (用户输入、回答、工具执行反馈)
+    {"op":"checkpoint","messages":[...]}                消息历史被整体替换 (上下文压缩、反馈归档) 后的完整快照
+    {"op":"turn","turn":3,"usage":{...}}                一轮对话结束时的轮次与累计用量
+系统消息不写入日志，恢复时按当前文件重新拼装。
+写入先进入缓冲区，距上次 fsync 超过 fsync_interval 秒或一轮结束时才批量落盘。
+
+恢复时把文件内存映射后从末尾反向查找最后一条 turn 记录及其之前的最后一个 checkpoint，只解析两者之间的部分，
+几百轮的会话也无需读入和解析整个文件；最后一条 turn 记录之后 (崩溃时未完成的轮次) 的记录被丢弃。
+恢复不会重新发送请求或重新执行任何代码块。
+"""
+import json
+import mmap
+import os
+import re
+import time
+from datetime import datetime
+
+CHECKPOINT = b'{"op":"checkpoint"'
+TURN = b'{"op":"turn"'
+
+
+def _dumps(record):
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+
+class SessionLog:
+    def __init__(self, directory, session_id, fsync_interval=1.0):
+        self.session_id = session_id
+        self.path = os.path.join(directory, re.sub(r"[^\w.-]", "_", session_id) + ".jsonl")
+        self.fsync_interval = fsync_interval
+        self._file = None
+        self._last_sync = time.monotonic()
+        self._dirty = False
+        self.discarded = 0 # 恢复时丢弃的未完成轮次的记录数
+
+    @property
+    def exists(self):
+        return os.path.exists(self.path)
+
+    @staticmethod
+    def latest(directory):
+        """最近修改的会话 ID (目录为空时返回 None)"""
+        try:
+            names = [n for n in os.listdir(directory) if n.endswith(".jsonl")]
+        except OSError:
+            return None
+        if not names:
+            return None
+        latest = max(names, key=lambda n: os.path.getmtime(os.path.join(directory, n)))
+        return latest[:-len(".jsonl")]
+
+    # ---- 写入 ----
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        new = not os.path.exists(self.path)
+        self._file = open(self.path, "a+", encoding="utf-8")
+        if new:
+            self._write({"op": "meta", "session": self.session_id,
+                         "created": datetime.now().isoformat(timespec="seconds")})
+        elif self._file.tell() > 0:
+            # 上次进程崩溃可能遗留不完整的尾行，先换行避免与新记录拼接
+            self._file.seek(self._file.tell() - 1)
+            if self._file.read(1) != "\n":
+                self._file.write("\n")
+
+    def _write(self, record):
+        if self._file is None:
+            self._open()
+        self._file.write(_dumps(record) + "\n")
+        self._dirty = True
+        if time.monotonic() - self._last_sync >= self.fsync_interval:
+            self.sync()
+
+    def append(self, message):
+        self._write({"op": "msg", "m": message})
+
+    def checkpoint(self, messages):
+        """消息历史被整体替换后写入完整快照 (不含系统消息)"""
+        self._write({"op": "checkpoint", "messages": [m for m in messages if m.get("role") != "system"]})
+
+    def end_turn(self, turn, usage):
+        self._write({"op": "turn", "turn": turn, "usage": usage})
+        self.sync()
+
+    def sync(self):
+        if self._file is not None and self._dirty:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._dirty = False
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    # ---- 恢复 ----
+    @staticmethod
+    def _find_record(data, prefix, end=None):
+        """反向查找 end 之前位于行首的最后一条指定类型记录的起始位置"""
+        end = len(data) if end is None else end
+        while True:
+            pos = data.rfind(prefix, 0, end)
+            if pos <= 0 or data[pos - 1] == ord("\n"):
+                return pos
+            end = pos
+
+    @staticmethod
+    def _line_at(data, pos):
+        end = data.find(b"\n", pos)
+        return data[pos:end if end >= 0 else len(data)]
+
+    def restore(self):
+        """
+        返回 (消息列表 (不含系统消息), 已完成的轮数, 累计用量)
+        只恢复到最后一条 turn 记录为止：其后的记录属于崩溃时未完成的轮次 (例如带 tool_calls 却缺少对应
+        tool 消息的回答)，带入历史会使之后的每次请求都被服务端拒绝。丢弃的记录数保存在 discarded 中。
+        """
+        self.discarded = 0
+        with open(self.path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return [], 0, {}
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                turn, usage = 0, {}
+                end = self._find_record(data, TURN)
+                while end >= 0:
+                    try:
+                        record = json.loads(self._line_at(data, end))
+                        turn, usage = record["turn"], record.get("usage", {})
+                        break
+                    except (ValueError, KeyError):
+                        end = self._find_record(data, TURN, end) # 不完整的 turn 记录，再往前找
+                end = max(end, 0)
+
+                # 最后一轮结束之前的最后一个快照，加上其后直到该轮结束的消息
+                messages = []
+                start = max(self._find_record(data, CHECKPOINT, end), 0)
+                for line in data[start:end].splitlines():
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue # 崩溃遗留的不完整行
+                    if record.get("op") == "checkpoint":
+                        messages = list(record["messages"])
+                    elif record.get("op") == "msg":
+                        messages.append(record["m"])
+                tail = data[end:].splitlines()[1 if turn else 0:]
+                self.discarded = sum(1 for line in tail if line.startswith((b'{"op":"msg"', CHECKPOINT)))
+        return messages, turn, usage
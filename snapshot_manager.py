@@ -1,4 +1,5 @@
 import os
+import threading
 import time
 import re
 
@@ -14,10 +15,44 @@ class SnapshotManager:
         ]
         self.snapshots = {}
         self.skills = {} # 技能注册表
-        self.refresh()
+        self.version = 0 # 快照内容每次变化时递增
+        self.stats = {"scans": 0, "skipped": 0}
+        self._fingerprint = None
+        self._listings = {} # 目录 -> (目录的 stat 指纹, 子目录列表)
+        # 系统消息可能在线程池中投机刷新 (服务模式下各会话共用同一个快照)，刷新需互斥
+        self._lock = threading.RLock()
+        self.refresh(force=True)
 
-    def _get_summary(self, path):
-        """生成极简摘要：文件名、大小、最后修改时间、以及前两行内容"""
+    def _stat_key(self, path):
+        try:
+            st = os.stat(path)
+            return (path, st.st_mtime_ns, st.st_size)
+        except OSError:
+            return (path, None, None)
+
+    def _subdirs(self, path, key):
+        """目录下的子目录列表；目录自身的 mtime 未变 (没有增删条目) 时沿用上次的列表"""
+        cached = self._listings.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        with os.scandir(path) as entries:
+            subdirs = sorted(entry.path for entry in entries if entry.is_dir())
+        self._listings[path] = (key, subdirs)
+        return subdirs
+
+    def fingerprint(self):
+        """廉价指纹：只 stat 核心路径及各技能的 SKILL.md，不读取文件内容，子目录列表按目录 mtime 缓存"""
+        keys = []
+        for path in self.core_paths:
+            key = self._stat_key(path)
+            keys.append(key)
+            if key[1] is not None and os.path.isdir(path):
+                for item_path in self._subdirs(path, key):
+                    keys.append(self._stat_key(os.path.join(item_path, "SKILL.md")))
+        return tuple(keys)
+
+    def _get_summary(self, path, skills):
+        """生成极简摘要：文件名、大小、最后修改时间、以及前两行内容；SKILL.md 顺带登记到 skills"""
         if not os.path.exists(path):
             return None
         
@@ -45,7 +80,7 @@ class SnapshotManager:
                     
                     # 注册到技能表 (使用目录名作为 key)
                     skill_name = os.path.basename(os.path.dirname(path))
-                    self.skills[skill_name] = {
+                    skills[skill_name] = {
                         "name": skill_name,
                         "description": desc,
                         "yaml": yaml_content,
@@ -64,24 +99,40 @@ class SnapshotManager:
         except Exception as e:
             return f"[路径: {path}, 状态: 无法读取 ({str(e)})]"
 
-    def refresh(self):
-        """刷新所有快照和技能注册表"""
-        new_snapshots = {}
-        self.skills = {} # 重置注册表
-        for path in self.core_paths:
-            if os.path.isfile(path):
-                new_snapshots[path] = self._get_summary(path)
-            elif os.path.isdir(path):
-                # 记录目录快照，并深入一层记录关键技能
-                new_snapshots[path] = self._get_summary(path)
-                if os.path.exists(path):
-                    for item in sorted(os.listdir(path)):
-                        item_path = os.path.join(path, item)
-                        if os.path.isdir(item_path):
-                            skill_md = os.path.join(item_path, "SKILL.md")
-                            if os.path.exists(skill_md):
-                                new_snapshots[skill_md] = self._get_summary(skill_md)
-        self.snapshots = new_snapshots
+    def refresh(self, force=False):
+        """
+        刷新所有快照和技能注册表；监视路径均未变化时跳过重扫，返回快照是否有变化
+        新的快照与注册表建好后整体替换，其它线程读取时不会看到扫描到一半的结果
+        """
+        with self._lock:
+            fingerprint = self.fingerprint()
+            if not force and fingerprint == self._fingerprint:
+                self.stats["skipped"] += 1
+                return False
+            self._fingerprint = fingerprint
+            self.stats["scans"] += 1
+
+            new_snapshots = {}
+            skills = {}
+            for path in self.core_paths:
+                if os.path.isfile(path):
+                    new_snapshots[path] = self._get_summary(path, skills)
+                elif os.path.isdir(path):
+                    # 记录目录快照，并深入一层记录关键技能
+                    new_snapshots[path] = self._get_summary(path, skills)
+                    if os.path.exists(path):
+                        for item in sorted(os.listdir(path)):
+                            item_path = os.path.join(path, item)
+                            if os.path.isdir(item_path):
+                                skill_md = os.path.join(item_path, "SKILL.md")
+                                if os.path.exists(skill_md):
+                                    new_snapshots[skill_md] = self._get_summary(skill_md, skills)
+            self.skills = skills
+            changed = new_snapshots != self.snapshots
+            self.snapshots = new_snapshots
+            if changed:
+                self.version += 1
+            return changed
 
     def get_index_text(self):
         """生成注入上下文的索引文本"""
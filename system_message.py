@@ -0,0 +1,76 @@
+import hashlib
+import os
+import threading
+
+
+class Segment:
+    """
+    系统消息中的一个片段
+    key_func 返回廉价的变化指纹（如文件 mtime/size），只有指纹变化时才调用 loader 重新加载；
+    重新加载后若内容哈希未变，片段仍视为未变化。
+    """
+    def __init__(self, name, loader, key_func=None, volatile=False):
+        self.name = name
+        self.loader = loader
+        self.key_func = key_func
+        self.volatile = volatile
+        self.text = None
+        self.digest = None
+        self._key = None
+        self.reloads = 0
+
+    def update(self, force=False):
+        """按需重新加载，返回内容是否变化"""
+        key = self.key_func() if self.key_func else None
+        if not force and self.text is not None and (self.key_func is None or key == self._key):
+            return False
+        self._key = key
+        text = self.loader()
+        self.reloads += 1
+        digest = hashlib.md5(text.encode("utf-8")).hexdigest()
+        if digest == self.digest:
+            return False
+        self.text = text
+        self.digest = digest
+        return True
+
+
+def file_key(path):
+    """文件片段的变化指纹"""
+    def key():
+        try:
+            st = os.stat(path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+    return key
+
+
+class SystemMessageBuilder:
+    """
+    由缓存片段增量拼装系统消息
+    稳定片段（环境说明、人设、长期记忆）排在前面，易变片段（快照索引、短期记忆、任务清单）
+    排在末尾，使系统消息的公共前缀在多轮之间保持不变，便于服务端前缀缓存命中。
+    所有片段都未变化时直接复用上一次拼好的字符串。
+    build 可以在线程池中调用 (投机刷新)，内部加锁，同一时刻只有一次拼装。
+    """
+    def __init__(self, segments):
+        # 稳定片段在前、易变片段在后 (同类保持声明顺序)
+        self.segments = sorted(segments, key=lambda seg: seg.volatile)
+        self.content = None
+        self.stats = {"builds": 0, "rebuilds": 0, "skipped": 0}
+        self._lock = threading.Lock()
+
+    def build(self, force=False):
+        """返回 (系统消息, 是否重新拼装)"""
+        with self._lock:
+            self.stats["builds"] += 1
+            changed = False
+            for segment in self.segments:
+                changed = segment.update(force) or changed
+            if not changed and self.content is not None:
+                self.stats["skipped"] += 1
+                return self.content, False
+            self.content = "\n\n".join(seg.text for seg in self.segments if seg.text)
+            self.stats["rebuilds"] += 1
+            return self.content, True
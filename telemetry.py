@@ -0,0 +1,182 @@
+"""
+Alice 的逐轮性能追踪
+
+每一轮对话记录若干结构化 span，写入按大小滚动的 JSONL 追踪文件，每行一条：
+    {"ts": ..., "span": "llm", "session": ..., "turn": 3, "round": 1, "ttft_ms": ..., ...}
+span 类型:
+    llm      一次 LLM 回答：首 token 延迟、建立请求耗时、推理/正文的 token 数与生成速率、总耗时、
+             重试与续传次数、是否来自录制缓存
+    exec     一个代码块：语言、执行耗时、反馈输出字节数
+    compact  请求前的上下文压缩：耗时与压缩前后 token 数
+    refresh  系统消息刷新：所在工具轮 (0 为对话开始时)、耗时、是否重新拼装、是否为投机刷新，
+             以及其中位于关键路径上 (阻塞下一次 LLM 请求) 的耗时
+    turn     一轮对话汇总：总耗时、LLM 请求数、代码块数、归档的工具反馈数、消息历史条数与估算 token 数
+内置指令 `stats` 汇总追踪文件中最近记录的 p50/p95。
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from context_manager import estimate_tokens
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+class TraceWriter:
+    """按大小滚动的 JSONL 文件：trace.jsonl 写满后依次改名为 trace.jsonl.1 ... trace.jsonl.<backups>"""
+    def __init__(self, path, max_bytes=5 * 1024 * 1024, backups=3):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = threading.Lock()
+        self._file = None
+        self._size = 0
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, "ab")
+        self._size = self._file.tell()
+
+    def _rotate(self):
+        self._file.close()
+        for index in range(self.backups, 0, -1):
+            source = self.path if index == 1 else f"{self.path}.{index - 1}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index}")
+        if self.backups <= 0:
+            os.remove(self.path)
+        self._open()
+
+    def write(self, record):
+        # 按编码后的字节数计量，中文较多的记录也不会超出 max_bytes
+        data = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            if self._file is None:
+                self._open()
+            if self._size and self._size + len(data) > self.max_bytes:
+                self._rotate()
+            self._file.write(data)
+            self._file.flush()
+            self._size += len(data)
+
+    def files(self):
+        """现存的追踪文件，从旧到新"""
+        paths = [f"{self.path}.{index}" for index in range(self.backups, 0, -1)] + [self.path]
+        return [path for path in paths if os.path.exists(path)]
+
+    def read(self, limit=None):
+        """读取最近的 limit 条记录 (忽略不完整的行)"""
+        records = deque(maxlen=limit)
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+            for path in self.files():
+                with open(path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            records.append(json.loads(line))
+                        except ValueError:
+                            continue
+        return list(records)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class StreamTimer:
+    """记录一次流式回答的时间点，计算首 token 延迟与推理/正文两段的生成速率"""
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first = None
+        self.phases = {"reasoning": [None, None], "content": [None, None]}
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        if self.first is None:
+            self.first = now
+        span = self.phases[phase]
+        if span[0] is None:
+            span[0] = now
+        span[1] = now
+
+    def fields(self, reasoning, content):
+        end = time.perf_counter()
+        result = {
+            "ttft_ms": round((self.first - self.start) * 1000, 1) if self.first is not None else None,
+            "total_ms": round((end - self.start) * 1000, 1),
+        }
+        for phase, text in (("reasoning", reasoning), ("content", content)):
+            tokens = estimate_tokens(text)
+            first, last = self.phases[phase]
+            duration = (last - first) if first is not None else 0
+            result[f"{phase}_tokens"] = tokens
+            result[f"{phase}_tps"] = round(tokens / duration, 1) if duration > 0 else None
+        return result
+
+
+class Telemetry:
+    """span 记录器 (可在多个会话间共享)"""
+    SUMMARY_FIELDS = [
+        ("llm", "ttft_ms", "首 token 延迟 (ms)"),
+        ("llm", "request_ms", "建立请求 (ms)"),
+        ("llm", "total_ms", "LLM 请求耗时 (ms)"),
+        ("llm", "reasoning_tps", "推理速率 (token/s)"),
+        ("llm", "content_tps", "正文速率 (token/s)"),
+        ("exec", "ms", "代码块执行 (ms)"),
+        ("exec", "output_bytes", "代码块输出 (字节)"),
+        ("compact", "ms", "上下文压缩 (ms)"),
+        ("refresh", "ms", "系统消息刷新 (ms)"),
+        ("refresh", "critical_ms", "系统消息刷新·关键路径 (ms)"),
+        ("turn", "ms", "整轮耗时 (ms)"),
+        ("turn", "history_tokens", "消息历史 (token)"),
+    ]
+
+    def __init__(self, path, max_bytes=5 * 1024 * 1024, backups=3):
+        self.writer = TraceWriter(path, max_bytes, backups)
+
+    def record(self, span, **fields):
+        record = {"ts": datetime.now().isoformat(timespec="milliseconds"), "span": span}
+        record.update(fields)
+        try:
+            self.writer.write(record)
+        except OSError as e:
+            print(f"写入性能追踪失败: {e}")
+
+    def summarize(self, limit=5000, session=None):
+        """最近 limit 条记录中各项指标的 p50/p95 (Markdown 表格)"""
+        records = self.writer.read(limit)
+        if session is not None:
+            records = [r for r in records if r.get("session") == session]
+        if not records:
+            return "暂无性能追踪记录。"
+        rows = []
+        for span, field, label in self.SUMMARY_FIELDS:
+            values = [r[field] for r in records if r.get("span") == span and r.get(field) is not None]
+            if not values:
+                continue
+            rows.append(f"| {label} | {len(values)} | {percentile(values, 50):.1f} | "
+                        f"{percentile(values, 95):.1f} | {max(values):.1f} |")
+        turns = sum(1 for r in records if r.get("span") == "turn")
+        scope = f"会话 {session}" if session is not None else "全部会话"
+        header = (f"### 性能统计 ({scope}，最近 {len(records)} 条记录，{turns} 轮对话)\n"
+                  "| 指标 | 样本数 | p50 | p95 | 最大值 |\n| :--- | ---: | ---: | ---: | ---: |")
+        llm = [r for r in records if r.get("span") == "llm"]
+        retries = sum(r.get("retries", 0) for r in llm)
+        resumes = sum(r.get("resumes", 0) for r in llm)
+        footer = f"\n\nLLM 请求重试 {retries} 次，中途断开续传 {resumes} 次。" if retries or resumes else ""
+        return header + "\n" + "\n".join(rows) + footer
+
+    def close(self):
+        self.writer.close()
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# 测试直接导入仓库根目录下的模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# config 要求的环境变量 (测试不会发起真实的 LLM 请求)
+os.environ.setdefault("API_KEY", "test")
+os.environ.setdefault("MODEL_NAME", "test-model")
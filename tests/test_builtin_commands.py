@@ -0,0 +1,107 @@
+import asyncio
+import time
+
+from builtin_commands import BuiltinRegistry, parse_text, split_text
+
+
+def make_registry():
+    registry = BuiltinRegistry()
+    registry.register("toolkit", lambda argv: ("toolkit", argv))
+    registry.register("memory", lambda text, flags: ("memory", text, flags), mode="text", flags=("--ltm",))
+    registry.register("memory search", lambda text: ("search", text), mode="text")
+    registry.register("todo", lambda text: ("todo", text), mode="text")
+    registry.register("clear", lambda: "clear", mode="none")
+    return registry
+
+
+def call(registry, command):
+    found = registry.match(command)
+    if found is None:
+        return None
+    spec, args, _ = found
+    return spec.handler(*args)
+
+
+def test_parse_text_quotes():
+    assert parse_text('"hello world"') == "hello world"
+    assert parse_text("'a \"b\" c'") == 'a "b" c'
+    assert parse_text(r'"say \"hi\" to \\ $HOME"') == r'say "hi" to \ $HOME'
+    assert parse_text("plain text") == "plain text"
+    assert parse_text('"unclosed') == "unclosed"
+
+
+def test_parse_text_unescaped_inner_quotes():
+    assert parse_text('"he said "hi" ok"') == 'he said "hi" ok'
+
+
+def test_unclosed_quote_is_linear():
+    text = '"' + "任务 a\\b " * 5000
+    start = time.perf_counter()
+    assert parse_text(text).startswith("任务 a")
+    assert split_text(text + "\nls") == (text + "\nls", "")
+    assert time.perf_counter() - start < 0.5
+
+
+def test_split_text_at_closing_quote_line():
+    assert split_text('"a"\nls') == ('"a"', "ls")
+    assert split_text('--ltm "a" --ltm\nls -la', ("--ltm",)) == ('--ltm "a" --ltm', "ls -la")
+    assert split_text('"- [ ] a\n- [ ] b"') == ('"- [ ] a\n- [ ] b"', "")
+    assert split_text("plain\nmore lines") == ("plain\nmore lines", "")
+
+
+def test_multiline_block_splits_at_closing_quote():
+    registry = make_registry()
+    spec, args, following = registry.match('memory "a" --ltm\nls')
+    assert (spec.name, args, following) == ("memory", ("a", {"--ltm"}), "ls")
+
+
+def test_dispatch_runs_each_builtin_line():
+    calls = []
+    registry = BuiltinRegistry()
+    registry.register("memory", lambda text, flags: calls.append(("memory", text)) or "已记录", mode="text", flags=("--ltm",))
+    registry.register("todo", lambda text: calls.append(("todo", text)) or "已更新", mode="text")
+    result = asyncio.run(registry.dispatch('memory "x"\ntodo "y"'))
+    assert calls == [("memory", "x"), ("todo", "y")]
+    assert result == "已记录\n已更新"
+
+
+def test_dispatch_reports_trailing_shell_command():
+    calls = []
+    registry = BuiltinRegistry()
+    registry.register("memory", lambda text: calls.append(text) or "已记录", mode="text")
+    result = asyncio.run(registry.dispatch('memory "要记住的事"\nls -la'))
+    assert calls == ["要记住的事"] # 内置指令照常执行，记忆不会丢失
+    assert result.startswith("已记录\n错误: ") and result.endswith("ls -la")
+
+
+def test_quoted_text_keeps_newlines():
+    registry = make_registry()
+    assert call(registry, 'todo "- [ ] a\n- [ ] b"') == ("todo", "- [ ] a\n- [ ] b")
+
+
+def test_flags_before_or_after_text():
+    registry = make_registry()
+    assert call(registry, 'memory --ltm "记住这个"') == ("memory", "记住这个", {"--ltm"})
+    assert call(registry, 'memory "记住这个" --ltm') == ("memory", "记住这个", {"--ltm"})
+    assert call(registry, 'memory "含有 --ltm 的文字"') == ("memory", "含有 --ltm 的文字", set())
+
+
+def test_longest_name_wins():
+    registry = make_registry()
+    assert call(registry, 'memory  search "关键词"') == ("search", "关键词")
+    assert call(registry, "memory searching") == ("memory", "searching", set())
+
+
+def test_argv_and_none_modes():
+    registry = make_registry()
+    assert call(registry, 'toolkit info "my tool"') == ("toolkit", ["info", "my tool"])
+    assert call(registry, "clear") == "clear"
+    assert registry.match("clear now") is None
+    assert registry.match("ls -la") is None
+
+
+def test_dispatch_empty_text_returns_usage():
+    registry = BuiltinRegistry()
+    registry.register("todo", lambda text: text, mode="text", usage="用法: todo \"内容\"")
+    assert asyncio.run(registry.dispatch('todo ""')) == "用法: todo \"内容\""
+    assert asyncio.run(registry.dispatch("pwd")) is None
@@ -0,0 +1,63 @@
+from context_manager import FEEDBACK_PREFIX, SUMMARY_PREFIX, ContextManager, estimate_tokens
+
+
+def turn(index, feedback_chars=0):
+    messages = [{"role": "user", "content": f"问题 {index}"},
+                {"role": "assistant", "content": f"回答 {index}\n```bash\nls\n```"}]
+    if feedback_chars:
+        messages.append({"role": "user", "content": FEEDBACK_PREFIX + "x" * feedback_chars})
+        messages.append({"role": "assistant", "content": f"总结 {index}"})
+    return messages
+
+
+def conversation(turns, feedback_chars=0):
+    messages = [{"role": "system", "content": "你是 Alice。"}]
+    for index in range(turns):
+        messages += turn(index, feedback_chars)
+    return messages
+
+
+def manager_budget(messages, ratio):
+    return int(ContextManager().total(messages) * ratio)
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd" * 10) == 10
+    assert estimate_tokens("中文内容") == 4
+
+
+def test_feedback_detection():
+    assert ContextManager.is_feedback({"role": "tool", "content": "ok"})
+    assert ContextManager.is_feedback({"role": "user", "content": FEEDBACK_PREFIX + "ok"})
+    assert not ContextManager.is_feedback({"role": "user", "content": "你好"})
+    assert not ContextManager.is_turn_start({"role": "user", "content": SUMMARY_PREFIX + "..."})
+
+
+def test_within_budget_is_untouched():
+    manager = ContextManager(budget=100000)
+    messages = conversation(3, feedback_chars=100)
+    assert manager.compact(messages) is messages
+    assert manager.last_stats["tiers"] == []
+
+
+def test_truncate_old_feedback_first():
+    messages = conversation(6, feedback_chars=4000)
+    manager = ContextManager(budget=manager_budget(messages, 0.8), keep_turns=2, feedback_chars=200)
+    result = manager.compact(messages)
+    assert manager.last_stats["tiers"] == ["truncate_feedback"]
+    assert manager.last_stats["tokens_after"] <= manager.budget
+    assert result[0] == messages[0]
+    assert result[-8:] == messages[-8:] # 最近 keep_turns 轮原样保留
+    assert "已截断" in result[3]["content"]
+
+
+def test_summarize_then_shrink_recent():
+    messages = conversation(6, feedback_chars=4000)
+    manager = ContextManager(budget=1500, keep_turns=2, feedback_chars=200)
+    result = manager.compact(messages)
+    assert manager.last_stats["tiers"] == ["truncate_feedback", "summarize", "shrink_recent"]
+    assert result[1]["content"].startswith(SUMMARY_PREFIX)
+    assert "问题 0" in result[1]["content"]
+    assert result[-4:] == messages[-4:] # 当前轮不截断
+    assert "已截断" in result[-6]["content"]
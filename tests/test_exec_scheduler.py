@@ -0,0 +1,42 @@
+import asyncio
+
+from exec_scheduler import ExecutionScheduler, is_read_only_command
+from fence_parser import CodeBlock
+
+
+def run_blocks(blocks, mode="marked"):
+    slots = {}
+
+    async def runner(block, slot):
+        slots[block.index] = slot
+        await asyncio.sleep(0)
+        return block.code
+
+    async def main():
+        scheduler = ExecutionScheduler(runner, workers=2, mode=mode)
+        scheduler.begin_turn()
+        tasks = [scheduler.submit(block) for block in blocks]
+        return [await task for task in tasks]
+
+    return asyncio.run(main()), slots
+
+
+def test_marked_bash_blocks_use_parallel_slots():
+    blocks = [CodeBlock(0, "bash", "curl a", True), CodeBlock(1, "bash", "curl b", True)]
+    results, slots = run_blocks(blocks)
+    assert results == ["curl a", "curl b"]
+    assert set(slots.values()) <= {1, 2} and 0 not in slots.values()
+
+
+def test_python_blocks_stay_on_main_session():
+    blocks = [CodeBlock(0, "python", "x = 1", True), CodeBlock(1, "python", "print(x)", True)]
+    _, slots = run_blocks(blocks, mode="auto")
+    assert slots == {0: 0, 1: 0}
+
+
+def test_auto_mode_read_only_commands():
+    assert is_read_only_command("cat a.txt | grep foo")
+    assert not is_read_only_command("cat a.txt > b.txt")
+    assert not is_read_only_command("rm -rf build")
+    _, slots = run_blocks([CodeBlock(0, "bash", "ls", False)], mode="auto")
+    assert slots[0] != 0
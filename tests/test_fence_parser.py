@@ -0,0 +1,32 @@
+from fence_parser import FenceParser
+
+
+def feed_all(deltas):
+    parser = FenceParser()
+    blocks = []
+    for delta in deltas:
+        blocks += parser.feed(delta)
+    return blocks
+
+
+def test_block_emitted_when_fence_closes():
+    parser = FenceParser()
+    assert parser.feed("先看看目录：\n```bash\nls -la") == []
+    assert parser.feed("\n") == []
+    blocks = parser.feed("```\n然后")
+    assert [(b.index, b.lang, b.code, b.parallel) for b in blocks] == [(0, "bash", "ls -la", False)]
+
+
+def test_split_across_arbitrary_deltas():
+    text = "a\n```python\nprint(1)\n```\nb\n```bash parallel\ncurl x\n```\n```bash\npwd\n```"
+    expected = [("python", "print(1)", False), ("bash", "curl x", True), ("bash", "pwd", False)]
+    for size in (1, 2, 3, 7, len(text)):
+        deltas = [text[i:i + size] for i in range(0, len(text), size)]
+        blocks = feed_all(deltas)
+        assert [(b.lang, b.code, b.parallel) for b in blocks] == expected
+        assert [b.index for b in blocks] == [0, 1, 2]
+
+
+def test_other_languages_and_unclosed_fences_are_ignored():
+    assert feed_all(["```json\n{}\n```\n", "```bash\necho unfinished"]) == []
+    assert feed_all(["", None]) == []
@@ -0,0 +1,52 @@
+import httpx
+from openai import APIConnectionError, APIError, APIResponseValidationError, APIStatusError, APITimeoutError
+
+from llm_transport import RetryPolicy, is_retryable, resume_messages
+
+REQUEST = httpx.Request("POST", "http://llm.test/v1/chat/completions")
+
+
+def status_error(code, headers=None):
+    response = httpx.Response(code, request=REQUEST, headers=headers or {})
+    return APIStatusError(f"HTTP {code}", response=response, body=None)
+
+
+def test_retryable_status_codes():
+    for code in (408, 409, 429, 500, 502, 503):
+        assert is_retryable(status_error(code))
+    for code in (400, 401, 403, 404, 422):
+        assert not is_retryable(status_error(code))
+
+
+def test_transport_errors_are_retryable():
+    assert is_retryable(APIConnectionError(request=REQUEST))
+    assert is_retryable(APITimeoutError(request=REQUEST))
+    assert is_retryable(httpx.ReadTimeout("timeout", request=REQUEST))
+    assert not is_retryable(ValueError("bad"))
+
+
+def test_non_transient_api_errors_are_not_retried():
+    response = httpx.Response(200, request=REQUEST)
+    assert not is_retryable(APIResponseValidationError(response, body=None))
+    assert not is_retryable(APIError("invalid request", REQUEST, body=None))
+
+
+def test_retry_after_takes_precedence():
+    policy = RetryPolicy(base_delay=0.5, max_delay=8.0)
+    assert policy.delay(0, status_error(429, {"retry-after": "3"})) == 3.0
+    assert policy.delay(0, status_error(429, {"retry-after": "120"})) == 8.0
+    assert 0 <= policy.delay(0, status_error(429, {"retry-after": "soon"})) <= 0.5
+
+
+def test_backoff_is_capped():
+    policy = RetryPolicy(base_delay=0.5, max_delay=2.0)
+    for attempt in range(10):
+        assert 0 <= policy.delay(attempt) <= min(2.0, 0.5 * 2 ** attempt)
+
+
+def test_resume_messages_keep_partial_answer():
+    messages = [{"role": "user", "content": "hi"}]
+    resumed = resume_messages(messages, "半截回答")
+    assert resumed[:1] == messages and resumed[1] == {"role": "assistant", "content": "半截回答"}
+    assert resumed[2]["role"] == "user"
+    assert messages == [{"role": "user", "content": "hi"}]
@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+
+from memory_distiller import MemoryDistiller, NO_UPDATE
+from memory_store import MemoryStore
+
+
+class FakeClient:
+    """按调用顺序返回预设回复的同步客户端"""
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages):
+        message = SimpleNamespace(content=self.replies.pop(0))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def make_store(tmp_path, days=("2020-01-01",)):
+    store = MemoryStore(str(tmp_path / "log.jsonl"), str(tmp_path / "ltm.md"), str(tmp_path / "stm.md"))
+    for day in days:
+        store.add_stm(f"{day} 用户讨论了项目进度", date=day)
+    return store
+
+
+def make_distiller(store, replies, chunk_tokens=6000):
+    return MemoryDistiller(store, FakeClient(replies), "mock", chunk_tokens=chunk_tokens, concurrency=1,
+                           checkpoint_path=None)
+
+
+def test_reduce_keeps_numbered_plus_and_plain_lines(tmp_path):
+    distiller = make_distiller(make_store(tmp_path), [])
+    summary = distiller.reduce(["1. 用户偏好深色主题\n2) 项目改用 PostgreSQL\n+ 每周五复盘\n用户住在杭州\n* 喜欢简洁回答"])
+    assert summary.splitlines() == ["- 用户偏好深色主题", "- 项目改用 PostgreSQL", "- 每周五复盘",
+                                    "- 用户住在杭州", "- 喜欢简洁回答"]
+
+
+def test_reduce_skips_no_update_and_duplicates(tmp_path):
+    store = make_store(tmp_path)
+    store.add_ltm("用户偏好深色主题")
+    distiller = make_distiller(store, [])
+    assert distiller.reduce([NO_UPDATE, "- 用户偏好深色主题\n- 新的要点"]) == "- 新的要点"
+
+
+def test_run_writes_numbered_items_before_pruning(tmp_path):
+    store = make_store(tmp_path)
+    make_distiller(store, ["1. 项目里程碑: 完成 v1 发布"]).run()
+    assert store.stm_dates == []
+    assert any("完成 v1 发布" in text for _, text in store.entries("ltm"))
+
+
+def test_run_keeps_days_whose_partial_is_empty(tmp_path):
+    # 每天一个分块：第一天提炼出要点，第二天的结果为空
+    store = make_store(tmp_path, days=("2020-01-01", "2020-01-02"))
+    distiller = make_distiller(store, ["- 要点 A", ""], chunk_tokens=10)
+    distiller.run()
+    assert store.stm_dates == ["2020-01-02"]
+    assert any("要点 A" in text for _, text in store.entries("ltm"))
@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+
+from server import AliceServer, HTTPError
+
+
+def read_request(raw):
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(raw)
+        reader.feed_eof()
+        # _read_request 不依赖实例状态，无需创建容器池
+        return await AliceServer._read_request(None, reader)
+    return asyncio.run(run())
+
+
+def test_reads_json_body():
+    body = b'{"message": "hi"}'
+    raw = b"POST /sessions/abc/chat/ HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body)
+    assert read_request(raw) == ("POST", "/sessions/abc/chat", {"message": "hi"})
+
+
+@pytest.mark.parametrize("value", [b"abc", b"-5", b"1e3", b" 12x", b"\xb2", b"1\xb9"])
+def test_malformed_content_length_is_400(value):
+    with pytest.raises(HTTPError) as excinfo:
+        read_request(b"POST /sessions HTTP/1.1\r\nContent-Length: " + value + b"\r\n\r\n")
+    assert excinfo.value.status == 400
+
+
+@pytest.mark.parametrize("body", [b"[]", b'"x"', b"1", b"null"])
+def test_non_object_body_is_400(body):
+    raw = b"POST /sessions/abc/chat HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body)
+    with pytest.raises(HTTPError) as excinfo:
+        read_request(raw)
+    assert excinfo.value.status == 400
+
+
+def test_oversized_body_is_413():
+    with pytest.raises(HTTPError) as excinfo:
+        read_request(b"POST /sessions HTTP/1.1\r\nContent-Length: 99999999\r\n\r\n")
+    assert excinfo.value.status == 413
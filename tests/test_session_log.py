@@ -0,0 +1,81 @@
+from session_log import SessionLog
+
+
+def user(text):
+    return {"role": "user", "content": text}
+
+
+def assistant(text, calls=None):
+    message = {"role": "assistant", "content": text}
+    if calls:
+        message["tool_calls"] = [{"id": call, "type": "function",
+                                  "function": {"name": "bash", "arguments": "{}"}} for call in calls]
+    return message
+
+
+def write_turns(log, turns):
+    for index, (question, answer) in enumerate(turns, 1):
+        log.append(user(question))
+        log.append(assistant(answer))
+        log.end_turn(index, {"llm_requests": index})
+
+
+def test_restore_round_trip(tmp_path):
+    log = SessionLog(str(tmp_path), "s1")
+    write_turns(log, [("q1", "a1"), ("q2", "a2")])
+    log.close()
+    messages, turn, usage = SessionLog(str(tmp_path), "s1").restore()
+    assert messages == [user("q1"), assistant("a1"), user("q2"), assistant("a2")]
+    assert turn == 2 and usage == {"llm_requests": 2}
+
+
+def test_restore_drops_turn_left_unfinished_by_crash(tmp_path):
+    log = SessionLog(str(tmp_path), "s2")
+    write_turns(log, [("q1", "a1")])
+    # 崩溃：回答带 tool_calls，但对应的 tool 消息与 turn 记录都没有写入
+    log.append(user("q2"))
+    log.append(assistant("", calls=["call_0"]))
+    log.close()
+    restored = SessionLog(str(tmp_path), "s2")
+    messages, turn, _ = restored.restore()
+    assert messages == [user("q1"), assistant("a1")]
+    assert turn == 1 and restored.discarded == 2
+
+
+def test_restore_ignores_checkpoint_written_during_unfinished_turn(tmp_path):
+    log = SessionLog(str(tmp_path), "s3")
+    log.append(user("q1"))
+    log.checkpoint([user("q1")])
+    log.append(assistant("a1"))
+    log.end_turn(1, {})
+    # 未完成的下一轮中发生了上下文压缩
+    log.checkpoint([user("q1"), assistant("a1"), user("q2")])
+    log.append(assistant("", calls=["call_0"]))
+    log.close()
+    messages, turn, _ = SessionLog(str(tmp_path), "s3").restore()
+    assert messages == [user("q1"), assistant("a1")]
+    assert turn == 1
+
+
+def test_restore_skips_torn_last_line(tmp_path):
+    log = SessionLog(str(tmp_path), "s4")
+    write_turns(log, [("q1", "a1")])
+    log.close()
+    with open(log.path, "a", encoding="utf-8") as f:
+        f.write('{"op":"msg","m":{"role":"user","con')
+    restored = SessionLog(str(tmp_path), "s4")
+    messages, turn, _ = restored.restore()
+    assert messages == [user("q1"), assistant("a1")] and turn == 1
+    # 之后追加的记录不会与不完整的尾行拼接
+    write_turns(restored, [("q2", "a2")])
+    restored.close()
+    assert SessionLog(str(tmp_path), "s4").restore()[0][-1] == assistant("a2")
+
+
+def test_restore_without_completed_turn(tmp_path):
+    log = SessionLog(str(tmp_path), "s5")
+    log.append(user("q1"))
+    log.close()
+    restored = SessionLog(str(tmp_path), "s5")
+    assert restored.restore() == ([], 0, {})
+    assert restored.discarded == 1
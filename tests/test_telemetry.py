@@ -0,0 +1,26 @@
+import os
+
+from telemetry import TraceWriter
+
+
+def test_rotation_counts_bytes(tmp_path):
+    path = str(tmp_path / "trace.jsonl")
+    writer = TraceWriter(path, max_bytes=1000, backups=2)
+    for index in range(40):
+        writer.write({"span": "exec", "turn": index, "note": "中文反馈内容" * 5})
+    writer.close()
+    assert len(writer.files()) == 3
+    assert all(os.path.getsize(file) <= 1000 for file in writer.files())
+    records = writer.read()
+    assert records[-1]["turn"] == 39 and records[-1]["note"].startswith("中文")
+
+
+def test_reopen_appends_to_existing_file(tmp_path):
+    path = str(tmp_path / "trace.jsonl")
+    writer = TraceWriter(path, max_bytes=10000)
+    writer.write({"span": "turn", "turn": 1})
+    writer.close()
+    writer = TraceWriter(path, max_bytes=10000)
+    writer.write({"span": "turn", "turn": 2})
+    assert [record["turn"] for record in writer.read()] == [1, 2]
+    writer.close()
@@ -0,0 +1,39 @@
+import json
+
+from tool_calls import invalid_call_message, to_block
+
+
+def block(name, arguments):
+    return to_block(0, "call_0", name, json.dumps(arguments))
+
+
+def test_valid_call():
+    result = block("memory", {"action": "add", "content": "用户偏好简洁", "ltm": True})
+    assert result.arguments["action"] == "add"
+    assert result.code == 'memory "用户偏好简洁" --ltm'
+
+
+def test_enum_values_are_validated():
+    result = block("memory", {"action": "delete", "content": "x"})
+    assert result.arguments is None
+    message = invalid_call_message(result)
+    assert message.startswith("错误: ") and "add/search" in message
+    assert block("toolkit", {"action": "remove"}).arguments is None
+    assert block("toolkit", {"action": "info", "skill": "pdf"}).arguments is not None
+
+
+def test_missing_field_and_bad_json():
+    assert block("todo", {}).arguments is None
+    bad = to_block(0, "call_0", "bash", "{not json")
+    assert bad.arguments is None and bad.code == "{not json"
+
+
+def test_unknown_tool():
+    result = block("rm", {"command": "x"})
+    assert result.arguments is None
+    assert "未知工具" in invalid_call_message(result)
+
+
+def test_parallel_only_for_bash():
+    assert block("bash", {"command": "ls", "parallel": True}).parallel
+    assert not block("python", {"code": "1", "parallel": True}).parallel
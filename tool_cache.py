@@ -0,0 +1,97 @@
+"""
+沙盒只读命令的结果缓存
+
+模型在多次迭代中经常重复执行同样的只读命令 (cat SKILL.md、ls、explorer.py --tree 等)，
+每次都要付出一次完整的容器内执行。缓存以 (命令文本, 工作目录, 挂载目录指纹) 为键：
+- 只缓存白名单形状的命令：exec_scheduler 判定的只读命令 (去掉 date/df 这类与时间相关的)
+  以及已知只读的技能脚本；
+- 指纹是宿主机上挂载目录 skills/ 与 alice_output/ 中所有文件的 mtime/size，宿主机或其它会话
+  改动了文件即自然失效 (alice_output/exec_logs 下是执行日志本身，不计入指纹，涉及它的命令也不缓存)；
+- 任何可能修改容器状态的代码块 (python 代码块、非只读命令) 执行前后都会清空缓存；
+- 只缓存退出码为 0 的结果，按最近使用淘汰。
+命中的结果带有醒目前缀，模型可以知道这是复用的结果。
+"""
+import os
+import re
+import time
+from collections import OrderedDict
+from exec_scheduler import is_read_only_command
+
+CACHE_HIT_PREFIX = "[缓存命中]"
+# 输出与时间或容器外部状态相关的只读命令
+VOLATILE_COMMANDS = re.compile(r'(^|[;&|\s])(date|df|uptime|free|ps|top)(\s|$)')
+TIME_RELATIVE_FIND = re.compile(r'\s-(mmin|mtime|amin|atime|cmin|ctime|newer)\b')
+# 已知只读的技能脚本
+CACHEABLE_SCRIPTS = [
+    re.compile(r'^python3?\s+(/app/)?skills/file_explorer/explorer\.py(\s+(--tree|--depth\s+\d+|--search\s+[\w.\-]+|--read\s+[\w./\-]+))*\s*$'),
+]
+EXCLUDED_DIRS = {"exec_logs"}
+
+
+class ToolResultCache:
+    def __init__(self, roots, max_entries=128):
+        self.roots = roots # 宿主机上的挂载目录
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+        self._entries = OrderedDict() # 键 -> (结果, 写入时间)
+
+    @staticmethod
+    def cacheable(command):
+        command = command.strip()
+        if "exec_logs" in command:
+            return False
+        if any(pattern.match(command) for pattern in CACHEABLE_SCRIPTS):
+            return True
+        if VOLATILE_COMMANDS.search(command) or TIME_RELATIVE_FIND.search(command):
+            return False
+        return is_read_only_command(command)
+
+    def fingerprint(self):
+        """挂载目录下所有文件的 (路径, mtime, 大小)，只 stat 不读取内容"""
+        keys = []
+        stack = [root for root in self.roots if os.path.isdir(root)]
+        while stack:
+            path = stack.pop()
+            try:
+                entries = sorted(os.scandir(path), key=lambda e: e.name)
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in EXCLUDED_DIRS and entry.name != "__pycache__":
+                            stack.append(entry.path)
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                keys.append((entry.path, st.st_mtime_ns, st.st_size))
+        return hash(tuple(keys))
+
+    def key(self, command, workdir):
+        """可缓存时返回缓存键，否则返回 None"""
+        if not self.cacheable(command):
+            return None
+        return (command.strip(), workdir, self.fingerprint())
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats["hits"] += 1
+        result, stored_at = entry
+        return (f"{CACHE_HIT_PREFIX} 命令与挂载目录自 {time.monotonic() - stored_at:.0f} 秒前执行以来均未变化，"
+                f"以下为当时的结果 (未重新执行):\n{result}")
+
+    def put(self, key, result):
+        self._entries[key] = (result, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        if self._entries:
+            self._entries.clear()
+            self.stats["invalidations"] += 1
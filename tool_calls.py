@@ -0,0 +1,162 @@
+"""
+结构化工具调用 (TOOL_CALL_MODE=native)
+
+把沙盒执行 (bash / python) 与宿主机内置指令 (toolkit / memory / todo / update_prompt) 注册为
+OpenAI tools，模型直接发出结构化调用，无需在回答中书写代码块。
+- ToolCallAssembler 累积流式的 tool_calls 增量：按 OpenAI 的流式协议，某个调用之后的调用开始输出时，
+  它的参数即已完整，此时立即转为代码块交给调度器，与后续调用的生成相互重叠；其余调用在流结束时提交；
+- 每个调用转为带 call_id 的 CodeBlock，沿用围栏代码块的调度与并行规则，结果以 tool 消息回传；
+- 围栏代码块的解析仍然保留：模型在正文中写了代码块时照常执行，结果按原格式反馈。
+"""
+import json
+from fence_parser import CodeBlock
+
+SANDBOX_TOOLS = ("bash", "python")
+BUILTIN_TOOLS = ("toolkit", "memory", "todo", "update_prompt")
+
+
+def _function(name, description, properties, required):
+    return {
+        "type": "function",
+        "function": {
+            "name": name,
+            "description": description,
+            "parameters": {"type": "object", "properties": properties, "required": required},
+        },
+    }
+
+
+TOOLS = [
+    _function("bash", "在沙盒容器的工作目录中执行 Shell 命令，返回输出与退出码。", {
+        "command": {"type": "string", "description": "要执行的命令"},
+        "parallel": {"type": "boolean", "description": "只读且与同一步的其它调用互不依赖时设为 true，可并行执行"},
+    }, ["command"]),
+    _function("python", "在沙盒容器的常驻 Python 会话中执行代码 (变量与导入在调用之间保留)，返回输出。", {
+        "code": {"type": "string", "description": "要执行的 Python 代码"},
+    }, ["code"]),
+    _function("toolkit", "查询或刷新技能注册表 (在宿主机执行)。", {
+        "action": {"type": "string", "enum": ["list", "info", "refresh"]},
+        "skill": {"type": "string", "description": "action 为 info 时要查看的技能名"},
+    }, ["action"]),
+    _function("memory", "写入一条记忆或检索记忆 (在宿主机执行，请勿手动输入日期)。", {
+        "action": {"type": "string", "enum": ["add", "search"]},
+        "content": {"type": "string", "description": "add 时为要记录的内容，search 时为检索关键词"},
+        "ltm": {"type": "boolean", "description": "add 时写入长期记忆 (经验教训、用户偏好等)，默认写入短期记忆"},
+    }, ["action", "content"]),
+    _function("todo", "用新内容整体覆盖任务清单 (在宿主机执行，需包含完整的 Markdown 列表)。", {
+        "content": {"type": "string", "description": "完整的任务清单"},
+    }, ["content"]),
+    _function("update_prompt", "用新内容整体覆盖人设提示词 (在宿主机执行)，下一轮对话生效。", {
+        "content": {"type": "string", "description": "完整的新提示词"},
+    }, ["content"]),
+]
+REQUIRED = {tool["function"]["name"]: tool["function"]["parameters"]["required"] for tool in TOOLS}
+# 取值受限的字段：工具名 -> {字段: 可选值}
+ENUMS = {tool["function"]["name"]: {key: spec["enum"] for key, spec in tool["function"]["parameters"]["properties"].items()
+                                    if "enum" in spec}
+         for tool in TOOLS}
+
+
+def display_command(name, arguments):
+    """调用在终端与反馈中的等价指令写法"""
+    if name == "bash":
+        return arguments["command"]
+    if name == "python":
+        return arguments["code"]
+    if name == "toolkit":
+        return " ".join(filter(None, ["toolkit", arguments["action"], arguments.get("skill")]))
+    if name == "memory":
+        if arguments["action"] == "search":
+            return f"memory search {json.dumps(arguments['content'], ensure_ascii=False)}"
+        return f"memory {json.dumps(arguments['content'], ensure_ascii=False)}{' --ltm' if arguments.get('ltm') else ''}"
+    return f"{name} {json.dumps(arguments['content'], ensure_ascii=False)}"
+
+
+def to_block(index, call_id, name, raw_arguments):
+    """
+    把一个完整的调用转为代码块；参数不是合法的 JSON 对象、缺少必填字段、取值不在可选范围内或工具未知时，
+    arguments 为 None，code 保留原始参数文本 (执行时直接返回错误说明，不会静默停止循环)
+    """
+    try:
+        arguments = json.loads(raw_arguments or "{}")
+    except ValueError:
+        arguments = None
+    if (not isinstance(arguments, dict) or name not in REQUIRED
+            or any(not isinstance(arguments.get(key), str) for key in REQUIRED[name])
+            or any(key in arguments and arguments[key] not in values for key, values in ENUMS[name].items())):
+        return CodeBlock(index, name, raw_arguments, False, call_id, None)
+    parallel = name == "bash" and arguments.get("parallel") is True
+    return CodeBlock(index, name, display_command(name, arguments), parallel, call_id, arguments)
+
+
+def invalid_call_message(block):
+    if block.lang not in REQUIRED:
+        return f"错误: 未知工具 '{block.lang}'，可用工具: {', '.join(REQUIRED)}。"
+    enums = "".join(f"，{key} 可选值: {'/'.join(values)}" for key, values in ENUMS[block.lang].items())
+    return (f"错误: 工具 {block.lang} 的参数不是合法的 JSON 对象、缺少必填字段或取值不在可选范围内 "
+            f"(必填: {', '.join(REQUIRED[block.lang])}{enums})，未执行。收到的参数: {block.code[:200]}")
+
+
+class ToolCallAssembler:
+    """按 index 累积流式的 tool_calls 增量，调用完整后产出代码块 (按调用顺序)"""
+    def __init__(self):
+        self._calls = [] # [{"id", "name", "parts"}]
+        self._ready = 0 # 已产出代码块的调用数
+
+    def feed(self, deltas):
+        """
+        喂入一个分块中的 tool_calls 增量，返回 (新开始的调用 [(index, id, name)],
+        参数增量 [(index, 文本)], 新完整的代码块列表)
+        """
+        started, fragments = [], []
+        for delta in deltas:
+            index = delta.index if delta.index is not None else max(0, len(self._calls) - 1)
+            while len(self._calls) <= index:
+                self._calls.append({"id": None, "name": "", "parts": []})
+            call = self._calls[index]
+            function = delta.function
+            if delta.id and call["id"] is None:
+                call["id"] = delta.id
+            if function is not None and function.name:
+                call["name"] += function.name
+                started.append((index, call["id"], call["name"]))
+            if function is not None and function.arguments:
+                call["parts"].append(function.arguments)
+                fragments.append((index, function.arguments))
+        # 之后的调用已经开始，之前的调用参数即已完整
+        return started, fragments, self._take(len(self._calls) - 1)
+
+    def finish(self):
+        """流正常结束：其余调用均已完整"""
+        return self._take(len(self._calls))
+
+    def _take(self, end):
+        blocks = []
+        while self._ready < end:
+            call = self._calls[self._ready]
+            if call["id"] is None:
+                call["id"] = f"call_{self._ready}"
+            block = to_block(self._ready, call["id"], call["name"], "".join(call["parts"]))
+            call["valid"] = block.arguments is not None
+            blocks.append(block)
+            self._ready += 1
+        return blocks
+
+    @property
+    def started(self):
+        return bool(self._calls)
+
+    @property
+    def ready(self):
+        """已产出代码块的调用数"""
+        return self._ready
+
+    def arguments_text(self):
+        """已产出代码块的调用的参数原文 (用于估算输出 token 数)"""
+        return "".join("".join(call["parts"]) for call in self._calls[:self._ready])
+
+    def message_calls(self):
+        """已产出代码块的调用，用于写入 assistant 消息的 tool_calls 字段 (不合法的参数以 {} 代替，避免服务端拒绝整段历史)"""
+        return [{"id": call["id"], "type": "function",
+                 "function": {"name": call["name"], "arguments": "".join(call["parts"]) if call["valid"] else "{}"}}
+                for call in self._calls[:self._ready]]